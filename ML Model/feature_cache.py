@@ -0,0 +1,211 @@
+# feature_cache.py
+# On-disk cache of the training data, so a training run does not reload the CSV, recompute
+# every feature and redraw every plot.
+# Two levels, both under FEATURE_CACHE_DIR:
+#   rows/      url, type and the build_features() columns of every CSV row, one file per column
+#              (numeric columns as raw arrays, strings as UTF-8 bytes plus offsets). When the
+#              CSV has only grown by appended rows, features are computed for the new rows alone
+#              and appended to the column files.
+#   training/  X and y as process_data.py leaves them, saved as .npy and memory-mapped by
+#              train_model.py instead of running process_data.py at all.
+# Each level is valid for one CSV content (SHA-256) and one version of the code that produced
+# it (a hash of the source files), so changing either rebuilds it.
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+DATASET_PATH = os.environ.get('URLS_CSV_PATH', r'C:\Users\User\Desktop\cgi interview\malicious_phish.csv')
+FEATURE_CACHE_DIR = os.environ.get('FEATURE_CACHE_DIR', 'feature_cache')
+
+# Sources whose changes invalidate each level
+ROW_CODE_FILES = ['feature_engine.py']
+TRAINING_CODE_FILES = ROW_CODE_FILES + ['process_data.py', '../google_cloud_setup/root_domain_encoding.py']
+
+STRING_COLUMNS = ('url', 'type', 'pri_domain', 'root_domain')
+READ_SIZE = 1 << 20
+
+
+def code_version(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def file_digests(path, prefix_size=0):
+    # SHA-256 of the first prefix_size bytes and of the whole file, in one read
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        remaining = prefix_size
+        while remaining > 0:
+            block = f.read(min(READ_SIZE, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+        prefix = digest.hexdigest()
+        for block in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(block)
+    return prefix, digest.hexdigest()
+
+
+class ColumnStore:
+    # Append-only columns in one directory, described by meta.json. Data is written before the
+    # metadata, so bytes past what meta.json counts (an interrupted append) are ignored and
+    # cut off by the next append.
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.meta = None
+        path = os.path.join(directory, 'meta.json')
+        if os.path.exists(path):
+            with open(path) as f:
+                self.meta = json.load(f)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def reset(self, meta):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory)
+        self.meta = dict(meta, rows=0, string_bytes={})
+
+    def _write_meta(self):
+        tmp = self._path('meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f, indent=1)
+        os.replace(tmp, self._path('meta.json'))
+
+    def _append_file(self, name, size, data):
+        with open(self._path(name), 'ab') as f:
+            f.truncate(size)
+            f.write(data)
+
+    def append(self, frame, **meta):
+        rows = self.meta['rows']
+        if rows == 0:
+            self.meta['columns'] = list(frame.columns)
+            self.meta['dtypes'] = {c: 'str' if c in STRING_COLUMNS else str(frame[c].dtype) for c in frame.columns}
+        for column in self.meta['columns']:
+            dtype = self.meta['dtypes'][column]
+            if dtype != 'str':
+                values = np.ascontiguousarray(frame[column].to_numpy(), dtype=dtype)
+                self._append_file(column + '.bin', rows * values.itemsize, values.tobytes())
+                continue
+            # Strings: UTF-8 bytes, end offsets and a missing-value mask (pri_domain can be missing)
+            values = list(frame[column])
+            missing = pd.isna(frame[column]).to_numpy(dtype=bool)
+            encoded = [b'' if none else str(value).encode('utf-8', 'surrogatepass')
+                       for value, none in zip(values, missing)]
+            start = self.meta['string_bytes'].get(column, 0)
+            ends = start + np.cumsum([len(value) for value in encoded], dtype=np.int64)
+            self._append_file(column + '.str', start, b''.join(encoded))
+            self._append_file(column + '.end', rows * 8, ends.tobytes())
+            self._append_file(column + '.none', rows, missing.tobytes())
+            self.meta['string_bytes'][column] = int(ends[-1]) if len(ends) else start
+        self.meta.update(meta, rows=rows + len(frame))
+        self._write_meta()
+
+    def load(self, index=None):
+        # Numeric columns are memory-mapped; strings are decoded into Python objects
+        rows = self.meta['rows']
+        data = {}
+        for column in self.meta['columns']:
+            dtype = self.meta['dtypes'][column]
+            if rows == 0:
+                data[column] = np.empty(0, dtype=object if dtype == 'str' else dtype)
+            elif dtype != 'str':
+                data[column] = np.memmap(self._path(column + '.bin'), dtype=dtype, mode='r', shape=(rows,))
+            else:
+                ends = np.memmap(self._path(column + '.end'), dtype=np.int64, mode='r', shape=(rows,))
+                missing = np.memmap(self._path(column + '.none'), dtype=bool, mode='r', shape=(rows,))
+                with open(self._path(column + '.str'), 'rb') as f:
+                    raw = f.read(int(ends[-1]))
+                starts = np.concatenate(([0], ends[:-1]))
+                data[column] = [np.nan if none else raw[s:e].decode('utf-8', 'surrogatepass')
+                                for s, e, none in zip(starts.tolist(), ends.tolist(), missing.tolist())]
+        return pd.DataFrame(data, index=index)
+
+
+def _read_csv_tail(csv_path, offset):
+    # Rows after the first `offset` bytes, with the column names of the header
+    header = list(pd.read_csv(csv_path, nrows=0).columns)
+    with open(csv_path, 'rb') as f:
+        f.seek(offset)
+        if not f.read(1):
+            return pd.DataFrame(columns=header)
+        f.seek(offset)
+        return pd.read_csv(f, header=None, names=header)
+
+
+def load_row_features(csv_path=DATASET_PATH, cache_dir=FEATURE_CACHE_DIR):
+    # The CSV joined with build_features() for every row, computing features only for rows
+    # that are not cached yet
+    from feature_engine import build_features
+
+    store = ColumnStore(os.path.join(cache_dir, 'rows'))
+    version = code_version(ROW_CODE_FILES)
+    size = os.path.getsize(csv_path)
+    meta = store.meta
+    cached_size = meta['csv_size'] if meta and meta.get('version') == version and meta['csv_size'] <= size else 0
+    prefix, digest = file_digests(csv_path, cached_size)
+
+    if cached_size and meta['csv_sha256'] == digest:
+        print(f"Features of {meta['rows']} rows loaded from {store.directory}")
+        return store.load()
+    if cached_size and meta['csv_sha256'] == prefix and meta['ends_with_newline']:
+        new_rows = _read_csv_tail(csv_path, cached_size)
+        print(f"{csv_path} grew by {len(new_rows)} rows; computing features for those only")
+    else:
+        store.reset({'version': version})
+        new_rows = pd.read_csv(csv_path)
+
+    if len(new_rows):
+        new_rows.index = pd.RangeIndex(store.meta['rows'], store.meta['rows'] + len(new_rows))
+        features, _ = build_features(new_rows['url'])
+        new_rows = new_rows.join(features)
+    with open(csv_path, 'rb') as f:
+        f.seek(max(size - 1, 0))
+        ends_with_newline = f.read(1) in (b'\n', b'')
+    store.append(new_rows, csv_size=size, csv_sha256=digest, ends_with_newline=ends_with_newline)
+    return store.load()
+
+
+def _training_key(csv_path, code_files):
+    return {'version': code_version(code_files), 'csv_sha256': file_digests(csv_path)[1]}
+
+
+def save_training_matrix(X, y, csv_path=DATASET_PATH, cache_dir=FEATURE_CACHE_DIR, code_files=TRAINING_CODE_FILES):
+    directory = os.path.join(cache_dir, 'training')
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    np.save(os.path.join(directory, 'X.npy'), X.to_numpy())
+    np.save(os.path.join(directory, 'y.npy'), y.to_numpy())
+    np.save(os.path.join(directory, 'index.npy'), X.index.to_numpy())
+    meta = dict(_training_key(csv_path, code_files), columns=list(X.columns), target=y.name)
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+
+
+def load_training_matrix(csv_path=DATASET_PATH, cache_dir=FEATURE_CACHE_DIR, code_files=TRAINING_CODE_FILES):
+    # (X, y) memory-mapped from the cache, or None when it is missing or stale
+    directory = os.path.join(cache_dir, 'training')
+    try:
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    if not os.path.exists(csv_path) or any(meta[k] != v for k, v in _training_key(csv_path, code_files).items()):
+        return None
+    index = pd.Index(np.load(os.path.join(directory, 'index.npy')))
+    X = pd.DataFrame(np.load(os.path.join(directory, 'X.npy'), mmap_mode='r'), index=index,
+                     columns=meta['columns'], copy=False)
+    y = pd.Series(np.load(os.path.join(directory, 'y.npy'), mmap_mode='r'), index=index, name=meta['target'],
+                  copy=False)
+    print(f"Training data ({X.shape[0]} rows, {X.shape[1]} features) memory-mapped from {directory}")
+    return X, y
@@ -0,0 +1,275 @@
+# feature_engine.py
+# Columnar replacement for the per-row `urls_data['url'].apply(...)` calls in process_data.py.
+# URLs are split into row chunks and each chunk is processed in a worker process: the
+# character counts come from NumPy over the UTF-32 code points of the whole chunk, the URL is
+# parsed once per row, and the few features that need tld/tldextract/re keep their per-row code.
+# The columns, their order and their values are the same as the apply() version.
+import re
+import time
+import ipaddress
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+import tldextract
+from tld import get_tld
+
+# Column order of process_data.py; later steps (correlation pruning) depend on it
+FEATURE_COLUMNS = [
+    'pri_domain', 'root_domain', 'Domain_length', 'Has_subdomain', 'URL_length',
+    'Count_dots', 'Count_dashes', 'Count_underscores', 'Count_slashes', 'Count_ques',
+    'Count_non_alphanumeric', 'Count_digits', 'Count_letters', 'Count_params',
+    'Has_php', 'Has_html', 'Has_at_symbol', 'Has_double_slash', 'abnormal_url',
+    'Has_http', 'Has_https', 'secure_http', 'Has_ipv4', 'have_ip',
+    'Age_of_Domain', 'DNS_record', 'PageRank', 'Google_Index', 'Iframe', 'Redirect',
+    'Pop_up_window', 'Favicon', 'HTTPS_token',
+]
+
+PLACEHOLDER_COLUMNS = ['Age_of_Domain', 'DNS_record', 'PageRank', 'Google_Index', 'Iframe',
+                       'Redirect', 'Pop_up_window', 'Favicon']
+
+COUNTED_CHARS = {'Count_dots': '.', 'Count_dashes': '-', 'Count_underscores': '_',
+                 'Count_slashes': '/', 'Count_ques': '?'}
+
+IPV4_PATTERN = re.compile(r'(\d{1,3}\.){3}\d{1,3}')
+# A netloc with one of these is not matched literally by abnormal_url's re.search
+REGEX_SPECIAL = re.compile(r'[\^$*+{}\[\]\\|()]')
+
+# Character classes of the ASCII range; other code points are classified per chunk
+ASCII_DIGIT = np.array([chr(c).isdigit() for c in range(128)])
+ASCII_ALPHA = np.array([chr(c).isalpha() for c in range(128)])
+ASCII_ALNUM = np.array([chr(c).isalnum() for c in range(128)])
+
+
+# Same helpers as define_functions.py, for the features that stay per-row
+def extract_pri_domain(url):
+    try:
+        res = get_tld(url, as_object=True, fail_silently=False, fix_protocol=True)
+        pri_domain = res.parsed_url.netloc
+    except Exception:
+        pri_domain = None
+    return pri_domain
+
+
+def extract_root_domain(url):
+    extracted = tldextract.extract(url)
+    return f"{extracted.domain}.{extracted.suffix}"
+
+
+def abnormal_url(url, netloc):
+    if netloc:
+        match = re.search(str(netloc), url)
+        if match:
+            return 1
+    return 0
+
+
+def have_ip_address(hostname):
+    try:
+        if hostname:
+            ip = ipaddress.ip_address(hostname)
+            return isinstance(ip, (ipaddress.IPv4Address, ipaddress.IPv6Address))
+    except ValueError:
+        pass
+    return 0
+
+
+def _segment_sums(mask, starts, ends):
+    # Per-URL sums of a boolean mask over the concatenated code points
+    cumulative = np.concatenate(([0], np.cumsum(mask, dtype=np.int64)))
+    return cumulative[ends] - cumulative[starts]
+
+
+def _domain_features(urls):
+    # Through a Series like the apply() version, so missing domains become str() of the same value
+    pri_domain = pd.Series([extract_pri_domain(str(url)) for url in urls])
+    root_domain = [extract_root_domain(str(domain)) for domain in pri_domain]
+    return {'pri_domain': list(pri_domain), 'root_domain': root_domain}
+
+
+def _parse_features(urls):
+    domain_length = np.empty(len(urls), dtype=np.int64)
+    has_subdomain = np.empty(len(urls), dtype=np.int64)
+    count_params = np.empty(len(urls), dtype=np.int64)
+    has_http = np.empty(len(urls), dtype=np.int64)
+    has_https = np.empty(len(urls), dtype=np.int64)
+    abnormal = np.empty(len(urls), dtype=np.int64)
+    have_ip = np.empty(len(urls), dtype=np.int64)
+    for i, url in enumerate(urls):
+        parsed = urlparse(url)
+        netloc = parsed.netloc
+        domain_length[i] = len(netloc)
+        has_subdomain[i] = netloc.count('.') > 1
+        count_params[i] = parsed.query.count('&') + 1
+        has_http[i] = parsed.scheme == 'http'
+        has_https[i] = parsed.scheme == 'https'
+        if REGEX_SPECIAL.search(netloc) or netloc not in url:
+            abnormal[i] = abnormal_url(url, netloc)
+        else:
+            abnormal[i] = 1 if netloc else 0
+        hostname = parsed.hostname
+        # Only strings that could be an IP literal are handed to ipaddress
+        if hostname and (hostname[-1].isdigit() or ':' in hostname):
+            have_ip[i] = have_ip_address(hostname)
+        else:
+            have_ip[i] = 0
+    return {
+        'Domain_length': domain_length, 'Has_subdomain': has_subdomain, 'Count_params': count_params,
+        'abnormal_url': abnormal, 'Has_http': has_http, 'Has_https': has_https,
+        'secure_http': has_https, 'have_ip': have_ip, 'HTTPS_token': has_https,
+    }
+
+
+def _char_features(urls):
+    lengths = np.fromiter((len(url) for url in urls), dtype=np.int64, count=len(urls))
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    codes = np.frombuffer(''.join(urls).encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+
+    columns = {'URL_length': lengths}
+    for column, char in COUNTED_CHARS.items():
+        columns[column] = _segment_sums(codes == ord(char), starts, ends)
+
+    # ASCII classes come from the lookup tables; the rare non-ASCII code points use str methods
+    ascii_codes = np.minimum(codes, 127)
+    is_digit = ASCII_DIGIT[ascii_codes]
+    is_alpha = ASCII_ALPHA[ascii_codes]
+    is_alnum = ASCII_ALNUM[ascii_codes]
+    non_ascii = codes > 127
+    if non_ascii.any():
+        unique, inverse = np.unique(codes[non_ascii], return_inverse=True)
+        characters = [chr(c) for c in unique]
+        is_digit[non_ascii] = np.array([c.isdigit() for c in characters])[inverse]
+        is_alpha[non_ascii] = np.array([c.isalpha() for c in characters])[inverse]
+        is_alnum[non_ascii] = np.array([c.isalnum() for c in characters])[inverse]
+    columns['Count_non_alphanumeric'] = _segment_sums(~is_alnum, starts, ends)
+    columns['Count_digits'] = _segment_sums(is_digit, starts, ends)
+    columns['Count_letters'] = _segment_sums(is_alpha, starts, ends)
+    return columns
+
+
+def _substring_features(urls):
+    return {
+        'Has_php': np.fromiter(('php' in url for url in urls), dtype=np.int64, count=len(urls)),
+        'Has_html': np.fromiter(('html' in url for url in urls), dtype=np.int64, count=len(urls)),
+        'Has_at_symbol': np.fromiter(('@' in url for url in urls), dtype=np.int64, count=len(urls)),
+        'Has_double_slash': np.fromiter(('//' in url for url in urls), dtype=np.int64, count=len(urls)),
+        'Has_ipv4': np.fromiter((IPV4_PATTERN.search(url) is not None for url in urls),
+                                dtype=np.int64, count=len(urls)),
+    }
+
+
+def _placeholder_features(urls):
+    zeros = np.zeros(len(urls), dtype=np.int64)
+    return {column: zeros for column in PLACEHOLDER_COLUMNS}
+
+
+FEATURE_GROUPS = {
+    'domain': _domain_features,
+    'parse': _parse_features,
+    'chars': _char_features,
+    'substrings': _substring_features,
+    'placeholders': _placeholder_features,
+}
+
+
+def _compute_chunk(urls):
+    columns = {}
+    timings = {}
+    for group, compute in FEATURE_GROUPS.items():
+        start = time.perf_counter()
+        columns.update(compute(urls))
+        timings[group] = time.perf_counter() - start
+    return columns, timings
+
+
+def _pool_context():
+    # Workers are forked so they do not re-run the exec()'d training scripts on start-up.
+    # Where fork is not available the chunks are processed in this process instead.
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return None
+
+
+def build_features(urls, n_jobs=None, chunk_size=50000, report=True):
+    index = urls.index if isinstance(urls, pd.Series) else pd.RangeIndex(len(urls))
+    urls = list(urls)
+    chunks = [urls[i:i + chunk_size] for i in range(0, len(urls), chunk_size)]
+
+    # Load the public suffix data once so forked workers inherit it
+    extract_root_domain('example.com')
+
+    start = time.perf_counter()
+    context = _pool_context()
+    n_jobs = n_jobs or multiprocessing.cpu_count()
+    if context is None or n_jobs == 1 or len(chunks) <= 1:
+        results = [_compute_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=context) as pool:
+            results = list(pool.map(_compute_chunk, chunks))
+    wall_time = time.perf_counter() - start
+
+    features = pd.DataFrame(index=index)
+    for column in FEATURE_COLUMNS:
+        parts = [columns[column] for columns, _ in results]
+        if column in ('pri_domain', 'root_domain'):
+            features[column] = [value for part in parts for value in part]
+        else:
+            features[column] = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    timings = {group: sum(chunk_timings[group] for _, chunk_timings in results) for group in FEATURE_GROUPS}
+    if report:
+        print(f"\nFeature computation: {len(urls)} URLs, {len(chunks)} chunks, {wall_time:.2f}s wall time")
+        for group, seconds in timings.items():
+            print(f"  {group:<13} {seconds:8.2f}s (summed over workers)")
+    return features, timings
+
+
+def compare_with_apply(urls, chunk_size=50000):
+    # Reference: the per-row apply() calls of process_data.py, with the original helpers
+    namespace = {}
+    exec(open('define_functions.py').read(), namespace)
+    reference = pd.DataFrame(index=urls.index)
+    reference['pri_domain'] = urls.apply(lambda x: namespace['extract_pri_domain'](str(x)))
+    reference['root_domain'] = reference['pri_domain'].apply(lambda x: namespace['extract_root_domain'](str(x)))
+    reference['Domain_length'] = urls.apply(namespace['get_domain_length'])
+    reference['Has_subdomain'] = urls.apply(namespace['has_subdomain'])
+    reference['URL_length'] = urls.apply(namespace['get_url_length'])
+    for column, char in COUNTED_CHARS.items():
+        reference[column] = urls.apply(lambda x: namespace['count_chars'](x, char))
+    reference['Count_non_alphanumeric'] = urls.apply(namespace['count_non_alphanumeric'])
+    reference['Count_digits'] = urls.apply(namespace['count_digits'])
+    reference['Count_letters'] = urls.apply(namespace['count_letters'])
+    reference['Count_params'] = urls.apply(namespace['count_params'])
+    reference['Has_php'] = urls.apply(namespace['has_php'])
+    reference['Has_html'] = urls.apply(namespace['has_html'])
+    reference['Has_at_symbol'] = urls.apply(namespace['has_at_symbol'])
+    reference['Has_double_slash'] = urls.apply(namespace['has_double_slash'])
+    reference['abnormal_url'] = urls.apply(namespace['abnormal_url'])
+    reference['Has_http'] = urls.apply(namespace['has_http'])
+    reference['Has_https'] = urls.apply(namespace['has_https'])
+    reference['secure_http'] = urls.apply(namespace['secure_http'])
+    reference['Has_ipv4'] = urls.apply(namespace['has_ipv4'])
+    reference['have_ip'] = urls.apply(namespace['have_ip_address']).astype(int)
+    for column in PLACEHOLDER_COLUMNS:
+        reference[column] = urls.apply(namespace['dummy_function'])
+    reference['HTTPS_token'] = urls.apply(namespace['has_https'])
+
+    features, _ = build_features(urls, chunk_size=chunk_size)
+    mismatched = [column for column in FEATURE_COLUMNS
+                  if not reference[column].astype(object).equals(features[column].astype(object))]
+    return list(reference.columns) == list(features.columns) and not mismatched, mismatched
+
+
+if __name__ == '__main__':
+    import sys
+    # python feature_engine.py malicious_phish.csv [rows [chunk_size]]
+    urls_data = pd.read_csv(sys.argv[1])
+    if len(sys.argv) > 2:
+        urls_data = urls_data.head(int(sys.argv[2]))
+    chunk_size = int(sys.argv[3]) if len(sys.argv) > 3 else 50000
+    identical, mismatched = compare_with_apply(urls_data['url'], chunk_size)
+    print("Identical to the apply() features" if identical else f"Mismatched columns: {mismatched}")
+    sys.exit(0 if identical else 1)
@@ -0,0 +1,216 @@
+# halving_search.py
+# Budgeted replacement for the GridSearchCV step of train_model.py.
+# Every candidate of the grid is first trained on a small share of the rows with a small
+# number of trees; the best 1/eta of them move up to eta times more rows and trees, and so on
+# until the last survivors are trained on all training rows with the full n_estimators. Each
+# fit stops early on a fixed validation split and is scored by its accuracy there.
+# The quantile bins of the features are computed once, on all training rows; the row subsets
+# of every rung reuse them, and each rung's binned matrix is shared by all its candidates.
+# Results are checkpointed after every fit, so an interrupted search resumes where it stopped.
+import json
+import math
+import os
+import random
+import time
+from itertools import product
+
+import numpy as np
+import xgboost as xgb
+from xgboost import XGBClassifier
+
+CHECKPOINT_VERSION = 1
+
+
+def grid_candidates(param_grid):
+    names = sorted(param_grid)
+    return [dict(zip(names, values)) for values in product(*(param_grid[name] for name in names))]
+
+
+def candidate_key(params):
+    return json.dumps(params, sort_keys=True)
+
+
+def plan_rungs(n_candidates, eta):
+    # (candidates, share of rows and trees) per rung; the last rung uses everything
+    last = max(int(math.log(n_candidates, eta) + 1e-9), 0)
+    return [(math.ceil(n_candidates / eta ** r), eta ** (r - last)) for r in range(last + 1)]
+
+
+def planned_cost(rungs):
+    # In full fits: a fit's cost grows with both its rows and its trees
+    return sum(n * share * share for n, share in rungs)
+
+
+class SuccessiveHalvingSearch:
+    def __init__(self, param_grid, budget_seconds=None, budget_fits=None, eta=3, validation_size=0.2,
+                 min_rows=5000, min_estimators=25, checkpoint_path='halving_search.json', random_state=42,
+                 n_jobs=-1):
+        self.param_grid = param_grid
+        self.budget_seconds = budget_seconds
+        self.budget_fits = budget_fits
+        self.eta = eta
+        self.validation_size = validation_size
+        self.min_rows = min_rows
+        self.min_estimators = min_estimators
+        self.checkpoint_path = checkpoint_path
+        self.random_state = random_state
+        self.n_jobs = n_jobs
+        self.results_ = []
+        self.rung_times_ = []
+
+    # Setup
+
+    def _candidates(self):
+        candidates = grid_candidates(self.param_grid)
+        if self.budget_fits:
+            # Fewer candidates (a random sample of the grid) until the planned cost fits the budget
+            random.Random(self.random_state).shuffle(candidates)
+            while len(candidates) > 1 and planned_cost(plan_rungs(len(candidates), self.eta)) > self.budget_fits:
+                candidates.pop()
+        return candidates
+
+    def _split(self, X, y):
+        rng = np.random.default_rng(self.random_state)
+        order = rng.permutation(len(X))
+        n_valid = int(len(X) * self.validation_size)
+        return order[n_valid:], order[:n_valid]
+
+    def _signature(self, X, y):
+        return {'version': CHECKPOINT_VERSION, 'rows': len(X), 'columns': list(map(str, getattr(X, 'columns', []))),
+                'labels': int(np.asarray(y).sum()), 'grid': candidate_key(self.param_grid), 'eta': self.eta,
+                'random_state': self.random_state}
+
+    # Checkpoints
+
+    def _load_checkpoint(self, signature):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return {}
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('signature') != signature:
+            print(f"Ignoring {self.checkpoint_path}: it belongs to a different dataset or grid")
+            return {}
+        return {(r['rung'], candidate_key(r['params'])): r for r in checkpoint['results']}
+
+    def _save_checkpoint(self, signature):
+        if not self.checkpoint_path:
+            return
+        tmp = self.checkpoint_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'signature': signature, 'results': self.results_}, f, indent=1)
+        os.replace(tmp, self.checkpoint_path)
+
+    # Search
+
+    def _booster_params(self, params, num_class):
+        booster_params = {
+            'objective': 'multi:softprob', 'num_class': num_class, 'eval_metric': 'mlogloss',
+            'tree_method': 'hist', 'seed': self.random_state, 'nthread': self.n_jobs,
+            'max_depth': params.get('max_depth', 6), 'eta': params.get('learning_rate', 0.3),
+            'subsample': params.get('subsample', 1.0), 'colsample_bytree': params.get('colsample_bytree', 1.0),
+        }
+        if num_class == 2:
+            booster_params.update(objective='binary:logistic', eval_metric='logloss')
+            del booster_params['num_class']
+        return booster_params
+
+    def _fit(self, params, share, dtrain, dvalid, y_valid, num_class):
+        rounds = max(self.min_estimators, round(params.get('n_estimators', 100) * share))
+        start = time.perf_counter()
+        booster = xgb.train(self._booster_params(params, num_class), dtrain, num_boost_round=rounds,
+                            evals=[(dvalid, 'valid')], early_stopping_rounds=max(5, rounds // 10),
+                            verbose_eval=False)
+        best_iteration = booster.best_iteration
+        booster = booster[:best_iteration + 1]
+        proba = booster.predict(dvalid)
+        predicted = proba.argmax(axis=1) if proba.ndim == 2 else (proba > 0.5).astype(int)
+        score = float((predicted == y_valid).mean())
+        return booster, score, best_iteration + 1, time.perf_counter() - start
+
+    def fit(self, X, y):
+        search_start = time.perf_counter()
+        y = np.asarray(y)
+        num_class = int(y.max()) + 1
+        signature = self._signature(X, y)
+        done = self._load_checkpoint(signature)
+        if done:
+            print(f"Resuming from {self.checkpoint_path}: {len(done)} fits already done")
+        X = np.asarray(X, dtype=np.float32)
+        train_rows, valid_rows = self._split(X, y)
+
+        # Bins are built once, from all training rows; every subset and the validation rows share them
+        full = xgb.QuantileDMatrix(X[train_rows], y[train_rows], nthread=self.n_jobs)
+
+        candidates = self._candidates()
+        rungs = plan_rungs(len(candidates), self.eta)
+        print(f"Successive halving: {len(candidates)} candidates, rungs "
+              + ', '.join(f"{n} x {share:.3g}" for n, share in rungs)
+              + f", planned cost {planned_cost(rungs):.1f} full fits")
+
+        self.results_ = list(done.values())
+        self.best_ = None
+        boosters = {}
+        out_of_budget = False
+        for rung, (keep, share) in enumerate(rungs):
+            candidates = candidates[:keep]
+            rows = len(train_rows) if share >= 1 else min(len(train_rows), max(self.min_rows, int(len(train_rows) * share)))
+            dtrain = full if rows == len(train_rows) else xgb.QuantileDMatrix(
+                X[train_rows[:rows]], y[train_rows[:rows]], ref=full, nthread=self.n_jobs)
+            # Validation rows grow with the rung too; xgboost wants them binned against this rung's matrix
+            valid = valid_rows[:max(rows, self.min_rows)]
+            y_valid = y[valid]
+            dvalid = xgb.QuantileDMatrix(X[valid], y_valid, ref=dtrain, nthread=self.n_jobs)
+            rung_start = time.perf_counter()
+            scored = []
+            for params in candidates:
+                key = (rung, candidate_key(params))
+                if key not in done:
+                    if self.budget_seconds and time.perf_counter() - search_start > self.budget_seconds:
+                        out_of_budget = True
+                        break
+                    booster, score, trees, seconds = self._fit(params, share, dtrain, dvalid, y_valid, num_class)
+                    done[key] = {'rung': rung, 'params': params, 'rows': rows, 'score': score, 'trees': trees,
+                                 'seconds': seconds}
+                    self.results_.append(done[key])
+                    self._save_checkpoint(signature)
+                    if rung == len(rungs) - 1:
+                        boosters[key[1]] = booster
+                scored.append(done[key])
+            self.rung_times_.append((rung, rows, len(scored), time.perf_counter() - rung_start))
+            print(f"Rung {rung}: {len(scored)} candidates on {rows} rows, "
+                  f"best validation accuracy {max((r['score'] for r in scored), default=float('nan')):.4f}")
+            if not scored:
+                break
+            # Ties go to the cheaper candidate (fewer trees)
+            scored.sort(key=lambda r: (-r['score'], r['trees']))
+            candidates = [r['params'] for r in scored]
+            self.best_ = scored[0]
+            if out_of_budget:
+                print(f"Time budget of {self.budget_seconds}s used up in rung {rung}")
+                break
+            del dtrain, dvalid
+
+        if self.best_ is None:
+            self.best_ = {'params': candidates[0], 'rows': 0}
+        self.best_params_ = self.best_['params']
+        booster = boosters.get(candidate_key(self.best_params_))
+        if booster is None or self.best_['rows'] != len(train_rows):
+            # Budget ran out before the last rung, or the fit was restored from the checkpoint
+            y_valid = y[valid_rows]
+            dvalid = xgb.QuantileDMatrix(X[valid_rows], y_valid, ref=full, nthread=self.n_jobs)
+            booster, score, trees, seconds = self._fit(self.best_params_, 1.0, full, dvalid, y_valid, num_class)
+            self.best_ = {'rung': len(rungs) - 1, 'params': self.best_params_, 'rows': len(train_rows),
+                          'score': score, 'trees': trees, 'seconds': seconds}
+        self.best_estimator_ = XGBClassifier()
+        self.best_estimator_.load_model(booster.save_raw('json'))
+        self.seconds_ = time.perf_counter() - search_start
+        return self
+
+    def estimated_grid_seconds(self, folds=5):
+        # What GridSearchCV over the same grid would take: `folds` fits of every candidate on
+        # (folds-1)/folds of all rows, timed at this search's measured cost per row and tree
+        final = [r for r in self.results_ if r['rows'] == self.best_['rows']] or [self.best_]
+        per_row_tree = np.median([r['seconds'] / (r['rows'] * r['trees']) for r in final])
+        rows = self.best_['rows'] / (1 - self.validation_size) * (folds - 1) / folds
+        return sum(folds * per_row_tree * rows * params.get('n_estimators', 100)
+                   for params in grid_candidates(self.param_grid))
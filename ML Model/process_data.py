@@ -1,52 +1,11 @@
 # process_data.py
 exec(open('define_functions.py').read())
 
-# Load dataset
-urls_data = pd.read_csv(r'C:\Users\User\Desktop\cgi interview\malicious_phish.csv')
-
-# Apply functions to extract features
-# Domain-based Features
-urls_data['pri_domain'] = urls_data['url'].apply(lambda x: extract_pri_domain(str(x)))
-urls_data['root_domain'] = urls_data['pri_domain'].apply(lambda x: extract_root_domain(str(x)))
-urls_data['Domain_length'] = urls_data['url'].apply(get_domain_length)
-urls_data['Has_subdomain'] = urls_data['url'].apply(has_subdomain)
-
-# URL-based Features
-urls_data['URL_length'] = urls_data['url'].apply(get_url_length)
-urls_data['Count_dots'] = urls_data['url'].apply(lambda x: count_chars(x, '.'))
-urls_data['Count_dashes'] = urls_data['url'].apply(lambda x: count_chars(x, '-'))
-urls_data['Count_underscores'] = urls_data['url'].apply(lambda x: count_chars(x, '_'))
-urls_data['Count_slashes'] = urls_data['url'].apply(lambda x: count_chars(x, '/'))
-urls_data['Count_ques'] = urls_data['url'].apply(lambda x: count_chars(x, '?'))
-urls_data['Count_non_alphanumeric'] = urls_data['url'].apply(count_non_alphanumeric)
-urls_data['Count_digits'] = urls_data['url'].apply(count_digits)
-urls_data['Count_letters'] = urls_data['url'].apply(count_letters)
-urls_data['Count_params'] = urls_data['url'].apply(count_params)
-urls_data['Has_php'] = urls_data['url'].apply(has_php)
-urls_data['Has_html'] = urls_data['url'].apply(has_html)
-urls_data['Has_at_symbol'] = urls_data['url'].apply(has_at_symbol)
-urls_data['Has_double_slash'] = urls_data['url'].apply(has_double_slash)
-urls_data['abnormal_url'] = urls_data['url'].apply(lambda x: abnormal_url(x))
-
-# Protocol-based Features
-urls_data['Has_http'] = urls_data['url'].apply(has_http)
-urls_data['Has_https'] = urls_data['url'].apply(has_https)
-urls_data['secure_http'] = urls_data['url'].apply(lambda x: secure_http(x))
-
-# IP-based Features
-urls_data['Has_ipv4'] = urls_data['url'].apply(has_ipv4)
-urls_data['have_ip'] = urls_data['url'].apply(lambda x: have_ip_address(x))
-
-# HTML-based Features (Dummy placeholders for now)
-urls_data['Age_of_Domain'] = urls_data['url'].apply(dummy_function)
-urls_data['DNS_record'] = urls_data['url'].apply(dummy_function)
-urls_data['PageRank'] = urls_data['url'].apply(dummy_function)
-urls_data['Google_Index'] = urls_data['url'].apply(dummy_function)
-urls_data['Iframe'] = urls_data['url'].apply(dummy_function)
-urls_data['Redirect'] = urls_data['url'].apply(dummy_function)
-urls_data['Pop_up_window'] = urls_data['url'].apply(dummy_function)
-urls_data['Favicon'] = urls_data['url'].apply(dummy_function)
-urls_data['HTTPS_token'] = urls_data['url'].apply(has_https)  # Reuse HTTPS check
+# Load dataset with its features: extracted in bulk, split across worker processes by row chunk
+# (same columns and values as applying the functions above row by row), and cached in
+# feature_cache/ so only rows appended to the CSV since the last run are computed again
+from feature_cache import DATASET_PATH, load_row_features, save_training_matrix
+urls_data = load_row_features(DATASET_PATH)
 
 # Display the DataFrame with the new features
 print(tabulate(urls_data.head(), headers='keys', tablefmt='psql'))
@@ -87,10 +46,10 @@ fig.show()
 # Encoding and Labeling
 le = LabelEncoder()
 
-# Define a function to hash encode the root_domain
-def hash_encode(category):
-    hash_object = hashlib.md5(category.encode())
-    return int(hash_object.hexdigest(), 16) % (10 ** 8)
+# Hash encode the root_domain with the encoder the Flask service uses (MD5 modulo 10**8)
+import sys
+sys.path.insert(0, '../google_cloud_setup')
+from root_domain_encoding import encode_root_domain as hash_encode
 
 # Display the value counts of the root_domain column
 print("\nValue counts of 'root_domain' before filtering:")
@@ -188,3 +147,5 @@ print(tabulate(data.head(), headers='keys', tablefmt='psql'))
 X = data
 y = urls_data_reduced['type']
 
+# Cache X and y for train_model.py, which memory-maps them on later runs instead of running this script
+save_training_matrix(X, y, DATASET_PATH)
@@ -0,0 +1,315 @@
+# stream_train.py
+# Out-of-core version of process_data.py + train_model.py, for URL corpora larger than memory.
+#   python stream_train.py feed.csv [--chunk-size 200000] [--jobs N] [--work-dir stream_work]
+# The CSV is read in chunks and each chunk is featurized in a worker process (the columns and
+# values of feature_engine.build_features, with root_domain hashed as process_data.py does).
+# The main process only keeps running statistics and a set of 64-bit row fingerprints:
+#   - duplicate rows (same url and type) are dropped with FingerprintSet, sorted uint64 runs
+#     merged as they grow, about 8 bytes per unique row;
+#   - means and co-moments of every column are merged chunk by chunk, giving the correlation
+#     matrix and the constant columns that process_data.py drops, without holding the rows;
+#   - featurized rows are spilled to float32 .npy files in --work-dir, split into train and test
+#     by a fingerprint of the URL alone (the same URL always lands on the same side, whatever
+#     its label).
+# XGBoost then reads the training files through a DataIter into an ExtMemQuantileDMatrix, which
+# keeps the binned pages on disk, so peak memory depends on the chunk size, not the corpus.
+# Peak resident memory (this process and its workers) and throughput are printed at the end.
+import argparse
+import hashlib
+import json
+import os
+import resource
+import shutil
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from xgboost import XGBClassifier
+
+from feature_engine import FEATURE_COLUMNS, FEATURE_GROUPS, _pool_context, extract_root_domain
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'google_cloud_setup'))
+from root_domain_encoding import encode_root_domain as hash_encode
+
+# Every feature except the string pri_domain; root_domain is replaced by its hash code
+NUMERIC_COLUMNS = [column for column in FEATURE_COLUMNS if column != 'pri_domain']
+CORRELATION_THRESHOLD = 0.85  # Same cut-off as process_data.py
+
+
+def fingerprints(keys):
+    return np.fromiter((int.from_bytes(hashlib.blake2b(key.encode('utf-8', 'surrogatepass'), digest_size=8).digest(),
+                                       'little') for key in keys), dtype=np.uint64, count=len(keys))
+
+
+def row_fingerprints(urls, labels):
+    # Duplicate rows: same url and type
+    return fingerprints([f"{url}\n{label}" for url, label in zip(urls, labels)])
+
+
+class FingerprintSet:
+    # Set of uint64 keys kept as a few sorted arrays of growing size; a new run is merged into
+    # the previous one while it is at least half as big, so there are O(log n) runs to search
+
+    def __init__(self):
+        self.runs = []
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs)
+
+    def add_new(self, keys):
+        # Mask of the keys not seen before (first occurrence within `keys` counts as new); adds them
+        unique, first = np.unique(keys, return_index=True)
+        fresh = np.ones(len(unique), dtype=bool)
+        for run in self.runs:
+            positions = np.minimum(run.searchsorted(unique), len(run) - 1)
+            fresh &= run[positions] != unique
+        mask = np.zeros(len(keys), dtype=bool)
+        mask[first[fresh]] = True
+        run = unique[fresh]
+        while self.runs and len(self.runs[-1]) <= 2 * len(run):
+            run = np.union1d(self.runs.pop(), run)
+        if len(run):
+            self.runs.append(run)
+        return mask
+
+
+class RunningMoments:
+    # Count, mean and co-moment matrix, merged with the parallel update of Chan et al.
+
+    def __init__(self, width):
+        self.n = 0
+        self.mean = np.zeros(width)
+        self.comoment = np.zeros((width, width))
+        self.minimum = np.full(width, np.inf)
+        self.maximum = np.full(width, -np.inf)
+
+    @staticmethod
+    def of(X):
+        moments = RunningMoments(X.shape[1])
+        if len(X):
+            X = X.astype(np.float64)
+            moments.n = len(X)
+            moments.mean = X.mean(axis=0)
+            centered = X - moments.mean
+            moments.comoment = centered.T @ centered
+            moments.minimum, moments.maximum = X.min(axis=0), X.max(axis=0)
+        return moments
+
+    def merge(self, other):
+        n = self.n + other.n
+        if other.n:
+            delta = other.mean - self.mean
+            self.comoment += other.comoment + np.outer(delta, delta) * (self.n * other.n / n)
+            self.mean += delta * (other.n / n)
+            self.minimum = np.minimum(self.minimum, other.minimum)
+            self.maximum = np.maximum(self.maximum, other.maximum)
+            self.n = n
+
+    def correlation(self):
+        std = np.sqrt(np.diag(self.comoment))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.comoment / np.outer(std, std)
+
+
+def featurize_chunk(urls, labels):
+    # Worker: feature rows (NUMERIC_COLUMNS order) of the rows process_data.py keeps, with
+    # their labels, row fingerprints and URL fingerprints
+    urls = [str(url) for url in urls]
+    columns = {}
+    for compute in FEATURE_GROUPS.values():
+        columns.update(compute(urls))
+    keep = np.array([root_domain != '0' for root_domain in columns['root_domain']], dtype=bool)
+    columns['root_domain'] = np.array([hash_encode(root_domain) for root_domain in columns['root_domain']])
+    X = np.column_stack([np.asarray(columns[column], dtype=np.float64) for column in NUMERIC_COLUMNS])[keep]
+    labels = np.asarray(labels, dtype=object)[keep]
+    urls = np.asarray(urls, dtype=object)[keep]
+    return X, labels, row_fingerprints(urls, labels), fingerprints(urls)
+
+
+def read_chunks(csv_path, chunk_size):
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+        yield chunk['url'].tolist(), chunk['type'].tolist()
+
+
+def metrics_from_confusion(confusion):
+    # accuracy and weighted recall/precision/F1, as train_model.py computes them with sklearn
+    # (zero_division=1 for precision)
+    support = confusion.sum(axis=1)
+    predicted = confusion.sum(axis=0)
+    hits = np.diag(confusion)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        recall = np.where(support > 0, hits / support, 0.0)
+        precision = np.where(predicted > 0, hits / predicted, 1.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    weights = support / support.sum()
+    return {'accuracy': hits.sum() / confusion.sum(), 'recall': float(weights @ recall),
+            'precision': float(weights @ precision), 'f1': float(weights @ f1)}
+
+
+class SpillIterator(xgb.DataIter):
+    # Feeds the spilled training files to XGBoost one at a time
+
+    def __init__(self, paths, columns, label_codes, cache_prefix):
+        self.paths = paths
+        self.columns = columns
+        self.label_codes = label_codes
+        self._i = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self._i == len(self.paths):
+            return False
+        X_path, y_path = self.paths[self._i]
+        input_data(data=np.load(X_path, mmap_mode='r')[:, self.columns],
+                   label=self.label_codes[np.load(y_path)])
+        self._i += 1
+        return True
+
+    def reset(self):
+        self._i = 0
+
+
+def peak_memory_mib():
+    # ru_maxrss is in KiB on Linux; for children it is the largest single worker
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024)
+
+
+def featurize(args):
+    # First pass: spill deduplicated feature rows to disk and collect the statistics
+    os.makedirs(args.work_dir)
+    seen = FingerprintSet()
+    moments = RunningMoments(len(NUMERIC_COLUMNS) + 1)
+    classes = {}
+    files = {'train': [], 'test': []}
+    split_rows = {'train': 0, 'test': 0}
+    rows_read = 0
+
+    def spill(result, index):
+        X, labels, keys, url_keys = result
+        # Label codes in order of first appearance; sorted like LabelEncoder once all are known
+        codes = np.array([classes.setdefault(label, len(classes)) for label in labels], dtype=np.int32)
+        moments.merge(RunningMoments.of(np.column_stack([X, codes])))
+        fresh = seen.add_new(keys)
+        test = (url_keys % 1000) < args.test_size * 1000
+        for split, mask in (('train', fresh & ~test), ('test', fresh & test)):
+            if mask.any():
+                X_path = os.path.join(args.work_dir, f'{split}_{index:06d}_X.npy')
+                y_path = os.path.join(args.work_dir, f'{split}_{index:06d}_y.npy')
+                np.save(X_path, X[mask].astype(np.float32))
+                np.save(y_path, codes[mask])
+                files[split].append((X_path, y_path))
+                split_rows[split] += int(mask.sum())
+
+    # Chunks in flight are bounded, so a slow consumer does not queue the whole CSV in memory
+    context = _pool_context()
+    extract_root_domain('example.com')  # Load the public suffix data once, before forking
+    with ProcessPoolExecutor(max_workers=args.jobs, mp_context=context) as pool:
+        pending = deque()
+        for index, (urls, labels) in enumerate(read_chunks(args.csv, args.chunk_size)):
+            rows_read += len(urls)
+            pending.append((index, pool.submit(featurize_chunk, urls, labels)))
+            while len(pending) >= 2 * args.jobs:
+                done_index, future = pending.popleft()
+                spill(future.result(), done_index)
+        while pending:
+            done_index, future = pending.popleft()
+            spill(future.result(), done_index)
+    return files, split_rows, moments, classes, rows_read
+
+
+def select_columns(moments):
+    # process_data.py: drop constant columns, then one column of every pair correlated above
+    # the threshold (the label column takes part but is never dropped)
+    names = NUMERIC_COLUMNS + ['type']
+    varying = [i for i in range(len(names)) if moments.maximum[i] > moments.minimum[i] or names[i] == 'type']
+    correlation = moments.correlation()[np.ix_(varying, varying)]
+    dropped = set()
+    for i, row in enumerate(correlation):
+        for j, value in enumerate(row):
+            feature_1, feature_2 = names[varying[j]], names[varying[i]]
+            if abs(value) > CORRELATION_THRESHOLD and i != j and feature_1 not in dropped and feature_2 not in dropped:
+                if feature_2 != 'type':
+                    dropped.add(feature_2)
+    return [i for i in varying if names[i] not in dropped and names[i] != 'type'], sorted(dropped)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('csv')
+    parser.add_argument('--chunk-size', type=int, default=200000)
+    parser.add_argument('--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--work-dir', default='stream_work')
+    parser.add_argument('--test-size', type=float, default=0.3)
+    parser.add_argument('--n-estimators', type=int, default=300)
+    parser.add_argument('--max-depth', type=int, default=7)
+    parser.add_argument('--learning-rate', type=float, default=0.2)
+    parser.add_argument('--subsample', type=float, default=0.8)
+    parser.add_argument('--colsample-bytree', type=float, default=1.0)
+    parser.add_argument('--output', default='best_xgboost_model.joblib')
+    parser.add_argument('--keep-work-dir', action='store_true')
+    args = parser.parse_args()
+
+    shutil.rmtree(args.work_dir, ignore_errors=True)
+    start = time.perf_counter()
+    files, split_rows, moments, classes, rows_read = featurize(args)
+    feature_seconds = time.perf_counter() - start
+    rows_kept = split_rows['train'] + split_rows['test']
+    print(f"Featurized {rows_read} rows in {feature_seconds:.1f}s ({rows_read / feature_seconds:.0f} rows/s): "
+          f"{rows_kept} unique rows kept ({split_rows['train']} train, {split_rows['test']} test), "
+          f"{rows_read - rows_kept} duplicates or filtered")
+
+    columns, dropped = select_columns(moments)
+    print(f"Dropped features due to high correlation: {dropped}")
+    # LabelEncoder order: sorted class names
+    ordered = sorted(classes)
+    label_codes = np.array([ordered.index(label) for label in sorted(classes, key=classes.get)], dtype=np.int32)
+
+    start = time.perf_counter()
+    iterator = SpillIterator(files['train'], columns, label_codes, os.path.join(args.work_dir, 'xgb_cache'))
+    if hasattr(xgb, 'ExtMemQuantileDMatrix'):
+        dtrain = xgb.ExtMemQuantileDMatrix(iterator, nthread=args.jobs)
+    else:
+        dtrain = xgb.DMatrix(iterator, nthread=args.jobs)  # External memory of XGBoost 2.x (requirements.txt)
+    params = {
+        'objective': 'multi:softprob', 'num_class': len(ordered), 'eval_metric': 'mlogloss', 'tree_method': 'hist',
+        'max_depth': args.max_depth, 'eta': args.learning_rate, 'subsample': args.subsample,
+        'colsample_bytree': args.colsample_bytree, 'nthread': args.jobs, 'seed': 42,
+    }
+    booster = xgb.train(params, dtrain, num_boost_round=args.n_estimators)
+    booster.feature_names = [NUMERIC_COLUMNS[i] for i in columns]
+    train_seconds = time.perf_counter() - start
+    del dtrain, iterator  # Removes XGBoost's page cache files
+    print(f"Trained {args.n_estimators} rounds on {split_rows['train']} rows in {train_seconds:.1f}s")
+
+    model = XGBClassifier()
+    model.load_model(booster.save_raw('json'))
+    import joblib
+    joblib.dump(model, args.output)
+
+    confusion = np.zeros((len(ordered), len(ordered)), dtype=np.int64)
+    for X_path, y_path in files['test']:
+        X = np.load(X_path, mmap_mode='r')[:, columns]
+        predicted = booster.predict(xgb.DMatrix(X, feature_names=booster.feature_names)).argmax(axis=1)
+        np.add.at(confusion, (label_codes[np.load(y_path)], predicted), 1)
+    metrics = metrics_from_confusion(confusion)
+    print(f"Best parameters: {json.dumps({k: getattr(args, k) for k in ('n_estimators', 'max_depth', 'learning_rate', 'subsample', 'colsample_bytree')})}")
+    print(f"Best Test Accuracy: {metrics['accuracy']}")
+    print(f"Best Test Recall: {metrics['recall']}")
+    print(f"Best Test Precision: {metrics['precision']}")
+    print(f"Best Test F1-Score: {metrics['f1']}")
+
+    own, worker = peak_memory_mib()
+    total = feature_seconds + train_seconds
+    print(f"Peak resident memory: {own:.0f} MiB (this process), {worker:.0f} MiB (largest worker)")
+    print(f"Throughput: {rows_read / total:.0f} rows/s end to end, {total:.1f}s total")
+    if not args.keep_work_dir:
+        shutil.rmtree(args.work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
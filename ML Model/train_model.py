@@ -1,7 +1,27 @@
 
 exec(open('import_libraries.py').read())
 exec(open('define_functions.py').read())
-exec(open('process_data.py').read())
+
+# X and y come from the feature cache when it matches the dataset and the feature code;
+# otherwise process_data.py builds them (and fills the cache)
+from feature_cache import load_training_matrix
+training_data = load_training_matrix()
+if training_data is None:
+    exec(open('process_data.py').read())
+else:
+    X, y = training_data
+
+import argparse
+import time
+from halving_search import SuccessiveHalvingSearch
+
+# --search halving runs a budgeted successive-halving search instead of the full grid
+parser = argparse.ArgumentParser()
+parser.add_argument('--search', choices=['grid', 'halving'], default='grid')
+parser.add_argument('--budget-seconds', type=float, help='halving: stop starting new fits after this long')
+parser.add_argument('--budget-fits', type=float, help='halving: compute budget in full-size fits')
+parser.add_argument('--checkpoint', default='halving_search.json', help='halving: resume file')
+args, _ = parser.parse_known_args()
 
 # Assuming 'urls_data_reduced', 'X', 'y', 'X_train', 'X_test', 'y_train', 'y_test' are available from process_data.py
 
@@ -20,17 +40,27 @@ param_grid = {
     'colsample_bytree': [0.8, 1.0]
 }
 
-# Initialize the GridSearchCV object
-grid_search = GridSearchCV(estimator=xgb_model, param_grid=param_grid, cv=5, scoring='accuracy', n_jobs=-1, verbose=2)
+search_start = time.perf_counter()
+if args.search == 'halving':
+    # Successive halving over rows and n_estimators, early stopping on a validation split
+    grid_search = SuccessiveHalvingSearch(param_grid, budget_seconds=args.budget_seconds, budget_fits=args.budget_fits,
+                                          checkpoint_path=args.checkpoint)
+else:
+    # Initialize the GridSearchCV object
+    grid_search = GridSearchCV(estimator=xgb_model, param_grid=param_grid, cv=5, scoring='accuracy', n_jobs=-1, verbose=2)
 
 # Perform the grid search
 grid_search.fit(X_train, y_train)
+search_seconds = time.perf_counter() - search_start
 
 # Get the best parameters and the best model
 best_params = grid_search.best_params_
 best_xgb_model = grid_search.best_estimator_
 
 print(f"Best parameters: {best_params}")
+print(f"Search wall-clock time: {search_seconds:.0f}s")
+if args.search == 'halving':
+    print(f"Estimated GridSearchCV time for the same grid: {grid_search.estimated_grid_seconds():.0f}s")
 
 # Save the best model
 joblib.dump(best_xgb_model, 'best_xgboost_model.joblib')
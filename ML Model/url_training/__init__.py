@@ -0,0 +1,15 @@
+# url_training: the training pipeline of this directory as a package with a command line.
+#   python -m url_training all --csv malicious_phish.csv          (from ML Model/)
+# Stages run one at a time or in sequence and pass their results through files in --work-dir.
+# Each stage module imports only what it uses, and plots are made only with --plots.
+# Stage name -> its module in this package, in the order 'all' runs them
+STAGES = {
+    'ingest': 'ingest',
+    'features': 'features',
+    'select': 'select_features',  # Not select.py, which would shadow the standard library module
+    'train': 'train',
+    'compact': 'compact',
+    'cascade': 'cascade',
+    'evaluate': 'evaluate',
+    'export': 'export',
+}
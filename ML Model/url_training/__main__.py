@@ -0,0 +1,5 @@
+import sys
+
+from url_training.cli import main
+
+sys.exit(main())
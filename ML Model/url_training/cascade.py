@@ -0,0 +1,128 @@
+import time
+
+import joblib
+import numpy as np
+from sklearn.model_selection import train_test_split
+
+from cascade import CascadeModel
+from tree_ensemble import TreeEnsemble, export_model
+from url_training.common import (FIRST_STAGE_FILENAME, RANDOM_STATE, artifact, load_training_data, save_json,
+                                 served_model, split)
+
+# First stage of the two-tier classifier of google_cloud_setup/cascade.py: a few shallow trees
+# predicting benign or malicious from the same features as the full model. The uncertainty
+# band is chosen on a part of the training split the first stage was not fitted on, as the
+# one sending the fewest rows to the full model while keeping --cascade-min-agreement of its
+# verdicts. The report on the test split compares the cascade with the full model, both
+# scored as NumPy tree ensembles the way app_gc runs the exported files. The full model is the
+# one export ships (the compact stage's when it has run), and the first stage takes its columns.
+# Class 0 is benign (labels.json is sorted), as app_gc assumes.
+
+LOWS = (0.001, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2)
+HIGHS = (0.8, 0.9, 0.95, 0.98, 0.99, 0.995, 0.999)
+CALIBRATION_SIZE = 0.2
+LATENCY_ROWS = 2000
+BATCH_SIZE = 256
+
+
+def choose_band(probability, full_malicious, min_agreement):
+    # The chosen band and every candidate with the share of rows it escalates and its agreement
+    candidates = []
+    for low in LOWS:
+        for high in HIGHS:
+            escalated = (probability >= low) & (probability < high)
+            malicious = np.where(escalated, full_malicious, probability >= high)
+            candidates.append({'low': low, 'high': high, 'escalated': float(escalated.mean()),
+                               'agreement': float(np.mean(malicious == full_malicious))})
+    eligible = [c for c in candidates if c['agreement'] >= min_agreement]
+    if eligible:
+        return min(eligible, key=lambda c: (c['escalated'], -c['agreement'])), candidates
+    return max(candidates, key=lambda c: (c['agreement'], -c['escalated'])), candidates
+
+
+def row_latency(model, X):
+    # Mean seconds of a one-row call, as /predict makes them
+    start = time.perf_counter()
+    for row in X:
+        model.predict(row.reshape(1, -1))
+    return (time.perf_counter() - start) / len(X)
+
+
+def throughput(model, X):
+    # Rows per second in calls of BATCH_SIZE rows, as /predict_batch makes them
+    start = time.perf_counter()
+    for i in range(0, len(X), BATCH_SIZE):
+        model.predict(X[i:i + BATCH_SIZE])
+    return len(X) / (time.perf_counter() - start)
+
+
+def scores(model, X, malicious):
+    predicted = np.asarray(model.predict(X)) != 0
+    rows = X[:LATENCY_ROWS]
+    return predicted, {
+        'accuracy': float(np.mean(predicted == malicious)),
+        'recall': float(predicted[malicious].mean()) if malicious.any() else 1.0,
+        'row_latency_seconds': row_latency(model, rows),
+        'rows_per_second': throughput(model, X),
+    }
+
+
+def run(args):
+    from xgboost import XGBClassifier
+
+    # As arrays, like app_gc's feature rows
+    path, features = served_model(args)
+    X, y = load_training_data(args)
+    X_train, X_test, y_train, y_test = split(np.asarray(X[features], dtype=np.float32), np.asarray(y))
+    X_fit, X_calibration, y_fit, _ = train_test_split(X_train, y_train, test_size=CALIBRATION_SIZE,
+                                                      random_state=RANDOM_STATE)
+
+    start = time.perf_counter()
+    first_stage = XGBClassifier(n_estimators=args.first_stage_trees, max_depth=args.first_stage_depth,
+                                eval_metric='logloss')
+    first_stage.fit(X_fit, (y_fit != 0).astype(int))
+    fit_seconds = time.perf_counter() - start
+    joblib.dump(first_stage, artifact(args, FIRST_STAGE_FILENAME))
+
+    first = TreeEnsemble(export_model(first_stage))
+    full = TreeEnsemble(export_model(joblib.load(path)))
+    band, candidates = choose_band(first.predict_proba(X_calibration)[:, 1], full.predict(X_calibration) != 0,
+                                   args.cascade_min_agreement)
+    cascade = CascadeModel(first, full, band['low'], band['high'])
+
+    malicious = y_test != 0
+    full_malicious, full_scores = scores(full, X_test, malicious)
+    cascade_malicious, cascade_scores = scores(cascade, X_test, malicious)
+    _, uncertain = cascade.route(X_test)
+    cascade_scores.update({
+        'escalated': len(uncertain) / len(X_test),
+        'agreement': float(np.mean(cascade_malicious == full_malicious)),
+        'recall_of_full': float(cascade_malicious[full_malicious].mean()) if full_malicious.any() else 1.0,
+    })
+    report = {
+        'first_stage': {'trees': args.first_stage_trees, 'max_depth': args.first_stage_depth,
+                        'fit_seconds': fit_seconds},
+        'band': {'low': band['low'], 'high': band['high']},
+        'min_agreement': args.cascade_min_agreement,
+        'calibration': candidates,
+        'full': full_scores,
+        'cascade': cascade_scores,
+        'latency_gain': full_scores['row_latency_seconds'] / cascade_scores['row_latency_seconds'],
+        'throughput_gain': cascade_scores['rows_per_second'] / full_scores['rows_per_second'],
+    }
+    save_json(artifact(args, 'cascade.json'), report)
+
+    print(f"First stage: {args.first_stage_trees} trees of depth {args.first_stage_depth}, fitted in {fit_seconds:.1f}s")
+    print(f"Band [{band['low']}, {band['high']}): {cascade_scores['escalated']:.1%} of the test rows go to the "
+          f"full model; {cascade_scores['agreement']:.2%} of the verdicts and {cascade_scores['recall_of_full']:.2%} "
+          f"of its detections are the full model's")
+    print(f"{'':<11} {'accuracy':>9} {'recall':>9} {'us/row':>9} {'rows/s':>10}")
+    for name, result in (('full model', full_scores), ('cascade', cascade_scores)):
+        print(f"{name:<11} {result['accuracy']:9.4f} {result['recall']:9.4f} "
+              f"{result['row_latency_seconds'] * 1e6:9.1f} {result['rows_per_second']:10.0f}")
+    print(f"Latency gain {report['latency_gain']:.2f}x, throughput gain {report['throughput_gain']:.2f}x")
+    if report['latency_gain'] < 1 and report['throughput_gain'] < 1:
+        print("The cascade is slower than the full model alone here; serve without it")
+        return
+    print(f"Serve with CASCADE_FIRST_STAGE_PATH={FIRST_STAGE_FILENAME.rsplit('.', 1)[0]}.npz "
+          f"CASCADE_LOW={band['low']} CASCADE_HIGH={band['high']}")
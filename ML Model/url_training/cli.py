@@ -0,0 +1,70 @@
+import argparse
+import importlib
+import os
+import time
+
+from url_training import STAGES
+
+# Command line of the training pipeline. Stage modules are imported when their stage runs, and
+# the time spent importing and running each one is printed at the end (and saved to
+# timings.json in --work-dir).
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m url_training')
+    parser.add_argument('stages', nargs='+', choices=[*STAGES, 'all'],
+                        help="stages to run in order; 'all' runs every stage")
+    parser.add_argument('--csv', default=None, help='labelled URLs (url,type); default: URLS_CSV_PATH')
+    parser.add_argument('--work-dir', default='artifacts', help='where the stages read and write their results')
+    parser.add_argument('--cache-dir', default=None, help='row feature cache; default: FEATURE_CACHE_DIR')
+    parser.add_argument('--plots', metavar='DIR', help='save the figures as PNG files in DIR')
+    parser.add_argument('--search', choices=['grid', 'halving'], default='grid')
+    parser.add_argument('--budget-seconds', type=float)
+    parser.add_argument('--budget-fits', type=float)
+    parser.add_argument('--max-accuracy-loss', type=float, default=0.005,
+                        help='accuracy a compacted model may lose against the trained one')
+    parser.add_argument('--max-recall-loss', type=float, default=0.005,
+                        help='malicious recall a compacted model may lose against the trained one')
+    parser.add_argument('--target-latency-us', type=float, help='per-row latency a compacted model must meet')
+    parser.add_argument('--first-stage-trees', type=int, default=20, help='trees of the cascade first stage')
+    parser.add_argument('--first-stage-depth', type=int, default=3)
+    parser.add_argument('--cascade-min-agreement', type=float, default=0.995,
+                        help='share of verdicts the cascade must have in common with the full model')
+    parser.add_argument('--export-dir', default=None, help='default: <work-dir>/export')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    stages = list(STAGES) if 'all' in args.stages else args.stages
+
+    # Paths are resolved before moving to ML Model/, where the stages' relative paths point.
+    # feature_cache brings in NumPy and pandas, which every stage uses: that import is timed as
+    # its own row so the stage rows show what each stage adds.
+    start = time.perf_counter()
+    from url_training.common import ML_MODEL_DIR
+    import feature_cache
+    timings = [{'stage': 'setup', 'import_seconds': time.perf_counter() - start, 'run_seconds': 0.0}]
+    args.csv = os.path.abspath(args.csv or feature_cache.DATASET_PATH)
+    args.cache_dir = os.path.abspath(args.cache_dir or feature_cache.FEATURE_CACHE_DIR)
+    args.work_dir = os.path.abspath(args.work_dir)
+    args.export_dir = os.path.abspath(args.export_dir or os.path.join(args.work_dir, 'export'))
+    args.plots = os.path.abspath(args.plots) if args.plots else None
+    os.makedirs(args.work_dir, exist_ok=True)
+    os.chdir(ML_MODEL_DIR)
+
+    for stage in stages:
+        print(f"\n== {stage}")
+        start = time.perf_counter()
+        module = importlib.import_module(f'url_training.{STAGES[stage]}')
+        imported = time.perf_counter()
+        module.run(args)
+        timings.append({'stage': stage, 'import_seconds': imported - start,
+                        'run_seconds': time.perf_counter() - imported})
+
+    from url_training.common import artifact, save_json
+    save_json(artifact(args, 'timings.json'), timings)
+    print(f"\n{'stage':<10} {'import s':>9} {'run s':>9}")
+    for timing in timings:
+        print(f"{timing['stage']:<10} {timing['import_seconds']:9.2f} {timing['run_seconds']:9.2f}")
+    return 0
@@ -0,0 +1,65 @@
+import json
+import os
+import sys
+
+# Paths and small helpers shared by the stages. Stages run with ML Model/ as the working
+# directory (the CLI changes to it), like the scripts next to this package.
+
+ML_MODEL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GOOGLE_CLOUD_SETUP_DIR = os.path.join(os.path.dirname(ML_MODEL_DIR), 'google_cloud_setup')
+if GOOGLE_CLOUD_SETUP_DIR not in sys.path:
+    sys.path.insert(0, GOOGLE_CLOUD_SETUP_DIR)
+
+MODEL_FILENAME = 'best_xgboost_model.joblib'
+COMPACT_FILENAME = 'compact_model.joblib'
+# Feature columns of the exported model, read by google_cloud_setup/model_registry.py
+MANIFEST_FILENAME = 'best_xgboost_model.features.json'
+FIRST_STAGE_FILENAME = 'first_stage_model.joblib'
+TEST_SIZE = 0.3
+RANDOM_STATE = 42
+
+# Sources of the features and select stages: a change to any of them invalidates the cached X and y
+SELECT_CODE_FILES = [
+    'feature_engine.py',
+    os.path.join('url_training', 'features.py'),
+    os.path.join('url_training', 'select_features.py'),
+    os.path.join(GOOGLE_CLOUD_SETUP_DIR, 'root_domain_encoding.py'),
+    os.path.join(GOOGLE_CLOUD_SETUP_DIR, 'feature_extraction.py'),
+]
+
+
+def artifact(args, name):
+    return os.path.join(args.work_dir, name)
+
+
+def save_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def load_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_training_data(args):
+    # X and y written by the select stage, memory-mapped
+    from feature_cache import load_training_matrix
+    training_data = load_training_matrix(args.csv, args.work_dir, SELECT_CODE_FILES)
+    if training_data is None:
+        raise SystemExit(f"No selected features for {args.csv} in {args.work_dir}; run the select stage first")
+    return training_data
+
+
+def served_model(args):
+    # Path of the model the service gets and the names of its feature columns: the compact
+    # stage's model when it has run after the last train stage, else the trained one
+    if os.path.exists(artifact(args, COMPACT_FILENAME)):
+        return artifact(args, COMPACT_FILENAME), load_json(artifact(args, 'compact.json'))['features']
+    return artifact(args, MODEL_FILENAME), load_json(artifact(args, 'select.json'))['features']
+
+
+def split(X, y):
+    # The train/test split of train_model.py
+    from sklearn.model_selection import train_test_split
+    return train_test_split(X, y, test_size=TEST_SIZE, random_state=RANDOM_STATE)
@@ -0,0 +1,244 @@
+import json
+import os
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+from tree_ensemble import TreeEnsemble, export_model
+from url_training.common import (COMPACT_FILENAME, MODEL_FILENAME, RANDOM_STATE, artifact, load_json,
+                                 load_training_data, save_json, split)
+
+# Smaller stand-ins for the trained model, which was chosen on accuracy alone:
+#   rounds     the trained model cut after fewer boosting rounds (ROUND_FRACTIONS)
+#   features   retrained with the parameters the train stage chose (train.json) without the
+#              features of negligible importance (share of the total gain under each of
+#              IMPORTANCE_THRESHOLDS), and cut like it; a retrained model losing more than
+#              --max-accuracy-loss against the trained one is not a candidate
+#   distilled  small ensembles (DISTILLED) fitted to the trained model's predictions, on every
+#              feature set
+# Each candidate is scored on a part of the training split none of them was fitted on: the
+# verdict accuracy and malicious recall it loses against the trained model, and the per-row
+# latency of the service, which is a one-row call of its NumPy export plus, when
+# google_cloud_setup/feature_extraction.py computes its columns, extracting only those. Only
+# candidates over those columns can be served, so only they are chosen from, and the feature
+# sets searched are limited to them. The servable candidate with the fewest tree nodes within
+# --max-accuracy-loss, --max-recall-loss and --target-latency-us is saved as
+# compact_model.joblib, and its feature columns go to compact.json, from where export writes
+# them into the model's feature manifest. The trained model is a candidate too, so one always
+# qualifies when it is servable, unless the latency target is out of reach; then the fastest
+# within the losses is kept.
+
+ROUND_FRACTIONS = (0.75, 0.5, 0.33, 0.25, 0.125)
+IMPORTANCE_THRESHOLDS = (0.005, 0.01, 0.02)
+DISTILLED = ((100, 4), (50, 3))
+VALIDATION_SIZE = 0.2
+LATENCY_ROWS = 1000
+LATENCY_URLS = 1000
+# Latencies are the best of this many passes, against noise from other processes
+LATENCY_REPEAT = 3
+
+
+def tree_nodes(model):
+    trees = json.loads(model.get_booster().save_raw('json'))['learner']['gradient_booster']['model']['trees']
+    return len(trees), sum(len(tree['left_children']) for tree in trees)
+
+
+def truncate(model, rounds):
+    # The first `rounds` boosting rounds of an XGBClassifier, as an XGBClassifier
+    from xgboost import XGBClassifier
+    truncated = XGBClassifier()
+    truncated.load_model(bytearray(model.get_booster()[:rounds].save_raw('json')))
+    return truncated
+
+
+def importance_shares(model, n_features):
+    # Share of the total gain of every feature column
+    booster = model.get_booster()
+    scores = booster.get_score(importance_type='total_gain')
+    names = booster.feature_names or [f'f{i}' for i in range(n_features)]
+    gain = np.array([scores.get(name, 0.0) for name in names])
+    return gain / gain.sum()
+
+
+def retrain_params(args, trained):
+    # XGBClassifier parameters of the trained model, from the search's best parameters: a model
+    # from the halving search is rebuilt from its booster and its get_params() are all None.
+    # n_estimators is the rounds it kept (after early stopping, for the halving search).
+    path = artifact(args, 'train.json')
+    if not os.path.exists(path):
+        raise SystemExit(f"No {path}; run the train stage first")
+    return dict(load_json(path)['best_params'], n_estimators=trained.get_booster().num_boosted_rounds(),
+                eval_metric='mlogloss', random_state=RANDOM_STATE)
+
+
+def extraction_latency(urls, features):
+    # Mean seconds to extract these columns of one URL in the service, or None when it does not
+    # compute them all. Root domains are memoized by then, as for repeated hosts in the service.
+    from feature_extraction import FEATURE_NAMES, FeatureSchema, extract_features
+    if not set(features) <= set(FEATURE_NAMES):
+        return None
+    schema = FeatureSchema(features)
+
+    def extract_all():
+        for url in urls:
+            try:
+                extract_features(url, schema=schema)
+            except (AttributeError, TypeError, ValueError):
+                pass
+
+    extract_all()
+    return best_time(extract_all) / len(urls)
+
+
+def row_latency(ensemble, X):
+    def predict_rows():
+        for row in X:
+            ensemble.predict(row.reshape(1, -1))
+
+    return best_time(predict_rows) / len(X)
+
+
+def best_time(function):
+    timings = []
+    for _ in range(LATENCY_REPEAT):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(args):
+    from feature_extraction import FEATURE_NAMES
+    from xgboost import XGBClassifier
+
+    X, y = load_training_data(args)
+    names = list(X.columns)
+    X_train, X_test, y_train, y_test = split(np.asarray(X, dtype=np.float32), np.asarray(y))
+    X_fit, X_validation, y_fit, y_validation = train_test_split(X_train, y_train, test_size=VALIDATION_SIZE,
+                                                                random_state=RANDOM_STATE)
+    trained = joblib.load(artifact(args, MODEL_FILENAME))
+    teacher = TreeEnsemble(export_model(trained))
+    malicious = y_validation != 0
+    teacher_malicious = teacher.predict(X_validation) != 0
+    baseline = {'accuracy': float(np.mean(teacher_malicious == malicious)),
+                'recall': float(teacher_malicious[malicious].mean()) if malicious.any() else 1.0}
+
+    urls = pd.read_csv(args.csv, usecols=['url'], nrows=LATENCY_URLS)['url'].dropna().astype(str).tolist()
+    extraction = {}
+    candidates = []
+    models = {}
+
+    def add(name, model, columns):
+        features = [names[i] for i in columns]
+        if tuple(features) not in extraction:
+            extraction[tuple(features)] = extraction_latency(urls, features)
+        ensemble = TreeEnsemble(export_model(model))
+        predicted = ensemble.predict(X_validation[:, columns]) != 0
+        trees, nodes = tree_nodes(model)
+        accuracy = float(np.mean(predicted == malicious))
+        recall = float(predicted[malicious].mean()) if malicious.any() else 1.0
+        model_seconds = row_latency(ensemble, X_validation[:LATENCY_ROWS, columns])
+        extraction_seconds = extraction[tuple(features)]
+        candidates.append({
+            'name': name, 'features': features, 'trees': trees, 'nodes': nodes,
+            'servable': extraction_seconds is not None, 'accuracy': accuracy, 'recall': recall,
+            'accuracy_loss': baseline['accuracy'] - accuracy, 'recall_loss': baseline['recall'] - recall,
+            'model_us': model_seconds * 1e6,
+            'extraction_us': extraction_seconds * 1e6 if extraction_seconds is not None else None,
+            'latency_us': (model_seconds + (extraction_seconds or 0)) * 1e6,
+        })
+        models[name] = model
+        print(f"{name:<34} {len(features):>3} features {trees:>5} trees {nodes:>7} nodes  accuracy {accuracy:.4f}  "
+              f"recall {recall:.4f}  {candidates[-1]['latency_us']:8.1f} us/row")
+
+    def add_truncations(name, model, columns):
+        rounds = model.get_booster().num_boosted_rounds()
+        for fraction in ROUND_FRACTIONS:
+            if 1 <= int(rounds * fraction) < rounds:
+                add(f"{name}, {int(rounds * fraction)} rounds", truncate(model, int(rounds * fraction)), columns)
+
+    all_columns = list(range(len(names)))
+    add('trained', trained, all_columns)
+    add_truncations('trained', trained, all_columns)
+
+    servable_columns = [i for i in all_columns if names[i] in FEATURE_NAMES]
+    if not servable_columns:
+        raise SystemExit(f"None of the features {names} is computed by the service; run the select stage again")
+    feature_sets = [servable_columns]
+    shares = importance_shares(trained, len(names))
+    params = retrain_params(args, trained)
+    retrain = [('servable features', servable_columns)] if servable_columns != all_columns else []
+    if retrain:
+        print(f"Not servable: the trained model's features {[n for n in names if n not in FEATURE_NAMES]}")
+    for threshold in IMPORTANCE_THRESHOLDS:
+        columns = [i for i in servable_columns if shares[i] >= threshold]
+        if not columns or columns in feature_sets:
+            continue
+        feature_sets.append(columns)
+        retrain.append((f"features >= {threshold:g}", columns))
+    for name, columns in retrain:
+        retrained = XGBClassifier(**params).fit(X_fit[:, columns], y_fit)
+        predicted = TreeEnsemble(export_model(retrained)).predict(X_validation[:, columns]) != 0
+        loss = baseline['accuracy'] - float(np.mean(predicted == malicious))
+        if loss > args.max_accuracy_loss:
+            print(f"{name:<34} {len(columns):>3} features: not a candidate, loses {loss:.4f} accuracy")
+            continue
+        add(name, retrained, columns)
+        add_truncations(name, retrained, columns)
+
+    # Students learn the trained model's classes; they need every class among its predictions
+    teacher_labels = teacher.predict(X_fit)
+    if set(np.unique(teacher_labels)) == set(np.unique(y_fit)):
+        for columns in feature_sets:
+            for trees, depth in DISTILLED:
+                student = XGBClassifier(n_estimators=trees, max_depth=depth, eval_metric='mlogloss')
+                student.fit(X_fit[:, columns], teacher_labels)
+                add(f"distilled {trees}x{depth}, {len(columns)} features", student, columns)
+    else:
+        print("Not distilling: the trained model never predicts some classes")
+
+    within = [c for c in candidates if c['servable']
+              and c['accuracy_loss'] <= args.max_accuracy_loss and c['recall_loss'] <= args.max_recall_loss]
+    fast = [c for c in within if args.target_latency_us is None or c['latency_us'] <= args.target_latency_us]
+    if not within:
+        raise SystemExit("No servable candidate within the losses; raise --max-accuracy-loss or --max-recall-loss")
+    if fast:
+        chosen = min(fast, key=lambda c: (c['nodes'], c['latency_us']))
+    else:
+        chosen = min(within, key=lambda c: c['latency_us'])
+        print(f"No candidate within the losses meets {args.target_latency_us} us per row; keeping the fastest")
+    model = models[chosen['name']]
+    joblib.dump(model, artifact(args, COMPACT_FILENAME))
+
+    # On the test split, against the trained model
+    columns = [names.index(name) for name in chosen['features']]
+    test_malicious = y_test != 0
+    test = {}
+    for name, ensemble, X_part in (('trained', teacher, X_test),
+                                   ('compact', TreeEnsemble(export_model(model)), X_test[:, columns])):
+        predicted = ensemble.predict(X_part) != 0
+        test[name] = {'accuracy': float(np.mean(predicted == test_malicious)),
+                      'recall': float(predicted[test_malicious].mean()) if test_malicious.any() else 1.0}
+    save_json(artifact(args, 'compact.json'), {
+        'features': chosen['features'],
+        'chosen': chosen,
+        'limits': {'max_accuracy_loss': args.max_accuracy_loss, 'max_recall_loss': args.max_recall_loss,
+                   'target_latency_us': args.target_latency_us},
+        'validation_baseline': baseline,
+        'candidates': candidates,
+        'test': test,
+    })
+
+    trained_candidate = candidates[0]
+    print(f"\nKept {chosen['name']}: {chosen['trees']} trees, {chosen['nodes']} nodes "
+          f"({chosen['nodes'] / trained_candidate['nodes']:.0%} of the trained model), "
+          f"{len(chosen['features'])} of {len(names)} features, {chosen['latency_us']:.1f} us per row "
+          f"against {trained_candidate['latency_us']:.1f}")
+    dropped = [name for name in names if name not in chosen['features']]
+    if dropped:
+        print(f"Features not extracted any more: {', '.join(dropped)}")
+    print(f"Test split: accuracy {test['compact']['accuracy']:.4f} (trained {test['trained']['accuracy']:.4f}), "
+          f"recall {test['compact']['recall']:.4f} (trained {test['trained']['recall']:.4f})")
@@ -0,0 +1,29 @@
+import joblib
+from sklearn.metrics import accuracy_score, confusion_matrix, f1_score, precision_score, recall_score
+
+from url_training.common import artifact, load_json, load_training_data, save_json, served_model, split
+
+
+def run(args):
+    # The model export ships, on its feature columns
+    path, features = served_model(args)
+    X, y = load_training_data(args)
+    _, X_test, _, y_test = split(X[features], y)
+    model = joblib.load(path)
+
+    y_pred = model.predict(X_test)
+    metrics = {
+        'accuracy': accuracy_score(y_test, y_pred),
+        'recall': recall_score(y_test, y_pred, average='weighted'),
+        'precision': precision_score(y_test, y_pred, average='weighted', zero_division=1),
+        'f1': f1_score(y_test, y_pred, average='weighted'),
+    }
+    save_json(artifact(args, 'metrics.json'), metrics)
+    print(f"Best Test Accuracy: {metrics['accuracy']}")
+    print(f"Best Test Recall: {metrics['recall']}")
+    print(f"Best Test Precision: {metrics['precision']}")
+    print(f"Best Test F1-Score: {metrics['f1']}")
+
+    if args.plots:
+        from url_training import plots
+        plots.confusion(confusion_matrix(y_test, y_pred), load_json(artifact(args, 'labels.json')), args.plots)
@@ -0,0 +1,31 @@
+import os
+import shutil
+
+import joblib
+
+from tree_ensemble import EXPORT_SUFFIX, export_model
+from url_training.common import (FIRST_STAGE_FILENAME, MANIFEST_FILENAME, MODEL_FILENAME, artifact, save_json,
+                                 served_model)
+
+
+def run(args):
+    # What google_cloud_setup/app_gc.py loads: the joblib model (the compact stage's when it has
+    # run), its NumPy export, the manifest of its feature columns, and the cascade's first stage
+    # when the cascade stage has run
+    from feature_extraction import FeatureSchema
+    path, features = served_model(args)
+    try:
+        FeatureSchema(features)  # What the service builds from the manifest
+    except ValueError as e:
+        raise SystemExit(f"Not exporting {path}: the service could not load it. {e}")
+    os.makedirs(args.export_dir, exist_ok=True)
+    shutil.copyfile(path, os.path.join(args.export_dir, MODEL_FILENAME))
+    save_json(os.path.join(args.export_dir, MANIFEST_FILENAME), {'features': features})
+    exported = os.path.join(args.export_dir, MODEL_FILENAME.rsplit('.', 1)[0] + EXPORT_SUFFIX)
+    arrays = export_model(joblib.load(path), exported)
+    print(f"Exported {len(arrays['tree_class'])} trees over {len(features)} features to {args.export_dir}")
+    if os.path.exists(artifact(args, FIRST_STAGE_FILENAME)):
+        shutil.copyfile(artifact(args, FIRST_STAGE_FILENAME), os.path.join(args.export_dir, FIRST_STAGE_FILENAME))
+        exported = os.path.join(args.export_dir, FIRST_STAGE_FILENAME.rsplit('.', 1)[0] + EXPORT_SUFFIX)
+        arrays = export_model(joblib.load(artifact(args, FIRST_STAGE_FILENAME)), exported)
+        print(f"Exported the {len(arrays['tree_class'])} trees of the cascade's first stage")
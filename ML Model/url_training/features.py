@@ -0,0 +1,26 @@
+import numpy as np
+
+from feature_cache import load_row_features
+from root_domain_encoding import encode_root_domain
+from url_training.common import artifact, save_json
+
+
+def run(args):
+    # process_data.py up to the feature selection: features of every row (from the feature
+    # cache), rows without a root domain dropped, root_domain hashed, labels encoded
+    urls_data = load_row_features(args.csv, args.cache_dir)
+    urls_data = urls_data[urls_data['root_domain'] != '0'].copy()
+
+    urls_data['root_domain'] = urls_data['root_domain'].map(encode_root_domain)
+    urls_data['have_ip'] = urls_data['have_ip'].astype(int)
+    # Same codes as LabelEncoder: position in the sorted class names
+    classes, codes = np.unique(urls_data['type'].astype(str), return_inverse=True)
+    urls_data['type'] = codes
+
+    # Missing numeric values are filled with the column median
+    numeric_columns = urls_data.select_dtypes(include=['int64', 'float64', 'int32', 'int8']).columns
+    urls_data[numeric_columns] = urls_data[numeric_columns].apply(lambda x: x.fillna(x.median()))
+
+    urls_data.to_pickle(artifact(args, 'features.pkl'))
+    save_json(artifact(args, 'labels.json'), list(classes))
+    print(f"{len(urls_data)} rows with {len(urls_data.columns)} columns; classes {list(classes)}")
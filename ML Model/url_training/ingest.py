@@ -0,0 +1,28 @@
+import pandas as pd
+
+from feature_cache import file_digests
+from url_training.common import artifact, save_json
+
+
+def run(args):
+    urls_data = pd.read_csv(args.csv)
+    missing_columns = {'url', 'type'} - set(urls_data.columns)
+    if missing_columns:
+        raise SystemExit(f"{args.csv} has no column {', '.join(sorted(missing_columns))}")
+    counts = urls_data['type'].value_counts()
+    summary = {
+        'csv': args.csv,
+        'csv_sha256': file_digests(args.csv)[1],
+        'rows': len(urls_data),
+        'missing_values': int(urls_data[['url', 'type']].isna().any(axis=1).sum()),
+        'duplicate_rows': int(urls_data.duplicated().sum()),
+        'class_counts': {str(k): int(v) for k, v in counts.items()},
+    }
+    save_json(artifact(args, 'ingest.json'), summary)
+    print(f"{summary['rows']} rows, {summary['missing_values']} with missing values, "
+          f"{summary['duplicate_rows']} duplicates; classes: {summary['class_counts']}")
+
+    if args.plots:
+        from url_training import plots
+        plots.class_distribution(counts, args.plots)
+        plots.url_word_cloud(urls_data['url'].dropna(), args.plots)
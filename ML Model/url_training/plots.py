@@ -0,0 +1,54 @@
+import os
+
+import matplotlib
+
+matplotlib.use('Agg')  # Figures are written to files; nothing waits for a window
+
+import matplotlib.pyplot as plt
+
+# The figures of process_data.py, saved as PNG files in the --plots directory
+
+
+def _save(figure, directory, name):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    figure.savefig(path, bbox_inches='tight')
+    plt.close(figure)
+    print(f"Saved {path}")
+
+
+def class_distribution(counts, directory):
+    figure, (bars, pie) = plt.subplots(1, 2, figsize=(14, 5))
+    bars.bar(counts.index.astype(str), counts.values)
+    bars.set(title='Count of Different Types of URLs', xlabel='Types', ylabel='Count')
+    pie.pie(counts.values, labels=counts.index.astype(str), autopct='%1.1f%%')
+    pie.set_title('Distribution of URL Types')
+    _save(figure, directory, 'url_types.png')
+
+
+def url_word_cloud(urls, directory):
+    from wordcloud import WordCloud
+    wordcloud = WordCloud(width=800, height=400, background_color='white').generate(' '.join(urls))
+    figure = plt.figure(figsize=(10, 6))
+    plt.imshow(wordcloud, interpolation='bilinear')
+    plt.axis('off')
+    plt.title('Word Cloud of URLs')
+    _save(figure, directory, 'word_cloud.png')
+
+
+def correlation_heatmap(correlation_matrix, title, directory):
+    import seaborn as sns
+    figure = plt.figure(figsize=(20, 16))
+    sns.heatmap(correlation_matrix, annot=True, cmap='coolwarm')
+    plt.title(title)
+    _save(figure, directory, title.lower().replace(' ', '_') + '.png')
+
+
+def confusion(matrix, labels, directory):
+    import seaborn as sns
+    figure = plt.figure(figsize=(8, 6))
+    sns.heatmap(matrix, annot=True, fmt='d', xticklabels=labels, yticklabels=labels, cmap='Blues')
+    plt.xlabel('Predicted')
+    plt.ylabel('Actual')
+    plt.title('Confusion Matrix')
+    _save(figure, directory, 'confusion_matrix.png')
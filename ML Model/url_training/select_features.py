@@ -0,0 +1,57 @@
+import pandas as pd
+
+from feature_cache import save_training_matrix
+from url_training.common import SELECT_CODE_FILES, artifact, save_json
+
+CORRELATION_THRESHOLD = 0.85
+NON_FEATURE_COLUMNS = ['url', 'type', 'pri_domain']
+
+
+def run(args):
+    # process_data.py from the feature selection on: constant columns and one column of every
+    # highly correlated pair are dropped, then duplicate rows, then the non-feature columns.
+    # Columns google_cloud_setup/feature_extraction.py does not compute are dropped first, so
+    # every model trained on the result can be served.
+    from feature_extraction import FEATURE_NAMES
+    urls_data = pd.read_pickle(artifact(args, 'features.pkl'))
+    unservable_features = [column for column in urls_data.columns
+                           if column not in FEATURE_NAMES and column not in NON_FEATURE_COLUMNS]
+    urls_data = urls_data.drop(columns=unservable_features)
+
+    constant_features = [column for column in urls_data.columns if urls_data[column].nunique() == 1]
+    urls_data = urls_data.drop(columns=constant_features)
+    numeric_columns = urls_data.select_dtypes(include=['int64', 'float64', 'int32', 'int8']).columns
+    urls_data[numeric_columns] = urls_data[numeric_columns].fillna(0)
+
+    correlation_matrix = urls_data[numeric_columns].corr()
+    high_corr_pairs = [(column, correlation_matrix.index[i]) for i, row in enumerate(correlation_matrix.values)
+                       for j, column in enumerate(correlation_matrix.columns)
+                       if abs(row[j]) > CORRELATION_THRESHOLD and i != j]
+    features_to_drop = set()
+    for feature_1, feature_2 in high_corr_pairs:
+        if feature_1 not in features_to_drop and feature_2 not in features_to_drop:
+            features_to_drop.add(feature_2)
+    urls_data_reduced = urls_data.drop(columns=features_to_drop)
+    urls_data_reduced = urls_data_reduced.drop_duplicates()
+
+    X = urls_data_reduced.drop(columns=NON_FEATURE_COLUMNS, errors='ignore')
+    y = urls_data_reduced['type']
+    save_training_matrix(X, y, args.csv, args.work_dir, SELECT_CODE_FILES)
+    save_json(artifact(args, 'select.json'), {
+        'unservable_features': unservable_features,
+        'constant_features': constant_features,
+        'correlated_features': sorted(features_to_drop),
+        'duplicates_dropped': len(urls_data) - len(urls_data_reduced),
+        'features': list(X.columns),
+        'rows': len(X),
+    })
+    print(f"Dropped features the service does not compute {unservable_features}")
+    print(f"Dropped constant features {constant_features} and correlated features {sorted(features_to_drop)}; "
+          f"{len(X)} rows x {len(X.columns)} features after removing {len(urls_data) - len(urls_data_reduced)} duplicates")
+
+    if args.plots:
+        from url_training import plots
+        plots.correlation_heatmap(correlation_matrix, 'Correlation Matrix', args.plots)
+        reduced_numeric_columns = urls_data_reduced.select_dtypes(include=['int64', 'float64', 'int32', 'int8']).columns
+        plots.correlation_heatmap(urls_data_reduced[reduced_numeric_columns].corr(),
+                                  'Correlation Matrix of Reduced Features', args.plots)
@@ -0,0 +1,44 @@
+import os
+import time
+
+import joblib
+
+from url_training.common import (COMPACT_FILENAME, FIRST_STAGE_FILENAME, MODEL_FILENAME, artifact, load_training_data,
+                                 save_json, split)
+
+# The grid of train_model.py
+PARAM_GRID = {
+    'n_estimators': [100, 200, 300],
+    'max_depth': [3, 5, 7],
+    'learning_rate': [0.01, 0.1, 0.2],
+    'subsample': [0.8, 1.0],
+    'colsample_bytree': [0.8, 1.0]
+}
+
+
+def run(args):
+    X, y = load_training_data(args)
+    X_train, _, y_train, _ = split(X, y)
+
+    start = time.perf_counter()
+    if args.search == 'halving':
+        from halving_search import SuccessiveHalvingSearch
+        search = SuccessiveHalvingSearch(PARAM_GRID, budget_seconds=args.budget_seconds, budget_fits=args.budget_fits,
+                                         checkpoint_path=artifact(args, 'halving_search.json'))
+    else:
+        from sklearn.model_selection import GridSearchCV
+        from xgboost import XGBClassifier
+        search = GridSearchCV(estimator=XGBClassifier(eval_metric='mlogloss'), param_grid=PARAM_GRID, cv=5,
+                              scoring='accuracy', n_jobs=-1, verbose=1)
+    search.fit(X_train, y_train)
+    search_seconds = time.perf_counter() - start
+
+    joblib.dump(search.best_estimator_, artifact(args, MODEL_FILENAME))
+    # Compacted from the previous model, and a first stage over its columns, which export would ship
+    for stale in (COMPACT_FILENAME, FIRST_STAGE_FILENAME):
+        if os.path.exists(artifact(args, stale)):
+            os.remove(artifact(args, stale))
+    save_json(artifact(args, 'train.json'), {'search': args.search, 'best_params': search.best_params_,
+                                             'search_seconds': search_seconds})
+    print(f"Best parameters: {search.best_params_}")
+    print(f"Search wall-clock time: {search_seconds:.0f}s")
@@ -5,12 +5,15 @@ import numpy as np
 from urllib.parse import urlparse
 import ipaddress
 import tldextract
+import hashlib
 
 app = Flask(__name__)
 
 # Load the pre-trained XGBoost model
 model = joblib.load('best_xgboost_model.joblib')
 
+NUM_FEATURES = 17
+
 def count_chars(url, char):
     return url.count(char)
 
@@ -61,18 +64,18 @@ def extract_root_domain(url):
     extracted = tldextract.extract(url)
     return f"{extracted.domain}.{extracted.suffix}"
 
+def encode_root_domain(root_domain):
+    # MD5 modulo 10**8, as hash_encode in ML Model/process_data.py; hash() differs between processes
+    hash_object = hashlib.md5(root_domain.encode())
+    return int(hash_object.hexdigest(), 16) % (10 ** 8)
+
 def has_subdomain(url):
     domain_parts = urlparse(url).netloc.split('.')
     return 1 if len(domain_parts) > 2 else 0
 
-@app.route('/predict', methods=['POST'])
-def predict():
-    data = request.get_json(force=True)
-    url = data['url']
-
-    # Extract features
-    features = np.array([[
-        hash(extract_root_domain(url)) % (10 ** 8),  # root_domain as hashed integer
+def extract_features(url):
+    return np.array([[
+        encode_root_domain(extract_root_domain(url)),  # root_domain as hashed integer
         has_subdomain(url),  # Has_subdomain
         count_chars(url, '.'),  # Count_dots
         count_chars(url, '-'),  # Count_dashes
@@ -91,12 +94,56 @@ def predict():
         has_https(url)  # HTTPS_token
     ]], dtype=float)  # Ensure all features are float
 
+def extract_features_batch(urls):
+    # One N x 17 matrix for every URL that could be featurized, in input order.
+    # Rows that fail are left out of the matrix and reported by their index instead.
+    features = np.empty((len(urls), NUM_FEATURES), dtype=float)
+    valid = []
+    errors = {}
+    for i, url in enumerate(urls):
+        try:
+            features[len(valid)] = extract_features(url)[0]
+        except (AttributeError, TypeError, ValueError) as e:
+            errors[i] = f"{type(e).__name__}: {e}"
+            continue
+        valid.append(i)
+    return features[:len(valid)], valid, errors
+
+@app.route('/predict', methods=['POST'])
+def predict():
+    data = request.get_json(force=True)
+    url = data['url']
+
+    # Extract features
+    features = extract_features(url)
+
     # Predict using the model
     prediction = model.predict(features)
     result = {'malicious': bool(prediction)}
 
     return jsonify(result)
 
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    data = request.get_json(force=True)
+    urls = data.get('urls') if isinstance(data, dict) else None
+    if not isinstance(urls, list):
+        return jsonify({'error': "'urls' must be a list of URLs"}), 400
+
+    # Extract features for the whole batch into one N x 17 matrix
+    features, valid, errors = extract_features_batch(urls)
+
+    # Predict the whole batch with a single model call
+    results = [{'url': url} for url in urls]
+    if valid:
+        predictions = model.predict(features)
+        for i, prediction in zip(valid, predictions):
+            results[i]['malicious'] = bool(prediction)
+    for i, error in errors.items():
+        results[i]['error'] = error
+
+    return jsonify({'results': results})
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port)
@@ -1,40 +1,341 @@
+import hmac
 import os
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from prometheus_client import Counter, start_http_server, generate_latest  # Added for Prometheus integration
-import joblib
-from feature_extraction import extract_features  # Import the feature extraction function
+from feature_extraction import extract_features, extract_features_batch, extract_root_domain, encode_url_root_domain  # Import the feature extraction functions
+from verdict_cache import VerdictCache, normalize_hostname
+from shared_verdict_cache import SharedVerdictCache
+from domain_lists import DomainLists
+from blocklist_publisher import BlocklistPublisher, DEFAULT_RELOAD_COMMAND
+from micro_batcher import MicroBatcher
+from binary_protocol import BinaryServer, verdict_byte
+from classifier_client import parse_address
+from model_registry import WARMUP_URLS, ModelRegistry, load_model_file
+from cascade import CascadeModel
+from instrumentation import NULL_TIMER, count_prediction, request_timer, stack_sampler_from_env
 
 app = Flask(__name__)
 
-# Load the pre-trained XGBoost model
-model = joblib.load('best_xgboost_model.joblib')
+# Load the pre-trained XGBoost model, as NumPy arrays when it has been exported with
+# `python tree_ensemble.py` (xgboost is then not imported at all). A new model file is
+# picked up without a restart: every MODEL_WATCH_INTERVAL seconds when that is set, or on
+# POST /admin/model/reload. It is validated and warmed up before it replaces the old one.
+MODEL_EXPORT_PATH = os.environ.get('MODEL_EXPORT_PATH', 'best_xgboost_model.npz')
+MODEL_PATH = os.environ.get('MODEL_PATH', 'best_xgboost_model.joblib')
+
+# With CASCADE_FIRST_STAGE_PATH set, a cheap first-stage model decides the rows whose malicious
+# probability is outside [CASCADE_LOW, CASCADE_HIGH) and only the rest reach the full model.
+# The first stage is read again whenever the full model is (re)loaded.
+CASCADE_FIRST_STAGE_PATH = os.environ.get('CASCADE_FIRST_STAGE_PATH')
+CASCADE_ROWS = Counter('cascade_rows_total', 'Rows scored by the cascade, by the model that decided them', ['stage'])
+
+def count_cascade(decided, escalated):
+    CASCADE_ROWS.labels('first').inc(decided)
+    CASCADE_ROWS.labels('full').inc(escalated)
+
+def cascade(model):
+    return CascadeModel(load_model_file(CASCADE_FIRST_STAGE_PATH), model,
+                        float(os.environ.get('CASCADE_LOW', 0.05)), float(os.environ.get('CASCADE_HIGH', 0.95)),
+                        count_cascade)
+
+model_registry = ModelRegistry(
+    [MODEL_EXPORT_PATH, MODEL_PATH],
+    extract_features_batch(WARMUP_URLS)[0],
+    watch_interval=float(os.environ.get('MODEL_WATCH_INTERVAL', 0)),
+    wrap=cascade if CASCADE_FIRST_STAGE_PATH else None,
+)
 
 # Initialize Prometheus metrics
 MALICIOUS_URL_COUNTER = Counter('malicious_url_counter_total', 'Count of Malicious URLs Detected')  # Added for Prometheus metric
 
+# Sampled stacks of a fraction of requests, when PROFILE_SAMPLE_RATE is set (see /admin/profile)
+stack_sampler = stack_sampler_from_env()
+if stack_sampler is not None:
+    @app.before_request
+    def start_sampling():
+        g.sampled_thread = stack_sampler.begin()
+
+    @app.teardown_request
+    def stop_sampling(exc):
+        if g.get('sampled_thread') is not None:
+            stack_sampler.end(g.sampled_thread)
+
+# Verdict cache in front of the model, keyed on the normalized hostname (or its root domain).
+# With VERDICT_CACHE_SHARED=1 it lives in shared memory, and the workers serve.py forks from
+# this process share it.
+VERDICT_CACHE_KEY = os.environ.get('VERDICT_CACHE_KEY', 'hostname')  # 'hostname' or 'root_domain'
+verdict_cache_class = SharedVerdictCache if os.environ.get('VERDICT_CACHE_SHARED') == '1' else VerdictCache
+verdict_cache = verdict_cache_class(
+    max_size=int(os.environ.get('VERDICT_CACHE_SIZE', 100000)),
+    benign_ttl=float(os.environ.get('VERDICT_CACHE_BENIGN_TTL', 3600)),
+    malicious_ttl=float(os.environ.get('VERDICT_CACHE_MALICIOUS_TTL', 86400)),
+)
+
+# Verdicts of the previous model are dropped when a new one is swapped in
+model_registry.on_swap(lambda previous_version, version: verdict_cache.invalidate())
+
+# Set by serve.py: asks the master to reload the model and replace the other workers with it
+model_reload_broadcast = None
+
+def cache_verdict(cache_key, malicious, model_version):
+    verdict_cache.put(cache_key, malicious)
+    # The model was swapped while this verdict was computed: it may come from the old one
+    if model_registry.version != model_version:
+        verdict_cache.invalidate(cache_key)
+
+# Operator allow/block lists, checked before the cache and the model
+domain_lists = DomainLists(os.environ.get('ALLOWLIST_PATH'), os.environ.get('BLOCKLIST_PATH'))
+
+# Model detections are published to the dnsmasq blocklist when BLOCKLIST_PUBLISH_PATH is set
+blocklist_publisher = None
+if os.environ.get('BLOCKLIST_PUBLISH_PATH'):
+    blocklist_publisher = BlocklistPublisher(
+        os.environ['BLOCKLIST_PUBLISH_PATH'],
+        window=float(os.environ.get('BLOCKLIST_PUBLISH_WINDOW', 5)),
+        reload_command=os.environ.get('BLOCKLIST_RELOAD_COMMAND', DEFAULT_RELOAD_COMMAND),
+    )
+
+def publish_detection(hostname):
+    if blocklist_publisher is not None and hostname:
+        blocklist_publisher.publish(hostname)
+
+def predict_urls(urls):
+    # Model verdicts for a list of URLs from one feature matrix and one model.predict call;
+    # URLs whose features cannot be extracted get the error instead
+    active = model_registry.active
+    features, valid, errors = extract_features_batch(urls, active.schema)
+    results = [None] * len(urls)
+    if valid:
+        for j, prediction in zip(valid, model_registry.predict(features, active)):
+            results[j] = bool(prediction)
+    for j, error in errors.items():
+        results[j] = ValueError(error)
+    return results
+
+# Concurrent /predict calls share model calls when MICRO_BATCH_MAX_SIZE is above 1
+MICRO_BATCH_MAX_SIZE = int(os.environ.get('MICRO_BATCH_MAX_SIZE', 0))
+micro_batcher = None
+if MICRO_BATCH_MAX_SIZE > 1:
+    micro_batcher = MicroBatcher(predict_urls, MICRO_BATCH_MAX_SIZE,
+                                 float(os.environ.get('MICRO_BATCH_MAX_WAIT_MS', 2)) / 1000,
+                                 float(os.environ.get('MICRO_BATCH_TIMEOUT_MS', 5000)) / 1000)
+
+def verdict_cache_key(hostname):
+    if hostname and VERDICT_CACHE_KEY == 'root_domain':
+        return extract_root_domain(hostname)
+    return hostname
+
+def admin_authorized():
+    # Admin endpoints require the X-Admin-Token header to match ADMIN_TOKEN, and are disabled
+    # when ADMIN_TOKEN is not set
+    token = os.environ.get('ADMIN_TOKEN')
+    if not token:
+        return False
+    return hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), token.encode())
+
+def classify_with_source(url, timer=NULL_TIMER):
+    # Verdict for one URL and the path that decided it: allowlist, blocklist, cache or model.
+    # timer.mark() records how long each stage took.
+    hostname = normalize_hostname(url)
+    listed = domain_lists.lookup(hostname)
+    timer.mark('lists')
+    if listed:
+        return listed == 'blocklist', listed
+
+    # Repeated hostnames are answered from the verdict cache
+    cache_key = verdict_cache_key(hostname)
+    malicious = verdict_cache.get(cache_key)
+    timer.mark('cache')
+    if malicious is not None:
+        return malicious, 'cache'
+
+    model_version = model_registry.version
+    if micro_batcher is not None:
+        malicious = micro_batcher.submit(url)
+        timer.mark('batch')
+    else:
+        # Extract the features the active model takes
+        active = model_registry.active
+        root_domain_code = encode_url_root_domain(url) if active.schema.root_domain else None
+        timer.mark('root_domain')
+        features = extract_features(url, root_domain_code, active.schema)  # Call the feature extraction function
+        timer.mark('features')
+
+        # Predict using the model
+        prediction = model_registry.predict(features, active)
+        malicious = bool(prediction)
+        timer.mark('model')
+    cache_verdict(cache_key, malicious, model_version)
+    if malicious:
+        publish_detection(hostname)
+    return malicious, 'model'
+
+def classify(url):
+    return classify_with_source(url)[0]
+
+def classify_batch(urls, timer=NULL_TIMER):
+    # Results for a list of URLs, as /predict_batch returns them: lists and cache first, then the
+    # misses through one feature matrix and a single model call. Verdicts are counted and
+    # detections published like those of /predict.
+    results = [{'url': url} for url in urls]
+    hostnames = [normalize_hostname(url) for url in urls]
+    cache_keys = [None] * len(urls)
+    misses = []
+    for i, hostname in enumerate(hostnames):
+        listed = domain_lists.lookup(hostname)
+        if listed:
+            results[i].update(malicious=listed == 'blocklist', source=listed)
+            continue
+        cache_keys[i] = verdict_cache_key(hostname)
+        malicious = verdict_cache.get(cache_keys[i])
+        if malicious is None:
+            misses.append(i)
+        else:
+            results[i].update(malicious=malicious, source='cache')
+    timer.mark('cache')
+
+    # The cache misses go through one feature matrix and a single model call
+    model_version = model_registry.version
+    for i, malicious in zip(misses, predict_urls([urls[i] for i in misses])):
+        if isinstance(malicious, Exception):
+            results[i]['error'] = str(malicious)
+            continue
+        results[i].update(malicious=malicious, source='model')
+        cache_verdict(cache_keys[i], malicious, model_version)
+        if malicious:
+            publish_detection(hostnames[i])
+    timer.mark('model')
+
+    for result in results:
+        if 'source' in result:
+            count_prediction(result['malicious'], result['source'])
+        if result.get('malicious'):
+            MALICIOUS_URL_COUNTER.inc()
+            app.logger.info(f"Malicious URL detected: {result['url']}")
+
+    return results
+
+def classify_hostnames(hostnames):
+    # One verdict byte per hostname, for the binary protocol listener
+    timer = request_timer('binary')
+    results = classify_batch([f'http://{hostname}' for hostname in hostnames], timer)
+    verdicts = [verdict_byte(result) for result in results]
+    timer.mark('serialize')
+    timer.finish()
+    return verdicts
+
+# Binary protocol (binary_protocol.py) on a Unix socket and/or TCP, next to HTTP. The sockets
+# are bound here and served by app_gc.py itself or by every serve.py worker.
+binary_server = None
+if os.environ.get('BINARY_SOCKET_PATH') or os.environ.get('BINARY_TCP_ADDRESS'):
+    binary_server = BinaryServer(
+        classify_hostnames,
+        unix_path=os.environ.get('BINARY_SOCKET_PATH'),
+        tcp_address=parse_address(os.environ['BINARY_TCP_ADDRESS'])[1] if os.environ.get('BINARY_TCP_ADDRESS') else None,
+    )
+
 @app.route('/predict', methods=['POST'])
 def predict():
+    timer = request_timer('predict')
     data = request.get_json(force=True)
     url = data['url']
+    timer.mark('parse')
 
-    # Extract features
-    features = extract_features(url)  # Call the feature extraction function
-
-    # Predict using the model
-    prediction = model.predict(features)
-    result = {'malicious': bool(prediction)}
+    try:
+        malicious, source = classify_with_source(url, timer)
+    except TimeoutError as e:
+        # The micro-batcher did not answer in time
+        return jsonify({'error': str(e)}), 503
+    count_prediction(malicious, source)
+    result = {'malicious': malicious, 'source': source}
 
     # Increment the Prometheus counter if the URL is malicious
-    if prediction:
+    if malicious:
         MALICIOUS_URL_COUNTER.inc()
         # Log the URL
         app.logger.info(f"Malicious URL detected: {url}")
 
+    response = jsonify(result)
+    timer.mark('serialize')
+    timer.finish()
+    return response
+
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    timer = request_timer('predict_batch')
+    data = request.get_json(force=True)
+    urls = data.get('urls') if isinstance(data, dict) else None
+    if not isinstance(urls, list):
+        return jsonify({'error': "'urls' must be a list of URLs"}), 400
+    timer.mark('parse')
+
+    results = classify_batch(urls, timer)
+    response = jsonify({'results': results})
+    timer.mark('serialize')
+    timer.finish()
+    return response
+
+@app.route('/admin/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    if not admin_authorized():
+        return jsonify({'error': 'unauthorized'}), 403
+    data = request.get_json(force=True, silent=True) or {}
+    # {"url": ...} drops the entry for that URL's cache key, {"all": true} clears the cache
+    if data.get('all'):
+        removed = verdict_cache.invalidate()
+    elif 'url' in data:
+        removed = verdict_cache.invalidate(verdict_cache_key(normalize_hostname(data['url'])))
+    else:
+        return jsonify({'error': "expected 'url' or 'all'"}), 400
+    return jsonify({'invalidated': removed})
+
+@app.route('/admin/lists/reload', methods=['POST'])
+def reload_lists():
+    if not admin_authorized():
+        return jsonify({'error': 'unauthorized'}), 403
+    # Recompiles the allow/block lists from disk; requests keep using the old ones until the swap
+    return jsonify({'entries': domain_lists.reload()})
+
+@app.route('/admin/model', methods=['GET'])
+def model_info():
+    if not admin_authorized():
+        return jsonify({'error': 'unauthorized'}), 403
+    return jsonify(model_registry.info())
+
+@app.route('/admin/model/reload', methods=['POST'])
+def reload_model():
+    if not admin_authorized():
+        return jsonify({'error': 'unauthorized'}), 403
+    # Loads, validates and warms up the model file in this request's thread; other requests keep
+    # using the active model until the swap. {"force": true} reloads an unchanged file too.
+    data = request.get_json(force=True, silent=True) or {}
+    result = model_registry.reload(force=bool(data.get('force')))
+    if result['result'] == 'failed':
+        return jsonify(result), 422
+    if model_reload_broadcast is not None:
+        # Only this worker has the new model so far
+        model_reload_broadcast()
+        result['workers'] = 'replacing'
     return jsonify(result)
 
+@app.route('/admin/profile', methods=['GET', 'DELETE'])
+def profile():
+    if not admin_authorized():
+        return jsonify({'error': 'unauthorized'}), 403
+    if stack_sampler is None:
+        return jsonify({'error': 'profiling is off, set PROFILE_SAMPLE_RATE'}), 404
+    # GET returns the sampled stacks in folded format (?limit=N for the N most frequent),
+    # DELETE starts a new profile
+    if request.method == 'DELETE':
+        stack_sampler.reset()
+        return jsonify({'reset': True})
+    return Response(stack_sampler.folded(request.args.get('limit', type=int)), mimetype='text/plain')
+
 if __name__ == '__main__':
     # Start Prometheus client HTTP server on port 8000
     start_http_server(8000)
+    if binary_server is not None:
+        binary_server.start()
     # Run Flask application
     app.run(host='0.0.0.0', port=5000)
-  
\ No newline at end of file
+  
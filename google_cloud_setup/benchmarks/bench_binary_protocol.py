@@ -0,0 +1,155 @@
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Resolver-to-classifier calls over HTTP/JSON (/predict, a new connection per call, as the
+# dns_filter.sh flow does) against the binary protocol on a Unix socket and on TCP with
+# persistent connections, one hostname per call:
+#   latency     one client calling back to back: p50/p99 round trip and calls per second
+#   throughput  --clients processes calling back to back, and with the binary protocol also
+#               pipelined (--depth requests in flight per connection)
+# Both listeners run in one app process, so they share the model and the verdict cache. With
+# the default cache most calls are hits and the protocol cost dominates; --cache-size 0 sends
+# every call through feature extraction and the model.
+# Run from the directory holding best_xgboost_model.joblib, or pass --model-dir.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, HERE)
+
+from url_corpus import generate_urls
+
+SERVER = ("import os, sys; os.chdir(sys.argv[1]); sys.path.insert(0, sys.argv[2]); "
+          "from app_gc import app, binary_server; binary_server.start(); "
+          "app.run(host='127.0.0.1', port=int(sys.argv[3]), threaded=True)")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def http_caller(port):
+    def call(hostname):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        connection.request('POST', '/predict', json.dumps({'url': hostname}), {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+        connection.close()
+    return call
+
+
+def binary_caller(address, depth=1):
+    from classifier_client import ClassifierClient
+    client = ClassifierClient(address)
+    if depth == 1:
+        return lambda hostname: client.classify([hostname])
+    return lambda hostnames: client.classify_many([[hostname] for hostname in hostnames])
+
+
+def make_caller(kind, ports, socket_path, depth=1):
+    if kind == 'http':
+        return http_caller(ports['http'])
+    return binary_caller(socket_path if kind == 'unix' else f"127.0.0.1:{ports['tcp']}", depth)
+
+
+def latencies(call, hostnames, seconds):
+    timings = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        call(hostnames[len(timings) % len(hostnames)])
+        timings.append(time.perf_counter() - start)
+    return np.array(timings)
+
+
+def client(kind, ports, socket_path, depth, hostnames, seconds, results):
+    call = make_caller(kind, ports, socket_path, depth)
+    calls = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        if depth == 1:
+            call(hostnames[calls % len(hostnames)])
+            calls += 1
+        else:
+            start = calls % len(hostnames)
+            call((hostnames * 2)[start:start + depth])
+            calls += depth
+    results.put(calls)
+
+
+def throughput(kind, ports, socket_path, depth, hostnames, clients, seconds):
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=client, args=(kind, ports, socket_path, depth, hostnames[i::clients],
+                                                                seconds, results)) for i in range(clients)]
+    for process in processes:
+        process.start()
+    calls = sum(results.get() for _ in processes)
+    for process in processes:
+        process.join()
+    return calls / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model-dir', default='.')
+    parser.add_argument('--names', type=int, default=2000, help='distinct hostnames called')
+    parser.add_argument('--cache-size', type=int, default=100000, help='VERDICT_CACHE_SIZE of the app')
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--depth', type=int, default=32)
+    args = parser.parse_args()
+
+    from verdict_cache import normalize_hostname
+    hostnames = sorted({h for h in map(normalize_hostname, generate_urls(args.names * 2)) if h})[:args.names]
+    with tempfile.TemporaryDirectory() as directory:
+        socket_path = os.path.join(directory, 'classifier.sock')
+        ports = {'http': free_port(), 'tcp': free_port()}
+        env = dict(os.environ, VERDICT_CACHE_SIZE=str(args.cache_size), BINARY_SOCKET_PATH=socket_path,
+                   BINARY_TCP_ADDRESS=f"127.0.0.1:{ports['tcp']}")
+        server = subprocess.Popen([sys.executable, '-c', SERVER, os.path.abspath(args.model_dir), APP_DIR,
+                                   str(ports['http'])], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            deadline = time.monotonic() + 120
+            while True:
+                try:
+                    http_caller(ports['http'])('example.com')
+                    break
+                except OSError:
+                    if time.monotonic() > deadline or server.poll() is not None:
+                        raise RuntimeError('server did not start')
+                    time.sleep(0.2)
+            # Warm-up: also fills the verdict cache for the cached runs
+            warm = make_caller('unix', ports, socket_path)
+            for hostname in hostnames:
+                warm(hostname)
+
+            print(f"Latency, one client, one hostname per call ({args.names} hostnames, cache size {args.cache_size})")
+            for kind in ('http', 'unix', 'tcp'):
+                timings = latencies(make_caller(kind, ports, socket_path), hostnames, args.seconds)
+                p50, p99 = np.percentile(timings, [50, 99]) * 1e6
+                print(f"{kind:>6}: p50 {p50:8.0f} us, p99 {p99:8.0f} us, {len(timings) / args.seconds:8.0f} calls/s")
+
+            print(f"\nThroughput, {args.clients} clients")
+            for kind, depth in (('http', 1), ('unix', 1), ('tcp', 1), ('unix', args.depth), ('tcp', args.depth)):
+                rate = throughput(kind, ports, socket_path, depth, hostnames, args.clients, args.seconds)
+                label = f"{kind}, pipelined x{depth}" if depth > 1 else kind
+                print(f"{label:>20}: {rate:10.0f} hostnames/s")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
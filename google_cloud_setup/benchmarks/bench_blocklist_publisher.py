@@ -0,0 +1,68 @@
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+# Feeds bursts of detections to BlocklistPublisher with a fake dnsmasq process as the reload
+# target and reports batches, reloads sent, reloads avoided and time to publish.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from prometheus_client import REGISTRY
+
+from blocklist_publisher import BlocklistPublisher
+
+
+def metric(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--detections', type=int, default=5000)
+    parser.add_argument('--distinct', type=int, default=2000)
+    parser.add_argument('--bursts', type=int, default=10)
+    parser.add_argument('--window', type=float, default=0.2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'hosts.blocklist')
+        fake = subprocess.Popen([sys.executable, os.path.join(HERE, 'fake_dnsmasq.py'), path],
+                                stdout=subprocess.PIPE, text=True)
+        pid = int(fake.stdout.readline())
+        publisher = BlocklistPublisher(path, window=args.window, reload_command=['kill', '-HUP', str(pid)])
+
+        # Bursts of repeated detections separated by quiet periods longer than the window
+        rng = random.Random(0)
+        domains = [f"malicious{i}.example.com" for i in range(args.distinct)]
+        start = time.perf_counter()
+        for burst in range(args.bursts):
+            for _ in range(args.detections // args.bursts):
+                publisher.publish(rng.choice(domains))
+            time.sleep(args.window * 2)
+        publisher.stop()
+        elapsed = time.perf_counter() - start
+
+        time.sleep(0.2)
+        fake.terminate()
+        seen = fake.stdout.read().strip()
+        with open(path) as f:
+            written = sum(1 for _ in f)
+
+    batches = metric('blocklist_publish_batch_size_count')
+    print(f"detections:        {args.detections} ({args.distinct} distinct domains) in {elapsed:.1f}s")
+    print(f"duplicates:        {metric('blocklist_duplicates_total'):.0f}")
+    print(f"written:           {written} lines in {batches:.0f} batches "
+          f"(mean {metric('blocklist_publish_batch_size_sum') / max(batches, 1):.1f} domains)")
+    print(f"reloads:           {metric('blocklist_reloads_total'):.0f} sent, "
+          f"{metric('blocklist_reloads_avoided_total'):.0f} avoided")
+    print(f"publish time:      {metric('blocklist_publish_seconds_sum') / max(batches, 1) * 1e3:.2f} ms per batch")
+    print(f"fake dnsmasq:      {seen}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import argparse
+import asyncio
+import os
+import random
+import struct
+import sys
+import time
+
+import numpy as np
+
+# Load test of the asyncio DNS front-end against a local stub upstream resolver.
+# Replays a skewed stream of hostnames from several concurrent clients and reports
+# queries per second, latency percentiles and how many queries reached the upstream.
+# Run from the directory holding best_xgboost_model.joblib, or pass --model-dir.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from dns_frontend import DnsFrontend
+from stub_resolver import start_stub_resolver
+from url_corpus import generate_urls
+from verdict_cache import normalize_hostname
+
+
+def encode_query(query_id, name, qtype=1):
+    qname = b''.join(bytes([len(label)]) + label.encode() for label in name.split('.')) + b'\0'
+    return struct.pack('!HHHHHH', query_id, 0x0100, 1, 0, 0, 0) + qname + struct.pack('!HH', qtype, 1)
+
+
+class _Client(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.transport = None
+        self.pending = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        future = self.pending.pop(struct.unpack_from('!H', data)[0], None)
+        if future is not None and not future.done():
+            future.set_result(data)
+
+
+async def run_clients(address, names, concurrency, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    _, client = await loop.create_datagram_endpoint(_Client, remote_addr=address)
+    latencies = []
+    answers = {'blocked': 0, 'resolved': 0, 'failed': 0}
+    next_name = iter(names)
+    ids = iter(range(1 << 30))
+
+    async def worker():
+        for name in next_name:
+            query_id = next(ids) & 0xFFFF
+            future = loop.create_future()
+            client.pending[query_id] = future
+            start = time.perf_counter()
+            client.transport.sendto(encode_query(query_id, name))
+            try:
+                response = await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                client.pending.pop(query_id, None)
+                answers['failed'] += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            if response[3] & 0x0F:
+                answers['failed'] += 1
+            elif response.endswith(bytes(4)):
+                answers['blocked'] += 1
+            else:
+                answers['resolved'] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    client.transport.close()
+    return elapsed, np.array(latencies), answers
+
+
+async def main_async(args):
+    from app_gc import classify  # Loads the model from the working directory
+
+    stub_transport, stub, upstream = await start_stub_resolver(delay=args.upstream_delay)
+    frontend = DnsFrontend(classify, upstream, pool_size=args.pool_size)
+    port = await frontend.start('127.0.0.1', 0)
+
+    # A few thousand distinct names, queried with a skewed (Zipf-like) popularity
+    hostnames = sorted({normalize_hostname(url) for url in generate_urls(args.distinct * 2)})[:args.distinct]
+    rng = random.Random(0)
+    rng.shuffle(hostnames)
+    weights = [1 / (rank + 1) for rank in range(len(hostnames))]
+    names = rng.choices(hostnames, weights=weights, k=args.queries)
+
+    elapsed, latencies, answers = await run_clients(('127.0.0.1', port), names, args.concurrency)
+    await frontend.close()
+    stub_transport.close()
+
+    print(f"queries:      {len(names)} from {args.concurrency} concurrent clients")
+    print(f"throughput:   {len(names) / elapsed:10.0f} queries/s")
+    if len(latencies):
+        print(f"latency p50:  {np.percentile(latencies, 50) * 1e3:10.3f} ms")
+        print(f"latency p99:  {np.percentile(latencies, 99) * 1e3:10.3f} ms")
+    print(f"answers:      {answers}")
+    print(f"upstream:     {stub.queries} queries forwarded")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model-dir', default='.')
+    parser.add_argument('--queries', type=int, default=50000)
+    parser.add_argument('--distinct', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--pool-size', type=int, default=4)
+    parser.add_argument('--upstream-delay', type=float, default=0.001)
+    args = parser.parse_args()
+    os.chdir(args.model_dir)
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Lookup speed and resident memory of the compiled allow/block list index at 1M and 10M
+# entries, plus the time to compile the list and to reload the saved index.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from domain_lists import DomainLists
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def listed_domain(i):
+    return f"d{i:x}.example{i % 997}.{('com', 'net', 'org', 'co.uk')[i % 4]}"
+
+
+def bench(size, lookups, directory):
+    path = os.path.join(directory, f'blocklist_{size}.txt')
+    with open(path, 'w') as f:
+        for i in range(size):
+            f.write(f"0.0.0.0 {listed_domain(i)}\n")
+
+    gc.collect()
+    before = rss_bytes()
+    start = time.perf_counter()
+    lists = DomainLists(blocklist_path=path)
+    compile_time = time.perf_counter() - start
+    gc.collect()
+    resident = rss_bytes() - before
+
+    start = time.perf_counter()
+    lists.reload()
+    reload_time = time.perf_counter() - start
+
+    # Half the names sit below a listed domain, half are not listed at all
+    rng = random.Random(size)
+    names = []
+    for _ in range(lookups):
+        if rng.random() < 0.5:
+            names.append('www.cdn.' + listed_domain(rng.randrange(size)))
+        else:
+            names.append(f"www.unlisted{rng.randrange(10 ** 9)}.example.com")
+    start = time.perf_counter()
+    hits = sum(lists.lookup(name) is not None for name in names)
+    lookup_time = time.perf_counter() - start
+
+    print(f"{size:>10} entries: compile {compile_time:6.1f}s, reload {reload_time * 1e3:7.1f} ms, "
+          f"index {lists.nbytes / 2 ** 20:7.1f} MiB ({lists.nbytes / size:4.1f} B/entry), "
+          f"resident +{resident / 2 ** 20:7.1f} MiB, "
+          f"lookup {lookup_time / lookups * 1e6:5.2f} us/name, {hits}/{lookups} listed")
+    os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='1000000,10000000')
+    parser.add_argument('--lookups', type=int, default=200000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        for size in [int(s) for s in args.sizes.split(',')]:
+            bench(size, args.lookups, directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Model hot reload under load: closed-loop clients keep calling /predict while the model is
+# reloaded through POST /admin/model/reload. Latencies of requests that overlapped a reload
+# are compared with the rest, and failed requests are counted. For contrast, the time a
+# restarted server takes to answer its first request (the gap a restart leaves) is measured too.
+# The verdict cache is off so every request reaches the model.
+# Run from the directory holding best_xgboost_model.joblib, or pass --model-dir.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from url_corpus import generate_urls
+
+APP_DIR = os.path.dirname(HERE)
+SERVER = ("import os, sys; os.chdir(sys.argv[1]); sys.path.insert(0, sys.argv[2]); "
+          "from app_gc import app; app.run(host='127.0.0.1', port=int(sys.argv[3]), threaded=True)")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+ADMIN_TOKEN = 'bench-hot-reload'
+
+
+def post(port, path, body):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        connection.request('POST', path, json.dumps(body),
+                           {'Content-Type': 'application/json', 'X-Admin-Token': ADMIN_TOKEN})
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def start_server(model_dir):
+    # Returns the process and the seconds until it answered its first /predict
+    port = free_port()
+    env = dict(os.environ, VERDICT_CACHE_SIZE='0', ADMIN_TOKEN=ADMIN_TOKEN)
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-c', SERVER, model_dir, APP_DIR, str(port)], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    while True:
+        try:
+            if post(port, '/predict', {'url': 'http://www.example.com/'})[0] == 200:
+                return server, port, time.perf_counter() - started
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError('server did not start')
+            time.sleep(0.05)
+
+
+def client(port, urls, seconds, results):
+    # (start, latency, ok) of every request
+    requests = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            ok = post(port, '/predict', {'url': urls[len(requests) % len(urls)]})[0] == 200
+        except OSError:
+            ok = False
+        requests.append((start, time.perf_counter() - start, ok))
+    results.put(requests)
+
+
+def percentiles(latencies):
+    if not len(latencies):
+        return 'no requests'
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1e3
+    return f"{len(latencies):6d} requests, p50 {p50:6.2f} ms, p99 {p99:7.2f} ms, max {latencies.max() * 1e3:7.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model-dir', default='.')
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--reloads', type=int, default=5)
+    parser.add_argument('--interval', type=float, default=3.0, help='seconds between reloads')
+    parser.add_argument('--urls', type=int, default=5000)
+    args = parser.parse_args()
+
+    urls = [u for u in generate_urls(args.urls, seed=0) if '://' in u]
+    with tempfile.TemporaryDirectory() as model_dir:
+        shutil.copy(os.path.join(args.model_dir, 'best_xgboost_model.joblib'), model_dir)
+        if os.path.exists(os.path.join(args.model_dir, 'best_xgboost_model.npz')):
+            shutil.copy(os.path.join(args.model_dir, 'best_xgboost_model.npz'), model_dir)
+
+        server, port, first_response = start_server(model_dir)
+        try:
+            seconds = args.interval * (args.reloads + 1)
+            results = multiprocessing.Queue()
+            clients = [multiprocessing.Process(target=client, args=(port, urls[i::args.clients], seconds, results))
+                       for i in range(args.clients)]
+            for process in clients:
+                process.start()
+            reloads = []
+            for _ in range(args.reloads):
+                time.sleep(args.interval)
+                start = time.perf_counter()
+                status, body = post(port, '/admin/model/reload', {'force': True})
+                reloads.append((start, time.perf_counter(), status, json.loads(body)))
+            requests = [request for _ in clients for request in results.get()]
+            for process in clients:
+                process.join()
+        finally:
+            server.terminate()
+            server.wait()
+
+    starts = np.array([r[0] for r in requests])
+    latencies = np.array([r[1] for r in requests])
+    ok = np.array([r[2] for r in requests])
+    during = np.zeros(len(requests), dtype=bool)
+    for begin, end, _, _ in reloads:
+        during |= (starts < end) & (starts + latencies > begin)
+    print(f"{args.reloads} reloads: " + ', '.join(
+        f"{body.get('seconds', end - begin):.2f}s ({status} {body['result']})" for begin, end, status, body in reloads))
+    print(f"{'no reload':>16}: {percentiles(latencies[~during & ok])}")
+    print(f"{'during reload':>16}: {percentiles(latencies[during & ok])}")
+    print(f"Failed requests: {int((~ok).sum())} of {len(requests)}")
+    print(f"A restarted server answered its first request after {first_response:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
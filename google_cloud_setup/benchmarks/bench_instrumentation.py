@@ -0,0 +1,76 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# Overhead of the request instrumentation: /predict throughput (Flask test client, verdict
+# cache off so every request runs the model) with stage metrics off, on, and on together
+# with the stack sampler, plus the cost of a single stage mark. Each configuration runs in
+# its own process, since the settings are read at import, and the runs are interleaved.
+# Run from the directory holding best_xgboost_model.joblib, or pass --model-dir.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+CONFIGS = {
+    'disabled': {'STAGE_METRICS': '0'},
+    'stage metrics': {'STAGE_METRICS': '1'},
+    'metrics + profiler 1%': {'STAGE_METRICS': '1', 'PROFILE_SAMPLE_RATE': '0.01'},
+}
+
+
+def measure(count):
+    # Runs in the child: prints /predict requests per second
+    from url_corpus import generate_urls
+    from app_gc import app
+    client = app.test_client()
+    urls = [u for u in generate_urls(count * 2) if '://' in u][:count]
+    for url in urls[:200]:
+        client.post('/predict', json={'url': url})
+    start = time.perf_counter()
+    for url in urls:
+        client.post('/predict', json={'url': url})
+    print(len(urls) / (time.perf_counter() - start))
+
+
+def bench_marks(iterations=200000):
+    from instrumentation import NULL_TIMER, StageTimer
+    for name, timer in (('null timer', NULL_TIMER), ('stage timer', StageTimer('bench'))):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            timer.mark('model')
+        print(f"{name + ' mark':>24}: {(time.perf_counter() - start) / iterations * 1e9:8.0f} ns")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model-dir', default='.')
+    parser.add_argument('--urls', type=int, default=5000)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--measure', action='store_true')
+    args = parser.parse_args()
+
+    os.chdir(args.model_dir)
+    if args.measure:
+        measure(args.urls)
+        return
+
+    bench_marks()
+    rates = {name: [] for name in CONFIGS}
+    for _ in range(args.rounds):
+        for name, settings in CONFIGS.items():
+            env = dict(os.environ, VERDICT_CACHE_SIZE='0', **settings)
+            env.pop('PROFILE_SAMPLE_RATE', None) if 'PROFILE_SAMPLE_RATE' not in settings else None
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', '--urls', str(args.urls)],
+                                    env=env, capture_output=True, text=True, check=True).stdout
+            rates[name].append(float(output.split()[-1]))
+    baseline = max(rates['disabled'])
+    for name, values in rates.items():
+        best = max(values)
+        print(f"{name:>24}: {best:8.0f} req/s ({(baseline / best - 1) * 100:+5.1f}% time per request)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+
+# Load test of /predict with and without the micro-batcher: closed-loop clients at several
+# concurrency levels against a threaded server, reporting throughput, latency percentiles and
+# the mean batch size the model saw. The verdict cache is off so every request reaches the model.
+# Run from the directory holding best_xgboost_model.joblib, or pass --model-dir.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from url_corpus import generate_urls
+
+APP_DIR = os.path.dirname(HERE)
+SERVER = ("import os, sys; os.chdir(sys.argv[1]); sys.path.insert(0, sys.argv[2]); "
+          "from prometheus_client import start_http_server; from app_gc import app; "
+          "start_http_server(int(sys.argv[4]), addr='127.0.0.1'); app.run(host='127.0.0.1', port=int(sys.argv[3]), threaded=True)")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def post(port, url):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    connection.request('POST', '/predict', json.dumps({'url': url}), {'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    return response.status
+
+
+def client(port, urls, seconds, results):
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        post(port, urls[len(latencies) % len(urls)])
+        latencies.append(time.perf_counter() - start)
+    results.put(latencies)
+
+
+def sample(metrics_port, name):
+    text = urllib.request.urlopen(f'http://127.0.0.1:{metrics_port}/metrics').read().decode()
+    return sum(float(line.split()[-1]) for line in text.splitlines() if line.split(' ')[0] == name)
+
+
+def run(args, urls, max_batch_size, concurrency):
+    port, metrics_port = free_port(), free_port()
+    env = dict(os.environ, VERDICT_CACHE_SIZE='0', MICRO_BATCH_MAX_SIZE=str(max_batch_size),
+               MICRO_BATCH_MAX_WAIT_MS=str(args.max_wait_ms))
+    server = subprocess.Popen([sys.executable, '-c', SERVER, args.model_dir, APP_DIR, str(port), str(metrics_port)],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 120
+        while True:
+            try:
+                post(port, urls[0])
+                break
+            except OSError:
+                if time.monotonic() > deadline or server.poll() is not None:
+                    raise RuntimeError('server did not start')
+                time.sleep(0.2)
+        results = multiprocessing.Queue()
+        clients = [multiprocessing.Process(target=client, args=(port, urls[i::concurrency], args.seconds, results))
+                   for i in range(concurrency)]
+        start = time.perf_counter()
+        for process in clients:
+            process.start()
+        latencies = np.concatenate([results.get() for _ in clients])
+        elapsed = time.perf_counter() - start
+        for process in clients:
+            process.join()
+        batches = sample(metrics_port, 'micro_batch_size_count')
+        mean_batch = sample(metrics_port, 'micro_batch_size_sum') / batches if batches else 1.0
+    finally:
+        server.terminate()
+        server.wait()
+    return len(latencies) / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99), mean_batch
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model-dir', default='.')
+    parser.add_argument('--concurrency', default='1,8,32')
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+    args.model_dir = os.path.abspath(args.model_dir)
+
+    urls = [u for u in generate_urls(20000) if '://' in u]
+    print(f"{'clients':>7} {'mode':>14} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'batch':>6}")
+    for concurrency in [int(c) for c in args.concurrency.split(',')]:
+        for max_batch_size, mode in ((0, 'per request'), (args.max_batch_size, 'micro-batched')):
+            throughput, p50, p99, mean_batch = run(args, urls, max_batch_size, concurrency)
+            print(f"{concurrency:>7} {mode:>14} {throughput:8.0f} {p50 * 1e3:8.2f} {p99 * 1e3:8.2f} {mean_batch:6.1f}")
+
+
+if __name__ == '__main__':
+    main()
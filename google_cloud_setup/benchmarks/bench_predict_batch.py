@@ -0,0 +1,52 @@
+import argparse
+import os
+import sys
+import time
+
+# Throughput of /predict (one request per URL) against /predict_batch at several batch sizes.
+# Run from the directory holding best_xgboost_model.joblib, or pass --model-dir.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from url_corpus import generate_urls
+
+
+def bench_single(client, urls):
+    start = time.perf_counter()
+    for url in urls:
+        client.post('/predict', json={'url': url})
+    return time.perf_counter() - start
+
+
+def bench_batch(client, urls, batch_size):
+    start = time.perf_counter()
+    for i in range(0, len(urls), batch_size):
+        client.post('/predict_batch', json={'urls': urls[i:i + batch_size]})
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model-dir', default='.')
+    parser.add_argument('--urls', type=int, default=8192)
+    parser.add_argument('--batch-sizes', default='1,16,256,4096')
+    args = parser.parse_args()
+
+    os.chdir(args.model_dir)
+    from app_gc import app
+    client = app.test_client()
+
+    # Only URLs with a hostname, so /predict does not fail on bare names
+    urls = [u for u in generate_urls(args.urls * 2) if '://' in u][:args.urls]
+
+    elapsed = bench_single(client, urls)
+    print(f"{'/predict':>22}: {len(urls) / elapsed:10.0f} urls/s")
+    for batch_size in [int(b) for b in args.batch_sizes.split(',')]:
+        elapsed = bench_batch(client, urls, batch_size)
+        print(f"{'/predict_batch n=' + str(batch_size):>22}: {len(urls) / elapsed:10.0f} urls/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+# Throughput of serve.py with 1..N workers under a closed-loop HTTP load, memory per worker
+# (RSS, PSS and private pages, from /proc/<pid>/smaps_rollup) and a check that the merged
+# Prometheus counters (verdict cache hits + misses, one per /predict) add up to the requests served.
+# Run from the directory holding best_xgboost_model.joblib, or pass --model-dir.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from url_corpus import generate_urls
+
+SERVE = os.path.join(os.path.dirname(HERE), 'serve.py')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def client(port, urls, seconds, results):
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        connection.request('POST', '/predict', json.dumps({'url': urls[done % len(urls)]}),
+                           {'Content-Type': 'application/json'})
+        connection.getresponse().read()
+        connection.close()
+        done += 1
+    results.put(done)
+
+
+def memory(pid):
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return fields['Rss'], fields['Pss'], fields['Private_Clean'] + fields['Private_Dirty']
+
+
+def wait_ready(port, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('POST', '/predict', '{"url": "http://example.com"}', {'Content-Type': 'application/json'})
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError('server did not start')
+
+
+def metric_total(metrics_port, names):
+    text = urllib.request.urlopen(f'http://127.0.0.1:{metrics_port}/metrics').read().decode()
+    return sum(float(line.split()[-1]) for line in text.splitlines() if line.split(' ')[0] in names)
+
+
+def run(workers, args, urls):
+    port, metrics_port = free_port(), free_port()
+    with tempfile.TemporaryDirectory() as metrics_dir:
+        env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=metrics_dir)
+        server = subprocess.Popen([sys.executable, SERVE, '--host', '127.0.0.1', '--port', str(port),
+                                   '--workers', str(workers), '--metrics-port', str(metrics_port),
+                                   '--warmup-rounds', '5'],
+                                  cwd=args.model_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_ready(port)
+            results = multiprocessing.Queue()
+            clients = [multiprocessing.Process(target=client, args=(port, urls[i::args.clients_per_worker * workers],
+                                                                     args.seconds, results))
+                       for i in range(args.clients_per_worker * workers)]
+            start = time.perf_counter()
+            for process in clients:
+                process.start()
+            requests = sum(results.get() for _ in clients)
+            elapsed = time.perf_counter() - start
+            for process in clients:
+                process.join()
+
+            # Workers are the processes that wrote metric files
+            pids = {int(name.rsplit('_', 1)[1].split('.')[0]) for name in os.listdir(metrics_dir)}
+            pids = [pid for pid in pids if pid != server.pid and os.path.exists(f'/proc/{pid}')]
+            usage = [memory(pid) for pid in pids]
+            counted = metric_total(metrics_port, {'verdict_cache_hits_total', 'verdict_cache_misses_total'})
+        finally:
+            server.terminate()
+            server.wait()
+    return requests / elapsed, usage, counted, requests
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model-dir', default='.')
+    parser.add_argument('--workers', default=','.join(str(2 ** i) for i in range(8) if 2 ** i <= os.cpu_count()))
+    parser.add_argument('--clients-per-worker', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+    args.model_dir = os.path.abspath(args.model_dir)
+
+    urls = [u for u in generate_urls(20000) if '://' in u]
+    print(f"{os.cpu_count()} CPUs")
+    print(f"{'workers':>7} {'req/s':>9} {'scaling':>8} {'RSS MiB':>8} {'PSS MiB':>8} {'private':>8} {'counted':>9}")
+    base = None
+    for workers in [int(w) for w in args.workers.split(',')]:
+        throughput, usage, counted, requests = run(workers, args, urls)
+        base = base or throughput / workers
+        rss, pss, private = (sum(u[i] for u in usage) / max(len(usage), 1) for i in range(3))
+        print(f"{workers:>7} {throughput:9.0f} {throughput / base:7.2f}x {rss:8.1f} {pss:8.1f} {private:8.1f} "
+              f"{counted:>4.0f}/{requests + 1}")
+
+
+if __name__ == '__main__':
+    main()
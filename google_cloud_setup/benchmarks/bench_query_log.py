@@ -0,0 +1,167 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+# Replays a dnsmasq query log into a file that query_log_classifier follows, at several times
+# the recorded rate, and reports how far the classification fell behind: for every name
+# classified, the time from when its first query line was written to when its batch was done.
+# The log is rotated (renamed and recreated) halfway through each replay, and every query
+# line written must come out of the pipeline, either classified or deduplicated.
+# Without --log a log is synthesized: Zipf-distributed names from the benchmark URL corpus at
+# --rate queries per second, each followed by the forwarded and reply lines dnsmasq writes.
+# Run from the directory holding best_xgboost_model.joblib, or pass --model-dir.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, HERE)
+
+from url_corpus import generate_urls
+
+TIME_FORMAT = '%b %d %H:%M:%S'
+
+
+def synthesize(queries, rate, zipf, seed=0):
+    # (offset seconds, line) pairs
+    from verdict_cache import normalize_hostname
+    names = sorted({h for h in map(normalize_hostname, generate_urls(queries, seed=seed)) if h})
+    rng = np.random.default_rng(seed)
+    ranks = rng.zipf(zipf, queries * 2)
+    ranks = ranks[ranks <= len(names)][:queries] - 1
+    order = rng.permutation(len(names))
+    log = []
+    for i, rank in enumerate(ranks):
+        name = names[order[rank]]
+        offset = i / rate
+        log.append((offset, f"dnsmasq[812]: query[{'AAAA' if i % 4 == 3 else 'A'}] {name} from 192.168.1.{i % 200 + 10}"))
+        log.append((offset, f"dnsmasq[812]: forwarded {name} to 8.8.8.8"))
+        log.append((offset, f"dnsmasq[812]: reply {name} is 93.184.216.{i % 250}"))
+    return log
+
+
+def read_log(path):
+    # Recorded lines, paced by their syslog timestamps (spread evenly within each second)
+    entries = []
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            try:
+                stamp = time.mktime(time.strptime(line[:15], TIME_FORMAT))
+            except ValueError:
+                continue
+            entries.append((stamp, line[16:]))
+    if not entries:
+        raise SystemExit(f"No timestamped lines in {path}")
+    seconds = np.array([stamp for stamp, _ in entries]) - entries[0][0]
+    _, starts, counts = np.unique(seconds, return_index=True, return_counts=True)
+    offsets = seconds.copy()
+    for start, count in zip(starts, counts):
+        offsets[start:start + count] += np.arange(count) / count
+    return [(float(offset), line) for offset, (_, line) in zip(offsets, entries)]
+
+
+def writer(path, log, speed, written, stop):
+    # Appends the lines on schedule; renames the log halfway through and starts a new one
+    start = time.monotonic()
+    f = open(path, 'a')
+    rotate_at = len(log) // 2
+    i = 0
+    while i < len(log):
+        now = time.monotonic()
+        due = start + log[i][0] / speed
+        if due > now:
+            time.sleep(min(due - now, 0.01))
+            continue
+        stamp = time.strftime(TIME_FORMAT)
+        lines = []
+        while i < len(log) and start + log[i][0] / speed <= now:
+            if i == rotate_at:
+                break
+            lines.append(f"{stamp} {log[i][1]}\n")
+            if ': query[' in log[i][1]:
+                name = log[i][1].split('] ', 1)[1].split(' ', 1)[0]
+                written.setdefault(name, now)
+            i += 1
+        f.write(''.join(lines))
+        f.flush()
+        if i == rotate_at:
+            f.close()
+            os.replace(path, path + '.1')
+            f = open(path, 'a')
+            rotate_at = -1
+    f.close()
+    stop.set()
+
+
+def replay(args, log, speed, query_types):
+    import app_gc
+    import query_log_classifier as qlc
+
+    app_gc.verdict_cache.invalidate()
+    queries = sum(1 for _, line in log if ': query[' in line and line.split('query[', 1)[1].split(']')[0] in query_types)
+    seen = [0]
+
+    def counted(names):
+        for name in names:
+            if name is not None:
+                seen[0] += 1
+            yield name
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'dnsmasq.log')
+        open(path, 'w').close()
+        written = {}
+        stop = threading.Event()
+        thread = threading.Thread(target=writer, args=(path, log, speed, written, stop))
+        lines = qlc.follow(path, args.poll_interval, from_start=True, stop=stop)
+        names = qlc.deduplicate(counted(qlc.query_names(lines)), args.window)
+        stages = qlc.classify(qlc.batches(names, args.batch_size, args.max_wait_ms / 1000), app_gc.classify_batch)
+        started = time.monotonic()
+        thread.start()
+        lags = []
+        classified = 0
+        for batch_names, _ in stages:
+            done = time.monotonic()
+            lags.extend(done - written[name] for name in batch_names)
+            classified += len(batch_names)
+        elapsed = time.monotonic() - started
+        thread.join()
+
+    lags = np.array(lags)
+    p50, p99 = np.percentile(lags, [50, 99]) if len(lags) else (float('nan'), float('nan'))
+    print(f"{speed:5g}x: {len(log) / elapsed:9.0f} lines/s, {seen[0] / elapsed:8.0f} queries/s, "
+          f"{classified} names classified, lag p50 {p50 * 1e3:7.1f} ms, p99 {p99 * 1e3:8.1f} ms, "
+          f"max {lags.max() * 1e3 if len(lags) else float('nan'):8.1f} ms"
+          + ('' if seen[0] == queries else f"  LOST {queries - seen[0]} of {queries} queries"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model-dir', default='.')
+    parser.add_argument('--log', help='recorded dnsmasq log (log-facility format); default: synthesized')
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--rate', type=float, default=200, help='queries per second of the synthesized log')
+    parser.add_argument('--zipf', type=float, default=1.2)
+    parser.add_argument('--speeds', default='1,4,16,64')
+    parser.add_argument('--window', type=float, default=300)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--max-wait-ms', type=float, default=200)
+    parser.add_argument('--poll-interval', type=float, default=0.05)
+    args = parser.parse_args()
+
+    log = read_log(args.log) if args.log else synthesize(args.queries, args.rate, args.zipf)
+    os.chdir(os.path.abspath(args.model_dir))
+    import query_log_classifier
+    duration = log[-1][0]
+    print(f"{len(log)} lines over {duration:.0f}s ({len(log) / max(duration, 1e-9):.0f} lines/s recorded)")
+    for speed in [float(s) for s in args.speeds.split(',')]:
+        replay(args, log, speed, query_log_classifier.QUERY_TYPES)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import os
+import sys
+import time
+
+# Per-call cost of extract_root_domain: the stock tldextract.extract, the pinned extractor
+# on hosts it has not seen, and the memoized path on repeated hosts.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import tldextract
+
+import feature_extraction
+from feature_extraction import extract_root_domain, tld_extractor
+from url_corpus import generate_urls
+
+
+def per_call(function, urls):
+    start = time.perf_counter()
+    for url in urls:
+        function(url)
+    return (time.perf_counter() - start) / len(urls) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--urls', type=int, default=100000)
+    args = parser.parse_args()
+
+    urls = generate_urls(args.urls)
+    tldextract.extract(urls[0])  # Let the stock extractor load its suffix list first
+
+    mismatches = sum(extract_root_domain(url) != '{0.domain}.{0.suffix}'.format(tld_extractor(url)) for url in urls)
+    feature_extraction._root_domains.clear()
+
+    print(f"tldextract.extract:          {per_call(tldextract.extract, urls):6.2f} us/call")
+    print(f"pinned extractor:            {per_call(tld_extractor, urls):6.2f} us/call")
+    print(f"extract_root_domain (cold):  {per_call(extract_root_domain, urls):6.2f} us/call")
+    print(f"extract_root_domain (warm):  {per_call(extract_root_domain, urls):6.2f} us/call")
+    print(f"memoized hosts:              {len(feature_extraction._root_domains)} of {len(urls)} URLs")
+    print(f"mismatches:                  {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
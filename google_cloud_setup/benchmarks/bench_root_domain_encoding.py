@@ -0,0 +1,54 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# Cost of encoding the root_domain feature: hash() (what serving used before) and MD5 per call,
+# and MD5 behind the per-host memo that feature extraction keeps. Also checks that the code of
+# a domain is the same in separate processes.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from feature_extraction import encode_url_root_domain, extract_root_domain
+from root_domain_encoding import encode_root_domain
+from url_corpus import generate_urls
+
+ENCODE_IN_CHILD = ("import sys; sys.path.insert(0, sys.argv[1]); from root_domain_encoding import encode_root_domain; "
+                   "print(hash('example.com') % 10 ** 8, encode_root_domain('example.com'))")
+
+
+def per_call(function, values):
+    start = time.perf_counter()
+    for value in values:
+        function(value)
+    return (time.perf_counter() - start) / len(values) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--queries', type=int, default=100000)
+    args = parser.parse_args()
+
+    urls = generate_urls(args.queries)
+    domains = [extract_root_domain(url) for url in urls]  # Also fills the memo
+    mismatches = sum(encode_url_root_domain(url) != encode_root_domain(domain) for url, domain in zip(urls, domains))
+
+    print(f"hash():               {per_call(lambda d: hash(d) % 10 ** 8, domains):6.2f} us/call")
+    print(f"md5:                  {per_call(encode_root_domain, domains):6.2f} us/call")
+    print(f"memoized, per URL:    {per_call(encode_url_root_domain, urls):6.2f} us/call")
+    print(f"mismatches:           {mismatches}")
+
+    children = {subprocess.run([sys.executable, '-c', ENCODE_IN_CHILD, os.path.dirname(HERE)],
+                               capture_output=True, text=True, check=True).stdout.split()[1] for _ in range(3)}
+    hashes = {subprocess.run([sys.executable, '-c', ENCODE_IN_CHILD, os.path.dirname(HERE)],
+                             capture_output=True, text=True, check=True).stdout.split()[0] for _ in range(3)}
+    print(f"across 3 processes:   md5 gives {len(children)} distinct code(s), hash() gives {len(hashes)}")
+    if mismatches or len(children) != 1:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
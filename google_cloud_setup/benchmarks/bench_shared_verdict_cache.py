@@ -0,0 +1,142 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+# Per-process VerdictCache against the shared-memory SharedVerdictCache:
+#   lookup latency of hits, misses and puts in one process, and lookups per second with
+#   1 to N processes reading the same table at once;
+#   hit rate when a Zipf-distributed hostname stream is spread over 1 to N workers, each
+#   looking up every hostname and caching it on a miss (the app's pattern);
+#   memory for the same number of entries.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from url_corpus import generate_urls
+from shared_verdict_cache import SharedVerdictCache
+from verdict_cache import VerdictCache, normalize_hostname
+
+FORK = multiprocessing.get_context('fork')
+
+
+def hostnames(n, seed=0):
+    return sorted({h for h in map(normalize_hostname, generate_urls(n, seed=seed)) if h})
+
+
+def latency(cache, keys, repeat):
+    # Nanoseconds per call of each operation, best of `repeat` passes over the keys
+    absent = [key + '.absent' for key in keys]
+    results = {}
+    for name, function, arguments in (('put', cache.put, [(key, False) for key in keys]),
+                                      ('hit', cache.get, [(key,) for key in keys]),
+                                      ('miss', cache.get, [(key,) for key in absent])):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for args in arguments:
+                function(*args)
+            best = min(best, time.perf_counter() - start)
+        results[name] = best / len(keys) * 1e9
+    return results
+
+
+def reader(cache, keys, seconds, results):
+    lookups = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for key in keys[:1000]:
+            cache.get(key)
+        lookups += 1000
+    results.put(lookups)
+
+
+def concurrent_lookups(cache, keys, processes, seconds):
+    results = FORK.Queue()
+    readers = [FORK.Process(target=reader, args=(cache, keys[i::processes], seconds, results))
+               for i in range(processes)]
+    for process in readers:
+        process.start()
+    total = sum(results.get() for _ in readers)
+    for process in readers:
+        process.join()
+    return total / seconds
+
+
+def worker(make_cache, shared_cache, stream, results):
+    # A worker's share of the request stream: look up, cache on a miss
+    cache = shared_cache if shared_cache is not None else make_cache()
+    hits = 0
+    for key in stream:
+        if cache.get(key) is None:
+            cache.put(key, False)
+        else:
+            hits += 1
+    results.put(hits)
+
+
+def hit_rate(kind, size, stream, workers):
+    shared = SharedVerdictCache(size) if kind == 'shared' else None
+    results = FORK.Queue()
+    processes = [FORK.Process(target=worker, args=(lambda: VerdictCache(size), shared, stream[i::workers], results))
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    hits = sum(results.get() for _ in processes)
+    for process in processes:
+        process.join()
+    return hits / len(stream)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=100000, help='cache entries')
+    parser.add_argument('--hosts', type=int, default=200000, help='URLs to draw the hostname population from')
+    parser.add_argument('--requests', type=int, default=200000)
+    parser.add_argument('--zipf', type=float, default=1.1)
+    parser.add_argument('--max-workers', type=int, default=max(4, os.cpu_count() or 1))
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    population = hostnames(args.hosts)
+    print(f"{len(population)} distinct hostnames, cache of {args.size} entries")
+    worker_counts = sorted({1, 2, 4, args.max_workers} | {n for n in (8, 16) if n <= args.max_workers})
+
+    print("\nLookup latency (ns per call), single process")
+    keys = population[:min(len(population), args.size // 2)]
+    for kind, cache in (('local', VerdictCache(args.size)), ('shared', SharedVerdictCache(args.size))):
+        timings = latency(cache, keys, args.repeat)
+        print(f"{kind:>7}: " + ', '.join(f"{name} {ns:6.0f}" for name, ns in timings.items()))
+        if kind == 'shared':
+            for processes in worker_counts:
+                rate = concurrent_lookups(cache, keys, processes, args.seconds)
+                print(f"{'':>9}{processes:2d} processes reading: {rate:12,.0f} lookups/s")
+
+    print(f"\nHit rate, Zipf({args.zipf}) stream of {args.requests} requests spread over the workers")
+    rng = np.random.default_rng(0)
+    ranks = rng.zipf(args.zipf, args.requests * 2)
+    ranks = ranks[ranks <= len(population)][:args.requests] - 1
+    stream = [population[r] for r in rng.permutation(len(population))[ranks]]
+    for workers in worker_counts:
+        local = hit_rate('local', args.size, stream, workers)
+        shared = hit_rate('shared', args.size, stream, workers)
+        print(f"{workers:2d} workers: per-process caches {local * 100:5.1f}%, shared cache {shared * 100:5.1f}%")
+
+    tracemalloc.start()
+    cache = VerdictCache(args.size)
+    for key in population[:args.size]:
+        cache.put(key, False)
+    local_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"\nMemory for {min(args.size, len(population))} entries: per-process cache {local_bytes / 2 ** 20:.1f} MiB "
+          f"in every worker, shared table {SharedVerdictCache(args.size).nbytes / 2 ** 20:.1f} MiB once")
+
+
+if __name__ == '__main__':
+    main()
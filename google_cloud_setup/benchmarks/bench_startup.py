@@ -0,0 +1,63 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+# Cold start: time from launching the Flask app in a fresh process to its first answered
+# /predict. Run from the directory holding best_xgboost_model.joblib, or pass --model-dir.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+
+SERVER = ("import os, sys; os.chdir(sys.argv[1]); sys.path.insert(0, sys.argv[2]); "
+          "from app_gc import app; app.run(host='127.0.0.1', port=int(sys.argv[3]))")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def first_answer(model_dir, timeout):
+    port = free_port()
+    request = urllib.request.Request(f'http://127.0.0.1:{port}/predict', method='POST',
+                                     data=json.dumps({'url': 'http://www.example.com/index.html'}).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', SERVER, model_dir, APP_DIR, str(port)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    response.read()
+                return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                if process.poll() is not None:
+                    raise RuntimeError(f'app exited with {process.returncode}')
+                time.sleep(0.01)
+        raise TimeoutError(f'no answer within {timeout}s')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model-dir', default='.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=60)
+    args = parser.parse_args()
+
+    times = sorted(first_answer(os.path.abspath(args.model_dir), args.timeout) for _ in range(args.runs))
+    print(f"start to first /predict: min {times[0]:.2f}s  median {times[len(times) // 2]:.2f}s  max {times[-1]:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# Benchmark suite with machine-readable results, so runs can be diffed and regressions caught.
+#   micro      per-URL time of every feature helper and of extract_features
+#   inference  model latency per call and throughput at several batch sizes
+#   load       replays a URL stream against /predict at a set rate and concurrency and reports
+#              throughput, p50/p99/p99.9 latency and errors
+#   all        the three above
+#   compare    diffs two result files and exits 1 when a result got worse than --threshold
+# Every part runs locally on the synthetic corpus (or --urls-file); `load` starts the app on
+# a free local port unless --target is given. Results go to --output as JSON:
+#   {"suite": ..., "environment": {...}, "config": {...},
+#    "results": [{"name", "value", "unit", "better": "lower" | "higher"}, ...]}
+# Run from the directory holding best_xgboost_model.joblib, or pass --model-dir.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, HERE)
+
+from url_corpus import generate_urls
+
+SERVER = ("import os, sys; os.chdir(sys.argv[1]); sys.path.insert(0, sys.argv[2]); "
+          "from app_gc import app; app.run(host='127.0.0.1', port=int(sys.argv[3]), threaded=True)")
+
+
+def result(name, value, unit, better='lower'):
+    return {'name': name, 'value': float(value), 'unit': unit, 'better': better}
+
+
+def load_urls(args):
+    if args.urls_file:
+        with open(args.urls_file) as f:
+            urls = [line.strip() for line in f if line.strip()]
+    else:
+        urls = generate_urls(args.urls, seed=args.seed)
+    # Only URLs with a hostname: the helpers and /predict fail on bare names by design
+    return [u for u in urls if '://' in u][:args.urls]
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=APP_DIR, capture_output=True,
+                                text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def best_seconds_per_item(function, items, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            function(item)
+        best = min(best, time.perf_counter() - start)
+    return best / len(items)
+
+
+# micro
+
+def run_micro(args, urls):
+    import feature_extraction as fe
+
+    row = np.empty(fe.NUM_FEATURES, dtype=float)
+    functions = {
+        'count_chars': lambda u: fe.count_chars(u, '.'),
+        'count_non_alphanumeric': fe.count_non_alphanumeric,
+        'count_digits': fe.count_digits,
+        'count_letters': fe.count_letters,
+        'count_params': fe.count_params,
+        'has_php': fe.has_php,
+        'has_html': fe.has_html,
+        'has_at_symbol': fe.has_at_symbol,
+        'has_double_slash': fe.has_double_slash,
+        'has_http': fe.has_http,
+        'has_https': fe.has_https,
+        'secure_http': fe.secure_http,
+        'have_ip_address': fe.have_ip_address,
+        'has_subdomain': fe.has_subdomain,
+        'root_domain_uncached': fe._tld_root_domain,
+        'extract_root_domain': fe.extract_root_domain,  # Memoized per host after the first pass
+        'extract_features_reference': fe.extract_features_reference,
+        'extract_features_single_pass': lambda u: fe.extract_features_single_pass(u, row),
+        'extract_features': fe.extract_features,
+    }
+    results = []
+    for name, function in functions.items():
+        seconds = best_seconds_per_item(function, urls, args.repeat)
+        results.append(result(f'micro.{name}', seconds * 1e9, 'ns/url'))
+        print(f"{name:>30}: {seconds * 1e9:10.0f} ns/url")
+    start = time.perf_counter()
+    fe.extract_features_batch(urls)
+    seconds = (time.perf_counter() - start) / len(urls)
+    results.append(result('micro.extract_features_batch', seconds * 1e9, 'ns/url'))
+    print(f"{'extract_features_batch':>30}: {seconds * 1e9:10.0f} ns/url")
+    return results
+
+
+# inference
+
+def load_models(model_dir):
+    import joblib
+    from tree_ensemble import TreeEnsemble
+    models = {'joblib': joblib.load(os.path.join(model_dir, 'best_xgboost_model.joblib'))}
+    export = os.path.join(model_dir, 'best_xgboost_model.npz')
+    if os.path.exists(export):
+        models['npz'] = TreeEnsemble.load(export)
+    return models
+
+
+def run_inference(args, urls):
+    from feature_extraction import extract_features_batch
+
+    X, _, _ = extract_features_batch(urls)
+    results = []
+    for kind, model in load_models(args.model_dir).items():
+        for batch_size in [int(b) for b in args.batch_sizes.split(',')]:
+            batch_size = min(batch_size, len(X))
+            timings = []
+            start = 0
+            deadline = time.perf_counter() + args.min_seconds
+            while time.perf_counter() < deadline or len(timings) < 5:
+                t = time.perf_counter()
+                model.predict(X[start:start + batch_size])
+                timings.append(time.perf_counter() - t)
+                start = (start + batch_size) % (len(X) - batch_size + 1)
+            latency = float(np.median(timings))
+            results.append(result(f'inference.{kind}.batch_{batch_size}.latency', latency * 1e6, 'us'))
+            results.append(result(f'inference.{kind}.batch_{batch_size}.throughput', batch_size / latency,
+                                  'rows/s', 'higher'))
+            print(f"{kind:>6} batch {batch_size:>6}: {latency * 1e6:10.1f} us/call {batch_size / latency:12.0f} rows/s")
+    return results
+
+
+# load
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(model_dir):
+    port = free_port()
+    server = subprocess.Popen([sys.executable, '-c', SERVER, os.path.abspath(model_dir), APP_DIR, str(port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 120
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server, f'127.0.0.1:{port}'
+        except OSError:
+            if time.monotonic() > deadline or server.poll() is not None:
+                server.kill()
+                raise RuntimeError('server did not start')
+            time.sleep(0.2)
+
+
+def post(target, url, timeout):
+    host, port = target.rsplit(':', 1)
+    connection = http.client.HTTPConnection(host, int(port), timeout=timeout)
+    try:
+        connection.request('POST', '/predict', json.dumps({'url': url}), {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def load_client(target, urls, interval, offset, duration, timeout, results):
+    # Open loop when interval > 0: request k is due at offset + k * interval, and its latency
+    # counts from when it was due, so a slow server is not hidden by clients slowing down
+    latencies, errors = [], {}
+    start = time.perf_counter()
+    k = 0
+    while True:
+        due = start + offset + k * interval if interval else time.perf_counter()
+        if due - start >= duration:
+            break
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            status = post(target, urls[k % len(urls)], timeout)
+            if status != 200:
+                errors[f'http_{status}'] = errors.get(f'http_{status}', 0) + 1
+        except (OSError, http.client.HTTPException) as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+        latencies.append(time.perf_counter() - due)
+        k += 1
+    results.put((latencies, errors, time.perf_counter() - start))
+
+
+def run_load(args, urls):
+    server = None
+    target = args.target
+    if not target:
+        server, target = start_server(args.model_dir)
+    try:
+        for url in urls[:50]:
+            post(target, url, args.timeout)  # Warm-up, not counted
+        interval = args.concurrency / args.rate if args.rate else 0
+        results = multiprocessing.Queue()
+        clients = [multiprocessing.Process(target=load_client, args=(
+            target, urls[i::args.concurrency], interval, i * interval / args.concurrency, args.duration,
+            args.timeout, results)) for i in range(args.concurrency)]
+        for process in clients:
+            process.start()
+        outcomes = [results.get() for _ in clients]
+        for process in clients:
+            process.join()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    latencies = np.concatenate([np.asarray(latencies, dtype=float) for latencies, _, _ in outcomes])
+    errors = {}
+    for _, client_errors, _ in outcomes:
+        for kind, count in client_errors.items():
+            errors[kind] = errors.get(kind, 0) + count
+    elapsed = max(seconds for _, _, seconds in outcomes)
+    p50, p99, p999 = np.percentile(latencies, [50, 99, 99.9]) * 1e3
+    error_count = sum(errors.values())
+    print(f"{len(latencies)} requests in {elapsed:.1f}s: {len(latencies) / elapsed:.0f} req/s, "
+          f"p50 {p50:.2f} ms, p99 {p99:.2f} ms, p99.9 {p999:.2f} ms, {error_count} errors {errors or ''}")
+    return [
+        result('load.throughput', len(latencies) / elapsed, 'req/s', 'higher'),
+        result('load.latency_p50', p50, 'ms'),
+        result('load.latency_p99', p99, 'ms'),
+        result('load.latency_p99_9', p999, 'ms'),
+        result('load.error_rate', error_count / len(latencies), 'ratio'),
+    ]
+
+
+# compare
+
+def compare(old_path, new_path, threshold):
+    with open(old_path) as f:
+        old = {r['name']: r for r in json.load(f)['results']}
+    with open(new_path) as f:
+        new = {r['name']: r for r in json.load(f)['results']}
+    regressions = 0
+    for name in sorted(old.keys() & new.keys()):
+        before, after = old[name]['value'], new[name]['value']
+        change = (after - before) / before if before else 0.0
+        worse = change > threshold if new[name]['better'] == 'lower' else change < -threshold
+        regressions += worse
+        print(f"{name:>48}: {before:12.2f} -> {after:12.2f} {new[name]['unit']:<7} {change * 100:+7.1f}%"
+              f"{'  REGRESSION' if worse else ''}")
+    for name in sorted(old.keys() ^ new.keys()):
+        print(f"{name:>48}: only in {'old' if name in old else 'new'}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('part', choices=['micro', 'inference', 'load', 'all', 'compare'])
+    parser.add_argument('files', nargs='*', help='compare: old.json new.json')
+    parser.add_argument('--model-dir', default='.')
+    parser.add_argument('--output')
+    parser.add_argument('--urls', type=int, default=20000)
+    parser.add_argument('--urls-file', help='one URL per line instead of the synthetic corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--batch-sizes', default='1,8,64,512,4096')
+    parser.add_argument('--min-seconds', type=float, default=0.5)
+    parser.add_argument('--target', help='host:port of a running app; by default one is started')
+    parser.add_argument('--rate', type=float, default=0, help='requests per second, 0 for as fast as possible')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.part == 'compare':
+        if len(args.files) != 2:
+            parser.error('compare needs two result files')
+        return compare(*args.files, args.threshold)
+
+    args.model_dir = os.path.abspath(args.model_dir)
+    os.chdir(args.model_dir)
+    urls = load_urls(args)
+    results = []
+    for part, run in (('micro', run_micro), ('inference', run_inference), ('load', run_load)):
+        if args.part in (part, 'all'):
+            results += run(args, urls)
+
+    report = {'suite': args.part, 'environment': environment(),
+              'config': {k: v for k, v in vars(args).items() if k not in ('part', 'files', 'output')},
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# model.predict (xgboost) against the exported NumPy TreeEnsemble: agreement on feature rows
+# from the synthetic corpus, then latency per call and throughput at several batch sizes.
+# Run from the directory holding best_xgboost_model.joblib, or pass --model-dir.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import joblib
+
+from feature_extraction import extract_features_batch
+from tree_ensemble import TreeEnsemble, export_model
+from url_corpus import generate_urls
+
+
+def time_calls(predict, X, batch_size, min_seconds):
+    # Median seconds per call over repeated calls on consecutive slices of X
+    timings = []
+    start = 0
+    deadline = time.perf_counter() + min_seconds
+    while time.perf_counter() < deadline or len(timings) < 5:
+        batch = X[start:start + batch_size]
+        t = time.perf_counter()
+        predict(batch)
+        timings.append(time.perf_counter() - t)
+        start = (start + batch_size) % (len(X) - batch_size + 1)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model-dir', default='.')
+    parser.add_argument('--urls', type=int, default=50000)
+    parser.add_argument('--batch-sizes', default='1,10,100,1000,10000')
+    parser.add_argument('--seconds', type=float, default=1.0)
+    args = parser.parse_args()
+
+    model = joblib.load(os.path.join(args.model_dir, 'best_xgboost_model.joblib'))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'model.npz')
+        export_model(model, path)
+        ensemble = TreeEnsemble.load(path)
+        size = os.path.getsize(path)
+
+    X, _, _ = extract_features_batch(generate_urls(args.urls, seed=7))
+    mismatches = int((ensemble.predict(X) != model.predict(X)).sum())
+    print(f"export:      {len(ensemble)} trees, depth {ensemble.depth}, {size / 1024:.0f} KiB")
+    print(f"agreement:   {len(X) - mismatches}/{len(X)} rows")
+
+    print(f"{'batch':>7} {'xgboost':>22} {'numpy':>22} {'speedup':>8}")
+    for batch_size in [int(b) for b in args.batch_sizes.split(',')]:
+        xgb = time_calls(model.predict, X, batch_size, args.seconds)
+        npy = time_calls(ensemble.predict, X, batch_size, args.seconds)
+        print(f"{batch_size:>7} {xgb * 1e6:9.0f} us {batch_size / xgb:8.0f}/s {npy * 1e6:9.0f} us {batch_size / npy:8.0f}/s "
+              f"{xgb / npy:7.2f}x")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
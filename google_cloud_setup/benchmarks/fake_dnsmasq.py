@@ -0,0 +1,31 @@
+import os
+import signal
+import sys
+import time
+
+# Stand-in for dnsmasq in local runs: re-reads the hosts file on every SIGHUP, the way
+# dnsmasq re-reads addn-hosts, and prints what it saw when it is terminated.
+# Usage: python fake_dnsmasq.py /path/to/hosts.blocklist
+
+path = sys.argv[1]
+reloads = 0
+entries = 0
+
+
+def on_hup(signum, frame):
+    global reloads, entries
+    reloads += 1
+    with open(path) as f:
+        entries = sum(1 for line in f if line.strip())
+
+
+def on_term(signum, frame):
+    print(f"reloads={reloads} entries={entries}", flush=True)
+    sys.exit(0)
+
+
+signal.signal(signal.SIGHUP, on_hup)
+signal.signal(signal.SIGTERM, on_term)
+print(os.getpid(), flush=True)
+while True:
+    time.sleep(3600)
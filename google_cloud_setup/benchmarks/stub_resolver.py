@@ -0,0 +1,46 @@
+import asyncio
+import struct
+
+# Minimal upstream resolver for local runs: every A query is answered with ANSWER_ADDRESS,
+# every other type with an empty NOERROR, after an optional artificial delay.
+
+ANSWER_ADDRESS = bytes([192, 0, 2, 1])
+
+
+def answer(query):
+    question_end = 12
+    while query[question_end]:
+        question_end += query[question_end] + 1
+    question_end += 5
+    qtype = struct.unpack_from('!H', query, question_end - 4)[0]
+    flags = 0x8180 | (struct.unpack_from('!H', query, 2)[0] & 0x0100)
+    if qtype == 1:
+        record = struct.pack('!HHHIH', 0xC00C, 1, 1, 300, 4) + ANSWER_ADDRESS
+    else:
+        record = b''
+    header = struct.pack('!HHHHHH', struct.unpack_from('!H', query)[0], flags, 1, 1 if record else 0, 0, 0)
+    return header + query[12:question_end] + record
+
+
+class StubResolver(asyncio.DatagramProtocol):
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.transport = None
+        self.queries = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.queries += 1
+        if self.delay:
+            asyncio.get_running_loop().call_later(self.delay, self.transport.sendto, answer(data), addr)
+        else:
+            self.transport.sendto(answer(data), addr)
+
+
+async def start_stub_resolver(host='127.0.0.1', port=0, delay=0.0):
+    # Returns (transport, protocol, (host, port)) of a running stub resolver
+    transport, protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+        lambda: StubResolver(delay), local_addr=(host, port))
+    return transport, protocol, transport.get_extra_info('sockname')[:2]
@@ -0,0 +1,47 @@
+import random
+import string
+
+# Deterministic synthetic URL corpus for the benchmarks.
+# The mix roughly follows malicious_phish.csv: mostly http/https URLs, some bare hostnames,
+# a few IP hosts, query strings and php/html paths.
+
+SCHEMES = [('http://', 0.45), ('https://', 0.40), ('', 0.15)]
+SUFFIXES = ['com', 'net', 'org', 'de', 'co.uk', 'com.br', 'io', 'ru', 'info', 'gov.au']
+WORDS = ['login', 'secure', 'account', 'update', 'bank', 'mail', 'cdn', 'static', 'news',
+         'shop', 'paypal', 'verify', 'images', 'api', 'docs', 'wp-admin', 'index', 'home']
+PAGES = ['index.php', 'login.html', 'view.php', 'default.aspx', 'page.htm', '']
+
+
+def _host(rng):
+    if rng.random() < 0.03:
+        return '.'.join(str(rng.randint(1, 254)) for _ in range(4))
+    labels = [rng.choice(WORDS) for _ in range(rng.choice([0, 0, 1, 1, 2]))]
+    labels.append(''.join(rng.choice(string.ascii_lowercase + string.digits + '-')
+                          for _ in range(rng.randint(4, 14))).strip('-') or 'example')
+    return '.'.join(labels) + '.' + rng.choice(SUFFIXES)
+
+
+def _scheme(rng):
+    r = rng.random()
+    for scheme, weight in SCHEMES:
+        if r < weight:
+            return scheme
+        r -= weight
+    return SCHEMES[-1][0]
+
+
+def generate_urls(n, seed=0):
+    rng = random.Random(seed)
+    urls = []
+    for _ in range(n):
+        url = _scheme(rng) + _host(rng)
+        if rng.random() < 0.7:
+            path = [rng.choice(WORDS) for _ in range(rng.randint(0, 4))]
+            url += '/' + '/'.join(path + [rng.choice(PAGES)])
+        if rng.random() < 0.25:
+            params = [f"{rng.choice(WORDS)}={rng.randint(0, 99999)}" for _ in range(rng.randint(1, 4))]
+            url += '?' + '&'.join(params)
+        if rng.random() < 0.01:
+            url = url.replace('://', '://user@', 1)
+        urls.append(url)
+    return urls
@@ -0,0 +1,189 @@
+import logging
+import os
+import selectors
+import socket
+import struct
+import threading
+
+# Compact protocol for resolver-to-classifier calls, next to the HTTP/JSON endpoints.
+# Connections are persistent (Unix domain socket or TCP) and requests may be pipelined:
+# a client can send any number of requests before reading, and responses come back in order.
+#   request   u32 body length, then the body: u8 opcode (OP_CLASSIFY) and, per hostname,
+#             u8 length + the name in ASCII
+#   response  u32 body length, then the body: u8 status (STATUS_OK) and one verdict byte per
+#             hostname, in request order; on an error, a non-zero status and a UTF-8 message
+# Verdict byte: bit 0 set when the name is malicious, bits 1-2 the path that decided it
+# (SOURCES), or VERDICT_ERROR when the name could not be classified.
+# The server reads whatever the socket holds and answers every complete request in it with
+# one classify call, so pipelined single-name requests are scored together. The client side
+# only needs socket and struct, see classifier_client.py.
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('!I')
+OP_CLASSIFY = 1
+STATUS_OK = 0
+STATUS_BAD_REQUEST = 1
+STATUS_SERVER_ERROR = 2
+MAX_FRAME = 1 << 20
+MAX_NAME = 255
+MALICIOUS = 1
+SOURCES = ('model', 'cache', 'allowlist', 'blocklist')
+SOURCE_CODES = {source: code << 1 for code, source in enumerate(SOURCES)}
+VERDICT_ERROR = 0xFF
+RECV_SIZE = 1 << 16
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def encode_request(hostnames):
+    parts = [bytes([OP_CLASSIFY])]
+    for hostname in hostnames:
+        name = hostname.encode('ascii')
+        if len(name) > MAX_NAME:
+            raise ProtocolError(f'hostname longer than {MAX_NAME} bytes')
+        parts.append(bytes([len(name)]))
+        parts.append(name)
+    body = b''.join(parts)
+    return HEADER.pack(len(body)) + body
+
+
+def decode_request(body):
+    if not body or body[0] != OP_CLASSIFY:
+        raise ProtocolError(f'unknown opcode {body[0] if body else None}')
+    hostnames = []
+    offset = 1
+    while offset < len(body):
+        end = offset + 1 + body[offset]
+        if end > len(body):
+            raise ProtocolError('truncated hostname')
+        hostnames.append(body[offset + 1:end].decode('ascii', 'replace'))
+        offset = end
+    return hostnames
+
+
+def encode_response(verdicts):
+    return HEADER.pack(len(verdicts) + 1) + bytes([STATUS_OK]) + bytes(verdicts)
+
+
+def encode_error(status, message):
+    body = bytes([status]) + message.encode('utf-8')
+    return HEADER.pack(len(body)) + body
+
+
+def verdict_byte(result):
+    # From a result of app_gc.classify_batch
+    if 'error' in result:
+        return VERDICT_ERROR
+    return SOURCE_CODES[result['source']] | (MALICIOUS if result['malicious'] else 0)
+
+
+def split_frames(buffer):
+    # Complete frame bodies at the start of the buffer, and how many bytes they take
+    frames = []
+    offset = 0
+    while len(buffer) - offset >= HEADER.size:
+        (length,) = HEADER.unpack_from(buffer, offset)
+        if length > MAX_FRAME:
+            raise ProtocolError(f'frame of {length} bytes is over the {MAX_FRAME} byte limit')
+        if len(buffer) - offset - HEADER.size < length:
+            break
+        frames.append(bytes(buffer[offset + HEADER.size:offset + HEADER.size + length]))
+        offset += HEADER.size + length
+    return frames, offset
+
+
+class BinaryServer:
+    # Listens on a Unix socket and/or a TCP address; classify(hostnames) returns one verdict
+    # byte per hostname. The sockets are bound on creation and served once start() is called,
+    # so serve.py binds them in the master and every forked worker serves them.
+
+    def __init__(self, classify, unix_path=None, tcp_address=None):
+        self.classify = classify
+        self.listeners = []
+        if unix_path:
+            if os.path.exists(unix_path):
+                os.unlink(unix_path)  # Left over from a previous run
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            listener.bind(unix_path)
+            listener.listen(128)
+            self.listeners.append(listener)
+        if tcp_address:
+            self.listeners.append(socket.create_server(tcp_address, backlog=128))
+        for listener in self.listeners:
+            listener.setblocking(False)
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._accept_loop, name='binary-protocol', daemon=True)
+        self._thread.start()
+
+    def _accept_loop(self):
+        selector = selectors.DefaultSelector()
+        for listener in self.listeners:
+            selector.register(listener, selectors.EVENT_READ)
+        while True:
+            for key, _ in selector.select():
+                try:
+                    connection, _ = key.fileobj.accept()
+                except BlockingIOError:
+                    continue  # Another worker took it
+                connection.setblocking(True)
+                if connection.family != socket.AF_UNIX:
+                    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                threading.Thread(target=self._serve_connection, args=(connection,), daemon=True).start()
+
+    def _serve_connection(self, connection):
+        buffer = bytearray()
+        try:
+            while True:
+                data = connection.recv(RECV_SIZE)
+                if not data:
+                    return
+                buffer += data
+                try:
+                    frames, used = split_frames(buffer)
+                except ProtocolError as e:
+                    connection.sendall(encode_error(STATUS_BAD_REQUEST, str(e)))
+                    return
+                if not frames:
+                    continue
+                del buffer[:used]
+                connection.sendall(self._answer(frames))
+        except OSError:
+            pass
+        finally:
+            connection.close()
+
+    def _answer(self, frames):
+        # All complete requests at once: one classify call for every hostname in them
+        requests = []
+        hostnames = []
+        for body in frames:
+            try:
+                names = decode_request(body)
+            except ProtocolError as e:
+                requests.append(e)
+                continue
+            requests.append(len(names))
+            hostnames.extend(names)
+        failure = None
+        try:
+            verdicts = self.classify(hostnames) if hostnames else []
+        except Exception as e:
+            logger.exception('Classification failed')
+            failure = encode_error(STATUS_SERVER_ERROR, str(e))
+        # One response per request, in order; malformed ones keep their own error
+        responses = []
+        offset = 0
+        for request in requests:
+            if isinstance(request, ProtocolError):
+                responses.append(encode_error(STATUS_BAD_REQUEST, str(request)))
+            elif failure is not None:
+                responses.append(failure)
+            else:
+                responses.append(encode_response(verdicts[offset:offset + request]))
+                offset += request
+        return b''.join(responses)
@@ -0,0 +1,237 @@
+import fcntl
+import logging
+import os
+import re
+import shlex
+import subprocess
+import tempfile
+import threading
+import time
+
+from prometheus_client import Counter, Histogram
+
+from domain_lists import parse_list_line
+
+# Publishes newly detected malicious domains to the dnsmasq hosts.blocklist.
+# Detections are deduplicated and collected for `window` seconds after the first one, then
+# the whole batch is written with one atomic file replacement and one reload signal.
+# Several processes (e.g. serve.py workers) can publish to the same file: updates are made
+# under an exclusive lock on <path>.lock and skip domains another process already wrote.
+# They also share the reloads: <path>.reloaded records the file a reload was last sent for,
+# and when. A process skips the reload when that was the current file, and holds it back
+# until the window has passed since the last one, so dnsmasq gets at most one per window.
+# Only valid hostnames are queued (valid_hostname): a domain comes from a client's URL, and
+# anything else in it could add other names to a hosts-file line.
+
+logger = logging.getLogger(__name__)
+
+PUBLISH_BATCH_SIZE = Histogram('blocklist_publish_batch_size', 'Domains written per blocklist update',
+                               buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+PUBLISH_SECONDS = Histogram('blocklist_publish_seconds', 'Time to write the blocklist and signal the reload')
+RELOADS = Counter('blocklist_reloads_total', 'Reload signals sent to dnsmasq')
+RELOADS_AVOIDED = Counter('blocklist_reloads_avoided_total', 'Domains published without a reload of their own')
+DUPLICATES = Counter('blocklist_duplicates_total', 'Detections of domains that were already published or pending')
+REJECTED = Counter('blocklist_rejected_total', 'Detections dropped because the domain is not a valid hostname')
+
+# dnsmasq re-reads addn-hosts files on SIGHUP
+DEFAULT_RELOAD_COMMAND = 'pkill -HUP -x dnsmasq'
+
+# Letters, digits and hyphens, 1-63 characters per label, no hyphen at either end
+LABEL_PATTERN = re.compile(r'[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?')
+MAX_HOSTNAME_LENGTH = 253
+
+
+def valid_hostname(domain):
+    # The domain as written to the hosts file (lower-cased, IDNA-encoded when not ASCII), or
+    # None when it is no valid hostname
+    if not isinstance(domain, str):
+        return None
+    if not domain.isascii():
+        try:
+            domain = domain.encode('idna').decode('ascii')
+        except UnicodeError:
+            return None
+    domain = domain.lower()
+    if not 0 < len(domain) <= MAX_HOSTNAME_LENGTH:
+        return None
+    if not all(LABEL_PATTERN.fullmatch(label) for label in domain.split('.')):
+        return None
+    return domain
+
+
+class BlocklistPublisher:
+    def __init__(self, path, window=5.0, reload_command=DEFAULT_RELOAD_COMMAND, sink_address='0.0.0.0'):
+        # reload_command is a shell-style string, an argv list, or a callable
+        self.path = path
+        self.window = window
+        self.reload_command = shlex.split(reload_command) if isinstance(reload_command, str) else reload_command
+        self.sink_address = sink_address
+        self._published = self._read_published()
+        self._pending = []
+        self._pending_set = set()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._unsignalled = 0  # Domains this process wrote that no reload of its own covered yet
+        self._thread = None
+        self._start_thread()
+
+    def _start_thread(self):
+        self._thread = threading.Thread(target=self._run, name='blocklist-publisher', daemon=True)
+        self._thread.start()
+
+    def _read_published(self):
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, encoding='utf-8', errors='replace') as f:
+            return {domain for domain in map(parse_list_line, f) if domain}
+
+    def publish(self, domain):
+        # Queues a domain for the next batch; returns False for duplicates and invalid hostnames
+        hostname = valid_hostname(domain)
+        if hostname is None:
+            REJECTED.inc()
+            logger.debug(f"Not publishing {domain!r}: not a valid hostname")
+            return False
+        domain = hostname
+        with self._condition:
+            if domain in self._published or domain in self._pending_set:
+                DUPLICATES.inc()
+                return False
+            self._pending.append(domain)
+            self._pending_set.add(domain)
+            if not self._thread.is_alive():
+                self._start_thread()  # A forked worker does not inherit the parent's thread
+            self._condition.notify()
+        return True
+
+    def stop(self):
+        # Flushes whatever is pending and stops the background thread; a reload held back by the
+        # window is still sent, so this can take up to `window` seconds
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self):
+        reload_due = None  # When a reload held back by the window may be sent (time.monotonic)
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped and reload_due is None:
+                    self._condition.wait()
+                if not self._pending and reload_due is None:
+                    return
+                # Keep collecting until the window that started with the first detection ends
+                deadline = time.monotonic() + self.window if reload_due is None else reload_due
+                while (not self._stopped or reload_due is not None) and time.monotonic() < deadline:
+                    self._condition.wait(deadline - time.monotonic())
+                batch = self._pending
+                self._pending = []
+                self._pending_set = set()
+                self._published.update(batch)
+            try:
+                reload_due = self._flush(batch)
+            except OSError as e:
+                logger.error(f"Publishing {len(batch)} domains to {self.path} failed: {e}")
+                with self._condition:
+                    self._published.difference_update(batch)
+                    for domain in batch:
+                        if domain not in self._pending_set:
+                            self._pending.append(domain)
+                            self._pending_set.add(domain)
+                if self._stopped:
+                    return
+                time.sleep(self.window)
+
+    def _flush(self, batch):
+        # Writes the batch and reloads dnsmasq if due; returns when a held-back reload is due
+        start = time.perf_counter()
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            batch = self._write(batch) if batch else []
+            self._unsignalled += len(batch)
+            delay = self._reload_if_due()
+        if batch:
+            PUBLISH_SECONDS.observe(time.perf_counter() - start)
+            PUBLISH_BATCH_SIZE.observe(len(batch))
+            logger.info(f"Published {len(batch)} domains to {self.path}")
+        return time.monotonic() + delay if delay else None
+
+    def _reload_if_due(self):
+        # Called under the lock. Reloads unless a reload (by any process) already covered the
+        # current file, or one was sent less than `window` ago; returns the seconds until then,
+        # or 0.
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return 0
+        # A write replaces the file, so its inode changes with every update
+        current = f"{stat.st_ino} {stat.st_size} {stat.st_mtime_ns}"
+        stamp_path = self.path + '.reloaded'
+        try:
+            with open(stamp_path) as f:
+                reloaded = f.read()
+            since = time.time() - os.stat(stamp_path).st_mtime
+        except FileNotFoundError:
+            reloaded, since = None, self.window
+        if reloaded == current:
+            RELOADS_AVOIDED.inc(self._unsignalled)
+            self._unsignalled = 0
+            return 0
+        if 0 <= since < self.window:
+            return self.window - since
+        self._reload()
+        with open(stamp_path, 'w') as f:
+            f.write(current)
+        RELOADS_AVOIDED.inc(max(self._unsignalled - 1, 0))
+        self._unsignalled = 0
+        return 0
+
+    def _write(self, batch):
+        # Appends the domains of `batch` not in the file yet; returns the ones written
+        content = b''
+        mode = 0o644
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as existing:
+                content = existing.read()
+            mode = os.stat(self.path).st_mode & 0o777
+        listed = {domain for domain in map(parse_list_line, content.decode('utf-8', 'replace').splitlines()) if domain}
+        self._published.update(listed)
+        new = [domain for domain in batch if domain not in listed]
+        if len(new) < len(batch):
+            DUPLICATES.inc(len(batch) - len(new))
+        if not new:
+            return new
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(self.path) + '.')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                out.write(content)
+                if content and not content.endswith(b'\n'):
+                    out.write(b'\n')
+                out.write(''.join(f"{self.sink_address} {domain}\n" for domain in new).encode())
+                out.flush()
+                os.fsync(out.fileno())
+            os.chmod(temp_path, mode)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return new
+
+    def _reload(self):
+        if not self.reload_command:
+            return
+        # The file is already in place, so a failed reload is only logged; the next one picks it up
+        try:
+            if callable(self.reload_command):
+                self.reload_command()
+            else:
+                result = subprocess.run(self.reload_command, capture_output=True, timeout=30)
+                if result.returncode != 0:
+                    logger.warning(f"Reload command {self.reload_command} exited with {result.returncode}: "
+                                   f"{result.stderr.decode(errors='replace').strip()}")
+        except Exception as e:
+            logger.error(f"Reload command {self.reload_command} failed: {e}")
+        RELOADS.inc()
@@ -0,0 +1,50 @@
+import numpy as np
+
+# Two-tier classifier: a cheap first-stage model in front of the full one.
+# The first stage is a binary model (benign / malicious) over the same feature rows, trained
+# by the cascade stage of the training pipeline (ML Model/url_training/cascade.py). Rows it is
+# sure about are decided by it alone: a malicious probability below `low` is benign, one of
+# `high` or above is malicious. Only the rows in between go to the full model, in one call.
+# predict() returns 0 for benign rows; rows the first stage finds malicious get 1 and the
+# others the full model's class, so callers that only tell 0 from non-zero (app_gc) see one
+# verdict either way. Needs NumPy only, so the training pipeline measures this same code.
+
+MALICIOUS_LABEL = 1
+
+
+class CascadeModel:
+    def __init__(self, first_stage, full_model, low=0.05, high=0.95, on_route=None):
+        # on_route(decided, escalated): row counts of each call, e.g. for metrics
+        if not 0 <= low <= high:
+            raise ValueError(f"Invalid uncertainty band [{low}, {high})")
+        self.first_stage = first_stage
+        self.full_model = full_model
+        self.low = low
+        self.high = high
+        self.on_route = on_route
+
+    def route(self, X):
+        # Labels decided by the first stage, and the indices of the rows it leaves to the full model
+        probability = self.first_stage.predict_proba(X)[:, 1]
+        labels = np.where(probability >= self.high, MALICIOUS_LABEL, 0)
+        return labels, np.flatnonzero((probability >= self.low) & (probability < self.high))
+
+    def predict(self, X):
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        labels, uncertain = self.route(X)
+        if len(uncertain) == len(X):
+            labels = np.asarray(self.full_model.predict(X))
+        elif len(uncertain):
+            labels[uncertain] = self.full_model.predict(X[uncertain])
+        if self.on_route is not None:
+            self.on_route(len(X) - len(uncertain), len(uncertain))
+        return labels
+
+    def set_params(self, **params):
+        # Passed on to both stages (ModelRegistry.limit_threads sets n_jobs)
+        for model in (self.first_stage, self.full_model):
+            if hasattr(model, 'set_params'):
+                model.set_params(**params)
+        return self
@@ -0,0 +1,109 @@
+import socket
+
+from binary_protocol import (HEADER, MALICIOUS, SOURCES, STATUS_OK, VERDICT_ERROR, ProtocolError,
+                             encode_request)
+
+# Client of the binary protocol (binary_protocol.py), for resolver-side code:
+#   with ClassifierClient('/run/url-classifier.sock') as client:    # or ('10.0.0.5', 5001)
+#       client.classify(['example.com', 'login.example.net'])      # -> [Verdict, Verdict]
+#       client.classify_many(batches)                              # pipelined, one list per batch
+# One persistent connection per client; a client is not thread-safe. A connection the server
+# closed (e.g. a recycled worker) is reopened once before a call fails.
+
+
+class Verdict(int):
+    # The verdict byte of one hostname
+    __slots__ = ()
+
+    @property
+    def error(self):
+        return self == VERDICT_ERROR
+
+    @property
+    def malicious(self):
+        return not self.error and bool(self & MALICIOUS)
+
+    @property
+    def source(self):
+        return None if self.error else SOURCES[self >> 1]
+
+    def __repr__(self):
+        return 'Verdict(error)' if self.error else f'Verdict(malicious={self.malicious}, source={self.source!r})'
+
+
+def parse_address(address):
+    # A path for a Unix socket, (host, port) or 'host:port' for TCP
+    if isinstance(address, tuple):
+        return socket.AF_INET6 if ':' in address[0] else socket.AF_INET, address
+    if address.startswith('/') or address.startswith('.'):
+        return socket.AF_UNIX, address
+    host, _, port = address.rpartition(':')
+    host = host.strip('[]')
+    return socket.AF_INET6 if ':' in host else socket.AF_INET, (host, int(port))
+
+
+class ClassifierClient:
+    def __init__(self, address, timeout=5.0):
+        self.family, self.address = parse_address(address)
+        self.timeout = timeout
+        self._socket = None
+        self._buffer = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def connect(self):
+        self.close()
+        self._socket = socket.socket(self.family, socket.SOCK_STREAM)
+        self._socket.settimeout(self.timeout)
+        if self.family != socket.AF_UNIX:
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._socket.connect(self.address)
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        self._buffer.clear()
+
+    def _read_frame(self):
+        while True:
+            if len(self._buffer) >= HEADER.size:
+                (length,) = HEADER.unpack_from(self._buffer)
+                if len(self._buffer) >= HEADER.size + length:
+                    body = bytes(self._buffer[HEADER.size:HEADER.size + length])
+                    del self._buffer[:HEADER.size + length]
+                    return body
+            data = self._socket.recv(1 << 16)
+            if not data:
+                raise ConnectionResetError('classifier closed the connection')
+            self._buffer += data
+
+    def _exchange(self, requests):
+        # Sends every request, then reads the responses in order
+        if self._socket is None:
+            self.connect()
+        self._socket.sendall(b''.join(requests))
+        responses = []
+        for _ in requests:
+            body = self._read_frame()
+            if body[0] != STATUS_OK:
+                self.close()  # The rest of the responses are not read: start clean next time
+                raise ProtocolError(f"classifier error {body[0]}: {body[1:].decode('utf-8', 'replace')}")
+            responses.append([Verdict(v) for v in body[1:]])
+        return responses
+
+    def classify_many(self, batches):
+        # Verdicts for every batch of hostnames, sent as pipelined requests on one connection
+        requests = [encode_request(hostnames) for hostnames in batches]
+        try:
+            return self._exchange(requests)
+        except (ConnectionError, BrokenPipeError):
+            self.connect()
+            return self._exchange(requests)
+
+    def classify(self, hostnames):
+        return self.classify_many([hostnames])[0]
@@ -0,0 +1,350 @@
+import argparse
+import asyncio
+import logging
+import secrets
+import socket
+import struct
+
+from prometheus_client import Counter
+
+# In-process DNS front-end: replaces the dns_filter.sh curl/jq/dig chain.
+# Queries are parsed here, the queried name is classified with the same extract_features
+# and model as /predict, blocked names get a sinkhole answer and everything else is
+# forwarded to the upstream resolver over a small pool of reused UDP sockets.
+# Classification runs in an executor thread, so a slow model call does not hold up the other
+# queries on the event loop. Against spoofed upstream replies, upstream query IDs come from
+# `secrets`, and each pooled socket is replaced by one on a new ephemeral source port after
+# `rotate_after` queries.
+
+logger = logging.getLogger(__name__)
+
+DNS_QUERIES = Counter('dns_queries_total', 'DNS queries answered by the front-end', ['action'])
+
+QTYPE_A = 1
+QTYPE_AAAA = 28
+RCODE_FORMERR = 1
+RCODE_SERVFAIL = 2
+RCODE_NOTIMP = 4
+
+FLAG_QR = 0x8000
+FLAG_RA = 0x0080
+# Opcode, RD and CD are copied from the query into the response
+FLAGS_ECHOED = 0x7910
+
+# The feature extractor needs a URL with a hostname part
+QUERY_URL_FORMAT = 'http://{}'
+
+
+class DnsFormatError(ValueError):
+    pass
+
+
+def parse_query(data):
+    # Returns (query_id, flags, qname, qtype, qclass, question_end) for a single-question query
+    if len(data) < 12:
+        raise DnsFormatError('message shorter than the DNS header')
+    query_id, flags, qdcount = struct.unpack_from('!HHH', data)
+    if flags & FLAG_QR:
+        raise DnsFormatError('message is a response')
+    if qdcount != 1:
+        raise DnsFormatError(f'expected one question, got {qdcount}')
+    labels = []
+    offset = 12
+    while True:
+        if offset >= len(data):
+            raise DnsFormatError('truncated question name')
+        length = data[offset]
+        offset += 1
+        if length == 0:
+            break
+        if length & 0xC0 or offset + length > len(data):
+            raise DnsFormatError('invalid label in question name')
+        labels.append(data[offset:offset + length].decode('latin-1'))
+        offset += length
+    if offset + 4 > len(data) or offset - 12 > 255:
+        raise DnsFormatError('truncated question')
+    qtype, qclass = struct.unpack_from('!HH', data, offset)
+    return query_id, flags, '.'.join(labels), qtype, qclass, offset + 4
+
+
+def build_response(query, question_end, rcode, answer=b''):
+    # Response echoing the query's ID and question, with at most one answer record
+    query_id, flags = struct.unpack_from('!HH', query)
+    flags = FLAG_QR | (flags & FLAGS_ECHOED) | FLAG_RA | rcode
+    header = struct.pack('!HHHHHH', query_id, flags, 1 if question_end else 0, 1 if answer else 0, 0, 0)
+    return header + query[12:question_end] + answer
+
+
+def sinkhole_record(qtype, ttl):
+    # A/AAAA record pointing at the unspecified address; the name is a pointer to the question
+    if qtype == QTYPE_A:
+        rdata = bytes(4)
+    elif qtype == QTYPE_AAAA:
+        rdata = bytes(16)
+    else:
+        return b''
+    return struct.pack('!HHHIH', 0xC00C, qtype, 1, ttl, len(rdata)) + rdata
+
+
+class _UpstreamProtocol(asyncio.DatagramProtocol):
+    # One connected UDP socket to the upstream; replies are matched to queries by ID
+
+    def __init__(self):
+        self.transport = None
+        self.pending = {}
+        self.queries = 0
+        self.retired = False
+
+    def release(self, upstream_id):
+        # Done with a query; a retired socket is closed after its last one
+        self.pending.pop(upstream_id, None)
+        if self.retired and not self.pending:
+            self.transport.close()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < 12:
+            return
+        future = self.pending.pop(struct.unpack_from('!H', data)[0], None)
+        if future is not None and not future.done():
+            future.set_result(data)
+
+    def error_received(self, exc):
+        logger.warning(f"Upstream socket error: {exc}")
+
+    def connection_lost(self, exc):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError('upstream socket closed'))
+        self.pending.clear()
+
+
+class _UdpServerProtocol(asyncio.DatagramProtocol):
+    def __init__(self, frontend):
+        self.frontend = frontend
+        self.transport = None
+        self.tasks = set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        task = asyncio.ensure_future(self._answer(data, addr))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _answer(self, data, addr):
+        response = await self.frontend.handle(data)
+        if response is not None:
+            self.transport.sendto(response, addr)
+
+
+class DnsFrontend:
+    def __init__(self, classify, upstream, pool_size=4, timeout=2.0, sinkhole_ttl=60, rotate_after=100,
+                 executor=None):
+        # classify(url) -> True when the name must be blocked; it runs in `executor` (the
+        # loop's default one when None), so it must be thread-safe
+        self.classify = classify
+        self.upstream = upstream
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.sinkhole_ttl = sinkhole_ttl
+        self.rotate_after = rotate_after
+        self.executor = executor
+        self._pool = []
+        self._inflight = {}
+        self._servers = []
+        self._tcp_writers = set()
+
+    async def start(self, host, port):
+        loop = asyncio.get_running_loop()
+        self._pool = [await self._open_upstream() for _ in range(self.pool_size)]
+
+        udp_transport, _ = await loop.create_datagram_endpoint(
+            lambda: _UdpServerProtocol(self), local_addr=(host, port))
+        # Bind TCP to the same port as UDP (matters when port 0 picked a free one)
+        port = udp_transport.get_extra_info('sockname')[1]
+        tcp_server = await asyncio.start_server(self._serve_tcp, host, port)
+        self._servers = [udp_transport, tcp_server]
+        return port
+
+    async def close(self):
+        for server in self._servers:
+            server.close()
+        # Open TCP connections end their read loop once their transport is closed
+        for writer in list(self._tcp_writers):
+            writer.close()
+        await asyncio.sleep(0)
+        for protocol in self._pool:
+            protocol.transport.close()
+        self._pool = []
+
+    async def handle(self, data, tcp=False):
+        # Answer for one raw DNS message, or None when it is not worth a reply
+        try:
+            _, flags, qname, qtype, qclass, question_end = parse_query(data)
+        except DnsFormatError:
+            if len(data) < 12 or data[2] & 0x80:
+                return None
+            DNS_QUERIES.labels(action='error').inc()
+            return build_response(data, 0, RCODE_FORMERR)
+        if flags & 0x7800:
+            DNS_QUERIES.labels(action='error').inc()
+            return build_response(data, question_end, RCODE_NOTIMP)
+
+        if qname and await asyncio.get_running_loop().run_in_executor(self.executor, self.is_blocked, qname):
+            DNS_QUERIES.labels(action='blocked').inc()
+            return build_response(data, question_end, 0, sinkhole_record(qtype, self.sinkhole_ttl))
+
+        DNS_QUERIES.labels(action='forwarded').inc()
+        try:
+            return await self.forward(data, qname, qtype, qclass, question_end, tcp)
+        except (asyncio.TimeoutError, ConnectionError, OSError) as e:
+            logger.warning(f"Upstream query for {qname} failed: {e!r}")
+            return build_response(data, question_end, RCODE_SERVFAIL)
+
+    def is_blocked(self, qname):
+        try:
+            return self.classify(QUERY_URL_FORMAT.format(qname.rstrip('.')))
+        except (AttributeError, TypeError, ValueError, TimeoutError) as e:
+            # Names the feature extractor cannot handle, or not classified in time, are resolved normally
+            logger.debug(f"Could not classify {qname}: {e}")
+            return False
+
+    async def forward(self, query, qname, qtype, qclass, question_end, tcp=False):
+        # Identical queries that are in flight together share one upstream round trip
+        flags = struct.unpack_from('!H', query, 2)[0]
+        key = (tcp, flags & FLAGS_ECHOED, qname.lower(), qtype, qclass, query[question_end:])
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._query_upstream_tcp(query) if tcp else self._query_upstream(query))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        response = await asyncio.shield(future)
+
+        # Give each waiter its own ID and the question exactly as it asked it
+        if response[12:question_end].lower() == query[12:question_end].lower():
+            return query[:2] + response[2:12] + query[12:question_end] + response[question_end:]
+        return query[:2] + response[2:]
+
+    async def _open_upstream(self):
+        # The kernel picks the connected socket's source port from its randomized ephemeral range
+        _, protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+            _UpstreamProtocol, remote_addr=self.upstream)
+        return protocol
+
+    async def _upstream_socket(self):
+        # A random pooled socket; one that has sent rotate_after queries is replaced first
+        index = secrets.randbelow(len(self._pool))
+        protocol = self._pool[index]
+        if protocol.queries >= self.rotate_after:
+            replacement = await self._open_upstream()
+            if self._pool[index] is protocol:
+                self._pool[index] = replacement
+                protocol.retired = True
+                if not protocol.pending:
+                    protocol.transport.close()
+            else:
+                replacement.transport.close()  # Another query replaced it meanwhile
+            protocol = self._pool[index]
+        protocol.queries += 1
+        return protocol
+
+    async def _query_upstream(self, query):
+        protocol = await self._upstream_socket()
+        upstream_id = secrets.randbits(16)
+        while upstream_id in protocol.pending:
+            upstream_id = secrets.randbits(16)
+        future = asyncio.get_running_loop().create_future()
+        protocol.pending[upstream_id] = future
+        try:
+            protocol.transport.sendto(struct.pack('!H', upstream_id) + query[2:])
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            protocol.release(upstream_id)
+
+    async def _query_upstream_tcp(self, query):
+        # TCP clients are usually retrying a truncated answer, so they get a TCP round trip upstream
+        async def round_trip():
+            reader, writer = await asyncio.open_connection(*self.upstream)
+            try:
+                writer.write(struct.pack('!H', len(query)) + query)
+                await writer.drain()
+                length = struct.unpack('!H', await reader.readexactly(2))[0]
+                return await reader.readexactly(length)
+            finally:
+                writer.close()
+        try:
+            return await asyncio.wait_for(round_trip(), self.timeout)
+        except asyncio.IncompleteReadError as e:
+            raise ConnectionError('upstream closed the TCP connection') from e
+
+    async def _serve_tcp(self, reader, writer):
+        # Length-prefixed messages, answered in order, until the client goes quiet
+        self._tcp_writers.add(writer)
+        try:
+            while True:
+                length = struct.unpack('!H', await asyncio.wait_for(reader.readexactly(2), 30))[0]
+                data = await reader.readexactly(length)
+                response = await self.handle(data, tcp=True)
+                if response is None:
+                    break
+                writer.write(struct.pack('!H', len(response)) + response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            self._tcp_writers.discard(writer)
+            writer.close()
+
+
+def parse_address(value, default_port):
+    host, _, port = value.rpartition(':')
+    if not host:
+        return value, default_port
+    return host.strip('[]'), int(port)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--listen', default='0.0.0.0:53')
+    parser.add_argument('--upstream', default='8.8.8.8:53')
+    parser.add_argument('--pool-size', type=int, default=4)
+    parser.add_argument('--timeout', type=float, default=2.0)
+    parser.add_argument('--sinkhole-ttl', type=int, default=60)
+    parser.add_argument('--rotate-after', type=int, default=100,
+                        help='upstream queries per pooled socket before it moves to a new source port')
+    parser.add_argument('--metrics-port', type=int, default=8001)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from prometheus_client import start_http_server
+    from app_gc import classify, MALICIOUS_URL_COUNTER  # Loads the model
+
+    def classify_and_count(url):
+        malicious = classify(url)
+        if malicious:
+            MALICIOUS_URL_COUNTER.inc()
+            logger.info(f"Malicious URL detected: {url}")
+        return malicious
+
+    upstream_host, upstream_port = parse_address(args.upstream, 53)
+    upstream = (socket.gethostbyname(upstream_host), upstream_port)
+    frontend = DnsFrontend(classify_and_count, upstream, args.pool_size, args.timeout, args.sinkhole_ttl,
+                           args.rotate_after)
+
+    async def serve():
+        host, port = parse_address(args.listen, 53)
+        port = await frontend.start(host, port)
+        logger.info(f"DNS front-end listening on {host}:{port}, upstream {upstream[0]}:{upstream[1]}")
+        await asyncio.Event().wait()
+
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+    asyncio.run(serve())
+
+
+if __name__ == '__main__':
+    main()
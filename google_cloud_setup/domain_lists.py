@@ -0,0 +1,111 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+# Allow/block lists evaluated before feature extraction.
+# Each list is compiled into a sorted array of 64-bit BLAKE2b digests of its domains (8 bytes
+# per entry, so tens of millions of entries stay small). A cryptographic hash, so nobody can
+# make up a name whose fingerprint is that of a listed one and skip classification.
+# An entry "example.com" matches example.com and every name below it: a lookup fingerprints
+# the queried name and each of its parent domains and binary-searches all of them at once.
+
+# Named after the fingerprint, so indexes compiled with another one are not loaded
+INDEX_SUFFIX = '.blake2b.idx.npy'
+ALLOW = 0
+BLOCK = 1
+LIST_NAMES = ('allowlist', 'blocklist')
+# Appended to the merged index so a binary search never runs past the end; fingerprints are
+# capped below it
+SENTINEL = np.uint64(2 ** 64 - 1)
+MAX_FINGERPRINT = 2 ** 64 - 2
+
+
+def fingerprint(domain):
+    data = domain.encode('utf-8', 'surrogatepass')
+    return min(int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little'), MAX_FINGERPRINT)
+
+
+def fingerprints(domains):
+    return np.array([fingerprint(domain) for domain in domains], dtype=np.uint64)
+
+
+def suffixes(hostname):
+    # hostname, then every parent domain up to the TLD
+    result = [hostname]
+    dot = hostname.find('.')
+    while dot != -1:
+        result.append(hostname[dot + 1:])
+        dot = hostname.find('.', dot + 1)
+    return result
+
+
+def parse_list_line(line):
+    # Accepts plain domains, "*.domain", ".domain" and hosts-file lines ("0.0.0.0 domain")
+    line = line.split('#', 1)[0].strip()
+    if not line:
+        return None
+    fields = line.split()
+    domain = fields[1] if len(fields) > 1 else fields[0]
+    domain = domain.lower().lstrip('*').strip('.')
+    return domain or None
+
+
+def compile_list(path):
+    # Sorted unique fingerprints of a list file. The compiled array is saved next to the
+    # list and memory-mapped on later loads, as long as it is newer than the list.
+    index_path = path + INDEX_SUFFIX
+    if os.path.exists(index_path) and os.path.getmtime(index_path) > os.path.getmtime(path):
+        return np.load(index_path, mmap_mode='r').view(np.ndarray)
+    with open(path, encoding='utf-8', errors='replace') as f:
+        domains = (domain for domain in map(parse_list_line, f) if domain)
+        compiled = np.unique(np.fromiter(map(fingerprint, domains), dtype=np.uint64))
+    try:
+        np.save(index_path, compiled)
+    except OSError:
+        pass  # Read-only list directory: the list is compiled again on the next load
+    return compiled
+
+
+class DomainLists:
+    # Allowlist and blocklist merged into one sorted fingerprint array, plus a parallel array
+    # saying which list each entry came from. reload() builds new arrays and swaps them in.
+
+    def __init__(self, allowlist_path=None, blocklist_path=None):
+        self.allowlist_path = allowlist_path
+        self.blocklist_path = blocklist_path
+        self._index = (np.array([SENTINEL]), np.array([BLOCK], dtype=np.uint8))
+        self._reload_lock = threading.Lock()
+        self.reload()
+
+    def __len__(self):
+        return len(self._index[0]) - 1
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self._index)
+
+    def reload(self):
+        with self._reload_lock:
+            allow = compile_list(self.allowlist_path) if self.allowlist_path else np.empty(0, dtype=np.uint64)
+            block = compile_list(self.blocklist_path) if self.blocklist_path else np.empty(0, dtype=np.uint64)
+            # A domain on both lists is allowed
+            block = block[~np.isin(block, allow, assume_unique=True)]
+            merged = np.concatenate([allow, block, np.array([SENTINEL])])
+            kinds = np.concatenate([np.full(len(allow), ALLOW, np.uint8), np.full(len(block) + 1, BLOCK, np.uint8)])
+            order = np.argsort(merged, kind='stable')
+            self._index = (merged[order], kinds[order])
+        return {'allowlist': len(allow), 'blocklist': len(block)}
+
+    def lookup(self, hostname):
+        # 'allowlist', 'blocklist' or None; the most specific listed suffix decides
+        listed, kinds = self._index
+        if not hostname or len(listed) == 1:
+            return None
+        values = fingerprints(suffixes(hostname))
+        positions = listed.searchsorted(values)
+        hits = listed[positions] == values
+        if not hits.any():
+            return None
+        return LIST_NAMES[kinds[positions[hits.argmax()]]]
@@ -1,7 +1,37 @@
+import os
+import threading
 import numpy as np
 from urllib.parse import urlparse
 import ipaddress
 import tldextract
+from tldextract.remote import lenient_netloc
+from root_domain_encoding import encode_root_domain
+
+NUM_FEATURES = 17
+# Column names of the feature rows, in order (the names the training pipeline gives them)
+FEATURE_NAMES = ('root_domain', 'Has_subdomain', 'Count_dots', 'Count_dashes', 'Count_underscores', 'Count_slashes',
+                 'Count_ques', 'Count_non_alphanumeric', 'Count_digits', 'Count_letters', 'Count_params', 'Has_php',
+                 'Has_html', 'Has_at_symbol', 'Has_http', 'have_ip', 'HTTPS_token')
+# Features taken from the walk over the URL's characters
+CHARACTER_FEATURES = frozenset({'Count_dots', 'Count_dashes', 'Count_underscores', 'Count_slashes', 'Count_ques',
+                                'Count_non_alphanumeric', 'Count_digits', 'Count_letters', 'Has_at_symbol'})
+
+# Pinned Public Suffix List shipped next to this file. Root domains are computed from it
+# alone, so tldextract never tries to download the list on the first request.
+PUBLIC_SUFFIX_LIST_PATH = os.environ.get(
+    'PUBLIC_SUFFIX_LIST_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'public_suffix_list.dat'))
+ROOT_DOMAIN_CACHE_SIZE = int(os.environ.get('ROOT_DOMAIN_CACHE_SIZE', 100000))
+
+def load_tld_extractor(path=PUBLIC_SUFFIX_LIST_PATH):
+    extractor = tldextract.TLDExtract(
+        cache_dir=None, suffix_list_urls=('file://' + os.path.abspath(path),), fallback_to_snapshot=False)
+    extractor('example.com')  # Build the suffix lookup now rather than on the first request
+    return extractor
+
+tld_extractor = load_tld_extractor()
+# host -> (root domain, encoded root domain); lookups read it without the lock, changes take it
+_root_domains = {}
+_root_domains_lock = threading.Lock()
 
 def count_chars(url, char):
     return url.count(char)
@@ -49,17 +79,67 @@ def have_ip_address(url):
         pass  # Invalid hostname or IP address
     return 0
 
-def extract_root_domain(url):
-    extracted = tldextract.extract(url)
+def _remember_root_domain(host, entry):
+    with _root_domains_lock:
+        if len(_root_domains) >= ROOT_DOMAIN_CACHE_SIZE:
+            _root_domains.pop(next(iter(_root_domains), None), None)  # Drop the oldest entry
+        _root_domains[host] = entry
+
+def _tld_root_domain(url):
+    extracted = tld_extractor(url)
     return f"{extracted.domain}.{extracted.suffix}"
 
+def _root_domain_entry(url):
+    # Memoized per host; the host is taken from the URL exactly as tldextract takes it
+    host = lenient_netloc(url)
+    entry = _root_domains.get(host)
+    if entry is None:
+        root_domain = _tld_root_domain(url)
+        entry = (root_domain, encode_root_domain(root_domain))
+        _remember_root_domain(host, entry)
+    return entry
+
+def extract_root_domain(url):
+    return _root_domain_entry(url)[0]
+
+def encode_url_root_domain(url):
+    # The root_domain feature: same value in every process and in training
+    return _root_domain_entry(url)[1]
+
+class FeatureSchema:
+    # The columns a model takes, in its order: a subset of FEATURE_NAMES, from the feature
+    # manifest shipped with a compacted model. Extraction skips the root-domain lookup, the
+    # character walk and the IP check when none of the columns needs them.
+
+    def __init__(self, names=FEATURE_NAMES):
+        unknown = [name for name in names if name not in FEATURE_NAMES]
+        if unknown:
+            raise ValueError(f"Features not computed here: {', '.join(unknown)}")
+        self.names = tuple(names)
+        self.columns = [FEATURE_NAMES.index(name) for name in self.names]
+        self.full = self.names == FEATURE_NAMES
+        self.root_domain = 'root_domain' in self.names
+        self.characters = not CHARACTER_FEATURES.isdisjoint(self.names)
+        self.ip = 'have_ip' in self.names
+
+    def __len__(self):
+        return len(self.names)
+
+    def __eq__(self, other):
+        return isinstance(other, FeatureSchema) and self.names == other.names
+
+    def __hash__(self):
+        return hash(self.names)
+
+FULL_SCHEMA = FeatureSchema()
+
 def has_subdomain(url):
     domain_parts = urlparse(url).hostname.split('.')
     return 1 if len(domain_parts) > 2 else 0
 
-def extract_features(url):
+def extract_features_reference(url):
     return np.array([[
-        hash(extract_root_domain(url)) % (10 ** 8),  # root_domain as hashed integer
+        encode_root_domain(extract_root_domain(url)),  # root_domain as hashed integer
         has_subdomain(url),  # Has_subdomain
         count_chars(url, '.'),  # Count_dots
         count_chars(url, '-'),  # Count_dashes
@@ -77,3 +157,119 @@ def extract_features(url):
         have_ip_address(url),  # have_ip
         has_https(url)  # HTTPS_token
     ]], dtype=float)  # Ensure all features are float
+
+def encode_batch_root_domains(urls):
+    # root_domain feature of each URL (None where it cannot be computed here). Hosts not
+    # memoized yet are encoded once each, however many of the URLs share them.
+    codes = [None] * len(urls)
+    misses = {}
+    for i, url in enumerate(urls):
+        try:
+            host = lenient_netloc(url)
+        except (AttributeError, TypeError):
+            continue
+        entry = _root_domains.get(host)
+        if entry is not None:
+            codes[i] = entry[1]
+        elif host in misses:
+            misses[host][1].append(i)
+        else:
+            try:
+                misses[host] = (_tld_root_domain(url), [i])
+            except (AttributeError, TypeError, ValueError):
+                continue
+    if misses:
+        for host, (root_domain, indices) in misses.items():
+            code = encode_root_domain(root_domain)
+            _remember_root_domain(host, (root_domain, code))
+            for i in indices:
+                codes[i] = code
+    return codes
+
+def extract_features_single_pass(url, out=None, root_domain_code=None, schema=FULL_SCHEMA):
+    # Same 17 features as extract_features_reference, but the URL is parsed once and the
+    # character counts come from a single walk over the string, written into `out`
+    # (a preallocated row of length 17, e.g. one row of a batch matrix).
+    # root_domain_code skips the root-domain lookup when the caller already has it.
+    # With a schema, only its columns are computed and written, in its order.
+    if out is None:
+        out = np.empty(len(schema), dtype=float)
+    parsed = urlparse(url)
+    hostname = parsed.hostname
+    query = parsed.query
+
+    dots = dashes = underscores = slashes = ques = at_symbols = 0
+    digits = letters = non_alphanumeric = 0
+    for char in (url if schema.characters else ''):
+        if char.isalpha():
+            letters += 1
+        elif char.isdigit():
+            digits += 1
+        elif not char.isalnum():
+            non_alphanumeric += 1
+            if char == '.':
+                dots += 1
+            elif char == '/':
+                slashes += 1
+            elif char == '-':
+                dashes += 1
+            elif char == '_':
+                underscores += 1
+            elif char == '?':
+                ques += 1
+            elif char == '@':
+                at_symbols += 1
+
+    # Only strings that could be an IP literal are handed to ipaddress
+    have_ip = 0
+    if schema.ip and hostname and (hostname[-1].isdigit() or ':' in hostname):
+        try:
+            ipaddress.ip_address(hostname)
+            have_ip = 1
+        except ValueError:
+            pass
+
+    if not schema.root_domain:
+        root_domain_code = 0
+    row = (
+        encode_url_root_domain(url) if root_domain_code is None else root_domain_code,  # root_domain as hashed integer
+        hostname.count('.') > 1,  # Has_subdomain (fails like has_subdomain without a hostname)
+        dots,  # Count_dots
+        dashes,  # Count_dashes
+        underscores,  # Count_underscores
+        slashes,  # Count_slashes
+        ques,  # Count_ques
+        non_alphanumeric,  # Count_non_alphanumeric
+        digits,  # Count_digits
+        letters,  # Count_letters
+        query.count('&') + 1 if query else 0,  # Count_params
+        'php' in url,  # Has_php
+        'html' in url,  # Has_html
+        at_symbols > 0,  # Has_at_symbol
+        parsed.scheme == 'http',  # Has_http
+        have_ip,  # have_ip
+        parsed.scheme == 'https'  # HTTPS_token
+    )
+    out[:] = row if schema.full else [row[column] for column in schema.columns]
+    return out
+
+def extract_features(url, root_domain_code=None, schema=FULL_SCHEMA):
+    features = np.empty((1, len(schema)), dtype=float)
+    extract_features_single_pass(url, features[0], root_domain_code, schema)
+    return features
+
+def extract_features_batch(urls, schema=FULL_SCHEMA):
+    # One N x 17 matrix (N x len(schema)) for every URL that could be featurized, in input order.
+    # Rows that fail are left out of the matrix and reported by their index instead.
+    features = np.empty((len(urls), len(schema)), dtype=float)
+    valid = []
+    errors = {}
+    root_domain_codes = encode_batch_root_domains(urls) if schema.root_domain else [0] * len(urls)
+    for i, url in enumerate(urls):
+        try:
+            extract_features_single_pass(url, features[len(valid)], root_domain_codes[i], schema)
+        except (AttributeError, TypeError, ValueError) as e:
+            errors[i] = f"{type(e).__name__}: {e}"
+            continue
+        valid.append(i)
+    return features[:len(valid)], valid, errors
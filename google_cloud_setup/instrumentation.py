@@ -0,0 +1,171 @@
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Request instrumentation for app_gc: per-stage latency histograms, a request counter by
+# verdict and deciding path, model-load and memory gauges, and an opt-in stack sampler.
+# Stage timing is a chain of perf_counter() marks: each mark observes the time since the
+# previous one under the stage name it is given. With STAGE_METRICS=0 the timer's marks do
+# nothing, and with PROFILE_SAMPLE_RATE unset the sampler is never created.
+
+STAGES = ('parse', 'lists', 'cache', 'root_domain', 'features', 'model', 'batch', 'serialize')
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+STAGE_SECONDS = Histogram('predict_stage_seconds', 'Time spent in each stage of a request', ['stage'],
+                          buckets=LATENCY_BUCKETS)
+REQUEST_SECONDS = Histogram('predict_request_seconds', 'Time to answer a request', ['endpoint'],
+                            buckets=LATENCY_BUCKETS)
+PREDICTIONS = Counter('predictions_total', 'URLs classified, by verdict and by the path that decided it',
+                      ['verdict', 'source'])
+MODEL_LOAD_SECONDS = Gauge('model_load_seconds', 'Time taken to load the model at startup', multiprocess_mode='max')
+PEAK_MEMORY = Gauge('process_peak_resident_memory_bytes', 'Peak resident memory of the process',
+                    multiprocess_mode='liveall')
+
+# Children are looked up once, labels() is too slow for every request
+_STAGE_CHILDREN = {stage: STAGE_SECONDS.labels(stage) for stage in STAGES}
+_REQUEST_CHILDREN = {}
+_PREDICTION_CHILDREN = {}
+
+
+def count_prediction(malicious, source):
+    child = _PREDICTION_CHILDREN.get((malicious, source))
+    if child is None:
+        child = _PREDICTION_CHILDREN[malicious, source] = PREDICTIONS.labels(
+            'malicious' if malicious else 'benign', source)
+    child.inc()
+
+
+def peak_memory_bytes():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def refresh_memory_gauge():
+    PEAK_MEMORY.set(peak_memory_bytes())
+
+
+if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+    # Scrapes read the values the processes wrote; serve.py's master and workers refresh theirs
+    # every second
+    refresh_memory_gauge()
+else:
+    PEAK_MEMORY.set_function(peak_memory_bytes)
+
+
+class StageTimer:
+    __slots__ = ('endpoint', 'started', '_last')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = self._last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        _STAGE_CHILDREN[stage].observe(now - self._last)
+        self._last = now
+
+    def finish(self):
+        child = _REQUEST_CHILDREN.get(self.endpoint)
+        if child is None:
+            child = _REQUEST_CHILDREN[self.endpoint] = REQUEST_SECONDS.labels(self.endpoint)
+        child.observe(time.perf_counter() - self.started)
+
+
+class NullTimer:
+    __slots__ = ()
+
+    def mark(self, stage):
+        pass
+
+    def finish(self):
+        pass
+
+
+NULL_TIMER = NullTimer()
+STAGE_METRICS = os.environ.get('STAGE_METRICS', '1') != '0'
+
+
+def request_timer(endpoint):
+    return StageTimer(endpoint) if STAGE_METRICS else NULL_TIMER
+
+
+class StackSampler:
+    # Samples the Python stack of the threads serving a fraction (`rate`) of requests every
+    # `interval` seconds, and counts the stacks in the folded format flame graph tools read
+    # ("outer;inner;innermost count" per line). The counts are kept until reset().
+
+    def __init__(self, rate, interval=0.001, max_depth=64):
+        self.rate = rate
+        self.interval = interval
+        self.max_depth = max_depth
+        self.counts = StackCounter()
+        self.requests = 0
+        self._active = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def begin(self):
+        # Thread id to pass to end(), or None when this request is not sampled
+        if random.random() >= self.rate:
+            return None
+        ident = threading.get_ident()
+        with self._lock:
+            self._active.add(ident)
+            self.requests += 1
+            self._wake.set()
+            if self._thread is None or not self._thread.is_alive():
+                # Started on first use, and again in a forked worker, which has no threads
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+        return ident
+
+    def end(self, ident):
+        with self._lock:
+            self._active.discard(ident)
+
+    def _fold(self, frame):
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _run(self):
+        while True:
+            # Sleeps until a sampled request starts, so unsampled traffic pays nothing for it
+            self._wake.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active)
+                if not active:
+                    self._wake.clear()
+                    continue
+            frames = sys._current_frames()
+            stacks = [self._fold(frames[ident]) for ident in active if ident in frames]
+            with self._lock:
+                self.counts.update(stacks)
+
+    def folded(self, limit=None):
+        with self._lock:
+            top = self.counts.most_common(limit)
+        return ''.join(f"{stack} {count}\n" for stack, count in top)
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+            self.requests = 0
+
+
+def stack_sampler_from_env():
+    rate = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    if rate <= 0:
+        return None
+    return StackSampler(rate, float(os.environ.get('PROFILE_INTERVAL_MS', 1)) / 1000)
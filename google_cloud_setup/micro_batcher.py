@@ -0,0 +1,126 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from prometheus_client import Histogram
+
+# Coalesces concurrent single-item calls into batches.
+# Callers block in submit() while a background thread collects queued items into one batch
+# and runs predict_batch on it. A batch is flushed when it reaches max_batch_size or when its
+# first item has waited max_wait seconds. When requests arrive further apart than max_wait
+# (tracked as a moving average of the gaps), waiting would only add latency, so the batch is
+# flushed with whatever is queued.
+# A caller waits at most `timeout` seconds for its result and then gets a TimeoutError (app_gc
+# answers 503). A batch that fails fails its callers and the thread goes on with the next one;
+# while a batch has been running for longer than `timeout`, submit() fails at once instead of
+# queuing.
+
+logger = logging.getLogger(__name__)
+
+MICRO_BATCH_SIZE = Histogram('micro_batch_size', 'Requests coalesced into one model call',
+                             buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+MICRO_BATCH_QUEUE_WAIT = Histogram('micro_batch_queue_wait_seconds', 'Time a request waited for its batch to start',
+                                   buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1))
+
+# Weight of the newest gap in the moving average of inter-arrival times
+ARRIVAL_SMOOTHING = 0.1
+ARRIVAL_GAP_CAP = 10
+
+
+class _Request:
+    __slots__ = ('item', 'queued_at', 'done', 'result', 'error')
+
+    def __init__(self, item):
+        self.item = item
+        self.queued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    def __init__(self, predict_batch, max_batch_size=64, max_wait=0.002, timeout=5.0):
+        # predict_batch(items) -> one result per item, in order; a result that is an
+        # exception instance is raised to that item's caller
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._last_arrival = None
+        self._arrival_gap = float('inf')
+        self._thread = None
+        self._batch_started = None
+
+    def submit(self, item):
+        request = _Request(item)
+        with self._condition:
+            started = self._batch_started
+            if started is not None and request.queued_at - started > self.timeout and self._thread.is_alive():
+                raise TimeoutError(f"Micro-batch running for {request.queued_at - started:.1f}s")
+            if self._last_arrival is not None:
+                # Capped, so one idle period does not hide a burst that follows it for long
+                gap = min(request.queued_at - self._last_arrival, ARRIVAL_GAP_CAP * self.max_wait)
+                self._arrival_gap = gap if self._arrival_gap == float('inf') else \
+                    (1 - ARRIVAL_SMOOTHING) * self._arrival_gap + ARRIVAL_SMOOTHING * gap
+            self._last_arrival = request.queued_at
+            self._queue.append(request)
+            if self._thread is None or not self._thread.is_alive():
+                # Started on first use, and again in a forked worker, which has no threads
+                self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        if not request.done.wait(self.timeout):
+            with self._condition:
+                if request in self._queue:
+                    self._queue.remove(request)
+            raise TimeoutError(f"No micro-batch result within {self.timeout}s")
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+            deadline = self._queue[0].queued_at + self.max_wait
+            while len(self._queue) < self.max_batch_size and self._arrival_gap < self.max_wait:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            count = min(len(self._queue), self.max_batch_size)
+            return [self._queue.popleft() for _ in range(count)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            started = self._batch_started = time.perf_counter()
+            try:
+                self._flush(batch, started)
+            except Exception:
+                logger.exception(f"Micro-batch of {len(batch)} failed")
+            finally:
+                self._batch_started = None
+                # Callers the batch did not answer fail now instead of at their timeout
+                for request in batch:
+                    if not request.done.is_set():
+                        request.error = RuntimeError('micro-batch failed')
+                        request.done.set()
+
+    def _flush(self, batch, started):
+        MICRO_BATCH_SIZE.observe(len(batch))
+        for request in batch:
+            MICRO_BATCH_QUEUE_WAIT.observe(started - request.queued_at)
+        try:
+            results = self.predict_batch([request.item for request in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        for request, result in zip(batch, results):
+            if isinstance(result, Exception):
+                request.error = result
+            else:
+                request.result = result
+            request.done.set()
@@ -0,0 +1,301 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from prometheus_client import Counter, Gauge, Histogram
+
+from feature_extraction import FULL_SCHEMA, FeatureSchema
+from instrumentation import LATENCY_BUCKETS, MODEL_LOAD_SECONDS
+
+# The model behind app_gc, replaceable while the service runs.
+# A reload (from the watcher thread or an admin request) loads the new artifact next to the
+# active model, validates it and warms it up on sample feature rows, and only then swaps it
+# in with a single reference assignment: requests keep predicting with whichever model they
+# picked up and never wait on a reload. Callbacks registered with on_swap run after each
+# swap (app_gc clears the verdict cache there). A candidate that fails to load or validate
+# is logged and counted, and the active model stays in place. The first model is validated
+# the same way, and the service does not start with one that fails.
+# The version of a model is a prefix of the SHA-256 of its file.
+# A model may come with a feature manifest next to it (best_xgboost_model.features.json for
+# best_xgboost_model.npz and .joblib, written by the training pipeline): the feature columns
+# it takes, in order. Callers extract the features of the ActiveModel they predict with, so a
+# swap between extraction and prediction cannot mix the columns of two models. The watcher
+# also reloads when only the manifest changes.
+# model_version_info is set by every process that serves requests: a forked worker sets its own
+# series after the fork and on each of its reloads. serve.py's master turns reporting off, so
+# only the workers' models show.
+
+logger = logging.getLogger(__name__)
+
+MODEL_VERSION = Gauge('model_version_info', 'Version of the model answering requests (value 1)', ['version'],
+                      multiprocess_mode='livemax')
+MODEL_RELOADS = Counter('model_reloads_total', 'Model reload attempts, by outcome', ['result'])
+MODEL_RELOAD_SECONDS = Histogram('model_reload_seconds', 'Time to load, validate and warm up a new model',
+                                 buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+MODEL_PREDICT_SECONDS = Histogram('model_predict_seconds', 'Time of one model call, by model version', ['version'],
+                                  buckets=LATENCY_BUCKETS)
+
+VERSION_LENGTH = 12
+MANIFEST_SUFFIX = '.features.json'
+
+# True in a child forked by fork_without_model(), where no registry starts its watcher or
+# reports its version
+_no_model_after_fork = False
+
+# Validation and warm-up requests (serve.py warms the master process with them too)
+WARMUP_URLS = [
+    'http://www.example.com/index.html',
+    'https://login.secure-account.example.net/verify.php?id=1&session=2',
+    'http://192.168.10.20/admin/login.php',
+    'https://cdn.static.example.org/images/logo.png',
+    'http://paypal.com.account-update.example.ru/signin/',
+]
+
+
+def file_version(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:VERSION_LENGTH]
+
+
+def manifest_path(path):
+    return os.path.splitext(path)[0] + MANIFEST_SUFFIX
+
+
+def load_schema(path):
+    # Columns of the model at `path`: from its manifest, or all of them without one
+    try:
+        with open(manifest_path(path)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return FULL_SCHEMA
+    return FeatureSchema(manifest['features'])
+
+
+def fork_without_model():
+    # os.fork() for a child that serves no requests (serve.py's metrics process)
+    global _no_model_after_fork
+    _no_model_after_fork = True
+    try:
+        return os.fork()
+    finally:
+        _no_model_after_fork = False
+
+
+def load_model_file(path):
+    # NumPy export (tree_ensemble.py) or joblib-pickled XGBClassifier, by extension
+    if path.endswith('.npz'):
+        from tree_ensemble import TreeEnsemble
+        return TreeEnsemble.load(path)
+    import joblib
+    return joblib.load(path)
+
+
+class ActiveModel:
+    # A loaded model with its version; replaced as a whole on a swap
+    __slots__ = ('model', 'version', 'path', 'schema', 'loaded_at', 'predict_seconds')
+
+    def __init__(self, model, version, path, schema=FULL_SCHEMA):
+        self.model = model
+        self.version = version
+        self.path = path
+        self.schema = schema
+        self.loaded_at = time.time()
+        self.predict_seconds = MODEL_PREDICT_SECONDS.labels(version)
+
+
+class ModelRegistry:
+    def __init__(self, paths, sample_rows, warmup_rounds=3, watch_interval=0, wrap=None):
+        # paths: candidate artifacts in order of preference; the first one that exists is used.
+        # sample_rows: feature matrix for validation and warm-up (rows of extract_features with
+        # every column; a model with a manifest gets its columns of them).
+        # wrap: applied to every loaded model, on reloads too (app_gc puts the cascade's first
+        # stage in front of it); what it returns is validated and served.
+        self.paths = list(paths)
+        self.sample_rows = np.asarray(sample_rows)
+        self.wrap = wrap
+        self.warmup_rounds = warmup_rounds
+        self.watch_interval = watch_interval
+        self.n_jobs = None
+        self.last_error = None
+        self._callbacks = []
+        self._reload_lock = threading.Lock()
+        self._thread = None
+        self._watching = False
+        self._reports_version = True
+        self._seen = self._signatures()
+
+        started = time.perf_counter()
+        path = self._artifact_path()
+        if path is None:
+            raise FileNotFoundError(f"No model file found: {', '.join(self.paths)}")
+        model = self._load(path)
+        schema = load_schema(path)
+        try:
+            self._validate(model, schema)
+        except Exception as e:
+            raise ValueError(f"Model {path} failed validation: {type(e).__name__}: {e}") from e
+        self._active = ActiveModel(model, file_version(path), path, schema)
+        MODEL_LOAD_SECONDS.set(time.perf_counter() - started)
+        MODEL_VERSION.labels(self._active.version).set(1)
+        # A forked worker does not inherit the watcher thread, and its metric values start empty
+        os.register_at_fork(after_in_child=self._after_fork)
+        if watch_interval > 0:
+            self.watch()
+
+    @property
+    def active(self):
+        return self._active
+
+    @property
+    def model(self):
+        return self._active.model
+
+    @property
+    def schema(self):
+        return self._active.schema
+
+    @property
+    def version(self):
+        return self._active.version
+
+    def info(self):
+        active = self._active
+        return {'version': active.version, 'path': active.path, 'features': list(active.schema.names),
+                'loaded_at': active.loaded_at, 'last_error': self.last_error}
+
+    def on_swap(self, callback):
+        self._callbacks.append(callback)
+
+    def predict(self, features, active=None):
+        # active: the ActiveModel whose schema the features were extracted with
+        if active is None:
+            active = self._active  # One read: a swap during the call does not affect it
+        started = time.perf_counter()
+        prediction = active.model.predict(features)
+        active.predict_seconds.observe(time.perf_counter() - started)
+        return prediction
+
+    def report_version(self, reporting):
+        # Whether this process's model_version_info series shows the active model; serve.py's
+        # master, which serves no requests, turns it off before forking its workers
+        self._reports_version = reporting
+        MODEL_VERSION.labels(self.version).set(1 if reporting else 0)
+
+    def limit_threads(self, n_jobs):
+        # For forked workers: OpenMP thread pools do not survive fork(). Applies to reloads too.
+        self.n_jobs = n_jobs
+        if hasattr(self.model, 'set_params'):
+            self.model.set_params(n_jobs=n_jobs)
+
+    # Reloads
+
+    def _artifact_path(self):
+        return next((path for path in self.paths if os.path.exists(path)), None)
+
+    def _load(self, path):
+        model = load_model_file(path)
+        return self.wrap(model) if self.wrap is not None else model
+
+    def _signatures(self):
+        # (path, modification time, size) of every model file and its manifest
+        signatures = []
+        for path in self.paths:
+            for watched in (path, manifest_path(path)):
+                try:
+                    stat = os.stat(watched)
+                    signatures.append((watched, stat.st_mtime_ns, stat.st_size))
+                except OSError:
+                    signatures.append((watched, None, None))
+        return signatures
+
+    def _validate(self, model, schema):
+        # The candidate must accept the service's feature rows and return one class per row
+        rows = self.sample_rows if schema.full else self.sample_rows[:, schema.columns]
+        predictions = np.asarray(model.predict(rows))
+        if predictions.shape != (len(rows),):
+            raise ValueError(f"expected {len(rows)} predictions, got shape {predictions.shape}")
+        if not np.issubdtype(predictions.dtype, np.number) or not np.isfinite(predictions).all():
+            raise ValueError(f"predictions are not class numbers: {predictions[:5]}")
+        # Warm-up: single rows (the /predict path) and the whole sample (/predict_batch)
+        for _ in range(self.warmup_rounds):
+            for row in rows:
+                model.predict(row.reshape(1, -1))
+            model.predict(rows)
+
+    def reload(self, force=False):
+        # Loads the preferred artifact and swaps it in when its version differs from the active
+        # one (or when force is set). Returns a summary; raises nothing.
+        with self._reload_lock:
+            self._seen = self._signatures()
+            started = time.perf_counter()
+            path = self._artifact_path()
+            try:
+                if path is None:
+                    raise FileNotFoundError(f"No model file found: {', '.join(self.paths)}")
+                version = file_version(path)
+                schema = load_schema(path)
+                if version == self.version and path == self._active.path and schema == self.schema and not force:
+                    MODEL_RELOADS.labels('unchanged').inc()
+                    return {'result': 'unchanged', 'version': version}
+                model = self._load(path)
+                if self.n_jobs is not None and hasattr(model, 'set_params'):
+                    model.set_params(n_jobs=self.n_jobs)
+                self._validate(model, schema)
+            except Exception as e:
+                self.last_error = f"{path}: {type(e).__name__}: {e}"
+                MODEL_RELOADS.labels('failed').inc()
+                logger.error(f"Model reload failed, keeping version {self.version}: {self.last_error}")
+                return {'result': 'failed', 'version': self.version, 'error': self.last_error}
+
+            previous = self._active
+            self._active = ActiveModel(model, version, path, schema)
+            self.last_error = None
+            seconds = time.perf_counter() - started
+            MODEL_RELOAD_SECONDS.observe(seconds)
+            MODEL_RELOADS.labels('swapped').inc()
+            if previous.version != version and self._reports_version:
+                MODEL_VERSION.labels(version).set(1)
+                if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+                    MODEL_VERSION.labels(previous.version).set(0)  # Its files cannot drop a series
+                else:
+                    MODEL_VERSION.remove(previous.version)
+            for callback in self._callbacks:
+                callback(previous.version, version)
+        logger.info(f"Model {previous.version} replaced by {version} from {path} in {seconds:.2f}s")
+        return {'result': 'swapped', 'version': version, 'previous_version': previous.version, 'seconds': seconds}
+
+    # Watcher
+
+    def watch(self):
+        # Starts the thread that reloads when a model file or manifest changes (size or
+        # modification time)
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._watching = True
+        self._start_thread()
+
+    def _after_fork(self):
+        if _no_model_after_fork:
+            return
+        self.report_version(True)
+        if self._watching:
+            self._start_thread()
+
+    def _start_thread(self):
+        self._thread = threading.Thread(target=self._run, name='model-watcher', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.watch_interval)
+            signatures = self._signatures()
+            if signatures != self._seen:
+                # A file still being written fails validation; its next change triggers another try
+                self.reload()
@@ -0,0 +1,214 @@
+import argparse
+import logging
+import os
+import re
+import signal
+import threading
+import time
+from collections import OrderedDict
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Classification off the resolution path: dnsmasq answers every query on its own, with
+# `log-queries` and `log-facility=/var/log/dnsmasq.log`, and this process follows that log.
+# The stages are generators, each pulling from the previous one:
+#   follow       new lines of the log; survives rotation (rename or copytruncate) and yields
+#                None when it is idle, so later stages can act on time
+#   query_names  the names of query[A], query[AAAA] and query[HTTPS] lines
+#   deduplicate  drops names already seen within the sliding --window
+#   batches      groups names into batches of --batch-size, or fewer after --max-wait-ms
+#   classify     runs each batch through app_gc.classify_batch (lists, verdict cache,
+#                extract_features and one model call); detections go to the blocklist
+#                publisher and to MALICIOUS_URL_COUNTER
+# Backpressure: nothing is read faster than it is classified, so a backlog stays in the log
+# file, not in memory. query_log_lag_bytes shows how far behind the end of the log the
+# reader is. With --max-lag-bytes the unread backlog is skipped once it grows past that
+# size, so detections stay near real time at the cost of the skipped queries.
+
+logger = logging.getLogger(__name__)
+
+LOG_LINES = Counter('query_log_lines_total', 'Lines read from the dnsmasq log')
+LOG_NAMES = Counter('query_log_names_total', 'Queried names, by what happened to them', ['outcome'])
+LOG_BATCH_SIZE = Histogram('query_log_batch_size', 'Names per classified batch',
+                           buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+LOG_LAG_BYTES = Gauge('query_log_lag_bytes', 'Bytes between the read position and the end of the log')
+LOG_ROTATIONS = Counter('query_log_rotations_total', 'Log rotations followed')
+LOG_SKIPPED_BYTES = Counter('query_log_skipped_bytes_total', 'Backlog skipped because of --max-lag-bytes')
+
+# "Jan 10 12:00:01 dnsmasq[812]: query[A] example.com from 192.168.1.10"
+QUERY_LINE = re.compile(r': query\[(\w+)\] (\S+) from ')
+QUERY_TYPES = frozenset({'A', 'AAAA', 'HTTPS'})
+QUERY_URL_FORMAT = 'http://{}'
+READ_SIZE = 1 << 16
+
+
+def follow(path, poll_interval=0.2, from_start=False, max_lag_bytes=0, stop=None):
+    # Lines appended to `path`, like `tail -F`, with None after every poll that found nothing.
+    # A renamed log is read to its end before the new file is opened; a truncated one is read
+    # again from the start. Ends once `stop` is set and everything written has been read.
+    f = None
+    inode = None
+    pending = b''
+    try:
+        while True:
+            if f is None:
+                try:
+                    f = open(path, 'rb')
+                except FileNotFoundError:
+                    if stop is not None and stop.is_set():
+                        return
+                    yield None
+                    time.sleep(poll_interval)
+                    continue
+                inode = os.fstat(f.fileno()).st_ino
+                if not from_start:
+                    f.seek(0, os.SEEK_END)
+                from_start = True  # A rotated-in file is always read from its start
+                pending = b''
+
+            chunk = f.read(READ_SIZE)
+            if chunk:
+                lag = os.fstat(f.fileno()).st_size - f.tell()
+                LOG_LAG_BYTES.set(lag)
+                if max_lag_bytes and lag > max_lag_bytes:
+                    f.seek(0, os.SEEK_END)
+                    LOG_SKIPPED_BYTES.inc(lag)
+                    logger.warning(f"Skipped {lag} bytes of backlog in {path}")
+                    chunk, pending = chunk[:chunk.rfind(b'\n') + 1], b''
+                lines = (pending + chunk).split(b'\n')
+                pending = lines.pop()
+                LOG_LINES.inc(len(lines))
+                for line in lines:
+                    yield line.decode('utf-8', 'replace')
+                continue
+
+            LOG_LAG_BYTES.set(0)
+            try:
+                current = os.stat(path)
+            except FileNotFoundError:
+                current = None
+            if current is not None and current.st_ino != inode:
+                f.close()
+                f = None
+                LOG_ROTATIONS.inc()
+                continue
+            if current is not None and current.st_size < f.tell():
+                f.seek(0)
+                pending = b''
+                LOG_ROTATIONS.inc()
+                continue
+            if stop is not None and stop.is_set():
+                return
+            yield None
+            time.sleep(poll_interval)
+    finally:
+        if f is not None:
+            f.close()
+
+
+def query_names(lines, query_types=QUERY_TYPES):
+    # Lower-cased queried names; None passes through
+    for line in lines:
+        if line is None:
+            yield None
+            continue
+        match = QUERY_LINE.search(line)
+        if match and match.group(1) in query_types:
+            name = match.group(2).rstrip('.').lower()
+            if name:
+                yield name
+
+
+def deduplicate(names, window=300.0, max_names=1000000):
+    # Names not seen in the last `window` seconds; a repeat restarts the name's window. At most
+    # max_names are remembered, the least recently seen are forgotten first.
+    seen = OrderedDict()
+    duplicates = LOG_NAMES.labels('duplicate')
+    for name in names:
+        now = time.monotonic()
+        while seen and (len(seen) > max_names or next(iter(seen.values())) < now - window):
+            seen.popitem(last=False)
+        if name is None:
+            yield None
+            continue
+        if name in seen:
+            seen[name] = now
+            seen.move_to_end(name)
+            duplicates.inc()
+            continue
+        seen[name] = now
+        yield name
+
+
+def batches(names, batch_size=256, max_wait=0.2):
+    # Lists of names: full batches, or what has waited max_wait seconds since its first name
+    batch = []
+    started = 0.0
+    for name in names:
+        if name is not None:
+            if not batch:
+                started = time.monotonic()
+            batch.append(name)
+        if batch and (len(batch) >= batch_size or time.monotonic() - started >= max_wait):
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def classify(name_batches, classify_batch):
+    # (names, results) for every batch; results as app_gc.classify_batch returns them
+    outcomes = {}
+    for names in name_batches:
+        results = classify_batch([QUERY_URL_FORMAT.format(name) for name in names])
+        LOG_BATCH_SIZE.observe(len(names))
+        for result in results:
+            outcome = 'error' if 'error' in result else result['source']
+            child = outcomes.get(outcome)
+            if child is None:
+                child = outcomes[outcome] = LOG_NAMES.labels(outcome)
+            child.inc()
+        yield names, results
+
+
+def pipeline(path, classify_batch, from_start=False, poll_interval=0.2, window=300.0, batch_size=256,
+             max_wait=0.2, max_lag_bytes=0, stop=None):
+    lines = follow(path, poll_interval, from_start, max_lag_bytes, stop)
+    return classify(batches(deduplicate(query_names(lines), window), batch_size, max_wait), classify_batch)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('log', help='dnsmasq log-facility file')
+    parser.add_argument('--from-start', action='store_true', help='read the existing log instead of only new lines')
+    parser.add_argument('--window', type=float, default=300.0, help='seconds a name stays deduplicated')
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--max-wait-ms', type=float, default=200)
+    parser.add_argument('--poll-interval', type=float, default=0.2)
+    parser.add_argument('--max-lag-bytes', type=int, default=0, help='skip the backlog past this size, 0 never')
+    parser.add_argument('--blocklist', help='hosts file to publish detections to (sets BLOCKLIST_PUBLISH_PATH)')
+    parser.add_argument('--metrics-port', type=int, default=8002)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.blocklist:
+        os.environ['BLOCKLIST_PUBLISH_PATH'] = args.blocklist
+    from prometheus_client import start_http_server
+    from app_gc import blocklist_publisher, classify_batch  # Loads the model
+
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+    logger.info(f"Following {args.log}")
+    for names, results in pipeline(args.log, classify_batch, args.from_start, args.poll_interval, args.window,
+                                   args.batch_size, args.max_wait_ms / 1000, args.max_lag_bytes, stop):
+        malicious = sum(1 for result in results if result.get('malicious'))
+        logger.debug(f"Classified {len(names)} names, {malicious} malicious")
+    if blocklist_publisher is not None:
+        blocklist_publisher.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+import hashlib
+
+# Deterministic encoding of the root_domain feature: MD5 of the root domain modulo 10**8,
+# the same value process_data.py trains on. Unlike hash() it does not change between
+# processes, so every worker computes the same feature row for a URL. Domains not seen in
+# training get a code the same way, so no table of training codes is needed.
+
+ENCODING_MODULUS = 10 ** 8
+
+
+def encode_root_domain(root_domain):
+    return int.from_bytes(hashlib.md5(root_domain.encode()).digest(), 'big') % ENCODING_MODULUS
+
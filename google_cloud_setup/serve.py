@@ -0,0 +1,303 @@
+import argparse
+import gc
+import logging
+import os
+import random
+import shutil
+import signal
+import socket
+import tempfile
+import time
+
+# Production serving mode for app_gc: a pre-forking server.
+# The master process imports the app (loading the model), runs synthetic requests through
+# feature extraction and the model, then forks the workers. They share the model's memory
+# copy-on-write and accept connections from one listening socket. A worker exits after
+# --max-requests requests (with some jitter so they do not all restart together) and the
+# master replaces it; SIGHUP replaces every worker, one at a time, and SIGTERM/SIGINT stop the
+# server. A recycled worker is only told to stop once its replacement has been forked, and the
+# next one only once it has exited, so the socket always has workers accepting on it.
+# A model reload through the admin endpoint swaps the model of the worker that got the request,
+# which then sends SIGUSR1 to the master: the master reloads its own copy and replaces every
+# worker the same way, so they all fork with the new model. The verdict cache is cleared again
+# once the last old worker is gone, since with a shared cache those kept adding old verdicts.
+# Prometheus metrics from all workers are merged through prometheus_client's multiprocess
+# mode and served on --metrics-port by a separate process.
+
+logger = logging.getLogger(__name__)
+
+def warm_up(app_module, rounds):
+    # Exercise the request path once before forking, so its lazy setup (tldextract, NumPy
+    # and model internals) happens in the master and is shared by every worker
+    from model_registry import WARMUP_URLS
+    start = time.perf_counter()
+    active = app_module.model_registry.active
+    for _ in range(rounds):
+        for url in WARMUP_URLS:
+            app_module.model_registry.predict(app_module.extract_features(url, schema=active.schema), active)
+        features, _, _ = app_module.extract_features_batch(WARMUP_URLS, active.schema)
+        app_module.model_registry.predict(features, active)
+    logger.info(f"Warmed up in {time.perf_counter() - start:.2f}s")
+
+
+class PreforkServer:
+    def __init__(self, app, host, port, workers, max_requests=0, graceful_timeout=30.0, metrics_port=8000,
+                 threaded=False, on_worker_start=None, reload_model=None, after_model_reload=None):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.max_requests = max_requests
+        self.graceful_timeout = graceful_timeout
+        self.metrics_port = metrics_port
+        # A thread per request inside each worker, so concurrent requests can share a micro-batch
+        self.threaded = threaded
+        # Called in each worker before it serves, e.g. to start the binary protocol listener
+        self.on_worker_start = on_worker_start
+        # Called in the master on a worker's request_model_reload(); returns whether the workers
+        # should be replaced. after_model_reload is called once they all have been.
+        self.reload_model = reload_model
+        self.after_model_reload = after_model_reload
+        self.pid = None
+        self.socket = None
+        self._children = {}  # pid -> 'worker', 'retiring' (recycled, finishing its request) or 'metrics'
+        self._stopping = False
+        self._recycle = False
+        self._to_recycle = []
+        self._reload_requested = False
+        self._reloading = False  # The workers being replaced are the ones of a model reload
+
+    def bind(self):
+        self.socket = socket.create_server((self.host, self.port), backlog=1024, reuse_port=False)
+        self.socket.set_inheritable(True)
+        self.port = self.socket.getsockname()[1]
+        return self.port
+
+    def run(self):
+        if self.socket is None:
+            self.bind()
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_recycle)
+        signal.signal(signal.SIGUSR1, self._on_reload_model)
+        self.pid = os.getpid()
+        # Objects created so far are never collected, so the GC does not write to the pages
+        # the workers share
+        gc.collect()
+        gc.freeze()
+        if self.metrics_port:
+            self._spawn('metrics')
+        for _ in range(self.workers):
+            self._spawn('worker')
+        logger.info(f"Serving on {self.host}:{self.port} with {self.workers} workers")
+
+        from instrumentation import refresh_memory_gauge
+        refreshed = 0
+        while not self._stopping:
+            if time.monotonic() - refreshed >= 1:
+                refresh_memory_gauge()  # The master's peak grows too, e.g. with a model reload
+                refreshed = time.monotonic()
+            if self._reload_requested:
+                self._reload_requested = False
+                self._reload_workers()
+            if self._recycle:
+                self._recycle = False
+                self._to_recycle = [pid for pid, role in self._children.items() if role == 'worker']
+            self._recycle_next()
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if not pid:
+                time.sleep(0.1)
+                continue
+            role = self._reap(pid, status)
+            if role in ('worker', 'metrics') and not self._stopping:
+                self._spawn(role)
+        self._shutdown()
+
+    def _on_stop(self, signum, frame):
+        self._stopping = True
+
+    def _on_recycle(self, signum, frame):
+        self._recycle = True
+
+    def _on_reload_model(self, signum, frame):
+        self._reload_requested = True
+
+    def request_model_reload(self):
+        # Called in a worker that has reloaded its model: the master reloads and replaces the others
+        os.kill(self.pid, signal.SIGUSR1)
+
+    def _reload_workers(self):
+        if self.reload_model is None or not self.reload_model():
+            return
+        # The new model's objects are shared with the workers like the first one's
+        gc.collect()
+        gc.freeze()
+        self._recycle = True
+        self._reloading = True
+
+    def _recycle_next(self):
+        # Replaces the next worker of a SIGHUP once the previous one has exited
+        if 'retiring' in self._children.values():
+            return
+        while self._to_recycle:
+            pid = self._to_recycle.pop(0)
+            if self._children.get(pid) != 'worker':
+                continue  # Exited meanwhile, and already replaced
+            self._spawn('worker')
+            self._children[pid] = 'retiring'
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            return
+        if self._reloading and not self._recycle:
+            self._reloading = False
+            logger.info("Every worker serves the reloaded model")
+            if self.after_model_reload is not None:
+                self.after_model_reload()
+
+    def _reap(self, pid, status):
+        role = self._children.pop(pid, None)
+        if role in ('worker', 'retiring'):
+            from prometheus_client import multiprocess
+            multiprocess.mark_process_dead(pid)
+            if os.waitstatus_to_exitcode(status) != 0:
+                logger.warning(f"Worker {pid} exited with {os.waitstatus_to_exitcode(status)}")
+        return role
+
+    def _spawn(self, role):
+        if role == 'metrics':
+            from model_registry import fork_without_model
+            pid = fork_without_model()  # It serves no requests, so it needs no model reloads
+        else:
+            pid = os.fork()
+        if pid:
+            self._children[pid] = role
+            return
+        # Child: never returns into the master's loop
+        code = 1
+        try:
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+            random.seed()
+            if role == 'worker':
+                self._serve()
+            else:
+                self._serve_metrics()
+            code = 0
+        except Exception:
+            logger.exception(f"{role} {os.getpid()} failed")
+        finally:
+            os._exit(code)
+
+    def _serve(self):
+        from werkzeug.serving import make_server
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+        server = make_server(self.host, self.port, self.app, threaded=self.threaded, fd=self.socket.fileno())
+        # Woken up every second to check for SIGTERM; a connection taken by another worker
+        # first must not block this one in accept()
+        server.timeout = 1.0
+        server.socket.setblocking(False)
+        limit = self.max_requests + random.randint(0, self.max_requests // 10) if self.max_requests else 0
+        handled = 0
+        process_request = server.process_request
+
+        def counted(request, client_address):
+            nonlocal handled
+            handled += 1
+            process_request(request, client_address)
+
+        server.process_request = counted
+        if self.on_worker_start is not None:
+            self.on_worker_start()
+        from instrumentation import refresh_memory_gauge
+        refreshed = 0
+        while not stopping and (not limit or handled < limit):
+            server.handle_request()
+            if time.monotonic() - refreshed >= 1:
+                refresh_memory_gauge()
+                refreshed = time.monotonic()
+        server.server_close()
+
+    def _serve_metrics(self):
+        from prometheus_client import CollectorRegistry, multiprocess, start_http_server
+        self.socket.close()
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        start_http_server(self.metrics_port, registry=registry)
+        signal.signal(signal.SIGTERM, lambda signum, frame: os._exit(0))
+        while True:
+            signal.pause()
+
+    def _shutdown(self):
+        # Workers finish the request they are on; whatever is left after the timeout is killed
+        for pid in self._children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.graceful_timeout
+        while self._children and time.monotonic() < deadline:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid:
+                self._reap(pid, status)
+            else:
+                time.sleep(0.05)
+        for pid in self._children:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.socket.close()
+
+
+def prepare_multiprocess_metrics():
+    # Must run before prometheus_client is imported: every process then writes its samples to
+    # files in this directory, and the metrics process merges them
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+    else:
+        directory = os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='prometheus-')
+    return directory
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--max-requests', type=int, default=100000)
+    parser.add_argument('--graceful-timeout', type=float, default=30.0)
+    parser.add_argument('--warmup-rounds', type=int, default=20)
+    parser.add_argument('--metrics-port', type=int, default=8000)
+    parser.add_argument('--threaded', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    prepare_multiprocess_metrics()
+    # One worker per core does the parallelism; threaded math libraries would oversubscribe
+    for variable in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ.setdefault(variable, '1')
+
+    import app_gc  # Loads the model once, in the master
+    app_gc.model_registry.limit_threads(1)  # OpenMP thread pools do not survive fork()
+    app_gc.model_registry.report_version(False)  # Each worker reports the model it serves
+    warm_up(app_gc, args.warmup_rounds)
+
+    def reload_model():
+        return app_gc.model_registry.reload()['result'] != 'failed'
+
+    server = PreforkServer(app_gc.app, args.host, args.port, args.workers, args.max_requests,
+                           args.graceful_timeout, args.metrics_port, args.threaded,
+                           app_gc.binary_server.start if app_gc.binary_server is not None else None,
+                           reload_model, app_gc.verdict_cache.invalidate)
+    app_gc.model_reload_broadcast = server.request_model_reload
+    server.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+import mmap
+import multiprocessing
+import struct
+import time
+
+import numpy as np
+
+from verdict_cache import VERDICT_CACHE_EVICTIONS, VERDICT_CACHE_HITS, VERDICT_CACHE_MISSES
+
+# Verdict cache shared by the processes of one node (serve.py workers).
+# A fixed-size hash table in an anonymous shared mapping, created before the workers are
+# forked, so a hostname classified by one worker is a hit in every other. Keys are stored as
+# 64-bit fingerprints, not strings, so every entry takes 18 bytes. The fingerprint is Python's
+# string hash: forked workers inherit the hash seed of the process that created the table.
+# The table is set-associative: a key's fingerprint picks a bucket of WAYS slots, and the
+# bucket's keys are read with one struct unpack. A full bucket evicts with
+# CLOCK: hits set a slot's reference bit, and the bucket's hand clears set bits until it
+# reaches a slot without one. Expired entries are dropped when met and reused first.
+# Buckets are guarded by a fixed set of process-shared locks (bucket number modulo
+# LOCK_STRIPES). A lock that cannot be taken within LOCK_TIMEOUT, e.g. because a worker was
+# killed while holding it, turns the lookup into a miss rather than a stall.
+# Same interface and metrics as VerdictCache, which stays the per-process cache.
+
+WAYS = 8
+LOCK_STRIPES = 64
+LOCK_TIMEOUT = 0.05
+VERDICT = 1
+REFERENCED = 2
+
+# One bucket: WAYS keys (0 = empty), WAYS expiry times (time.monotonic(), shared by all
+# processes of the machine), WAYS flag bytes (VERDICT | REFERENCED), the CLOCK hand, padding
+BUCKET = np.dtype([('keys', '<u8', WAYS), ('expires', '<f8', WAYS), ('flags', 'u1', WAYS),
+                   ('hand', 'u1'), ('pad', 'u1', 7)])
+KEYS_OFFSET = BUCKET.fields['keys'][1]
+EXPIRES_OFFSET = BUCKET.fields['expires'][1]
+FLAGS_OFFSET = BUCKET.fields['flags'][1]
+HAND_OFFSET = BUCKET.fields['hand'][1]
+KEYS = struct.Struct(f'<{WAYS}Q')
+KEY = struct.Struct('<Q')
+DOUBLE = struct.Struct('<d')
+FINGERPRINT_MASK = 2 ** 64 - 1
+
+
+class SharedVerdictCache:
+    def __init__(self, max_size=100000, benign_ttl=3600, malicious_ttl=86400):
+        self.max_size = max_size
+        self.benign_ttl = benign_ttl
+        self.malicious_ttl = malicious_ttl
+        self.n_buckets = max(1, -(-max_size // WAYS))
+        self.nbytes = self.n_buckets * BUCKET.itemsize
+        self._memory = mmap.mmap(-1, self.nbytes)  # MAP_SHARED: forked children see the same pages
+        self._table = np.frombuffer(self._memory, dtype=BUCKET)
+        self._locks = [multiprocessing.Lock() for _ in range(min(LOCK_STRIPES, self.n_buckets))]
+
+    def __len__(self):
+        # Live entries; an approximate count while other processes write
+        return int(((self._table['keys'] != 0) & (self._table['expires'] > time.monotonic())).sum())
+
+    def _locate(self, key):
+        # Bucket offset, fingerprint and lock of a key; 0 marks empty slots
+        value = hash(key) & FINGERPRINT_MASK or 1
+        bucket = value % self.n_buckets
+        return bucket * BUCKET.itemsize, value, self._locks[bucket % len(self._locks)]
+
+    def _find(self, base, value):
+        # Slot holding the fingerprint in the bucket at `base`, or -1
+        keys = KEYS.unpack_from(self._memory, base + KEYS_OFFSET)
+        return keys.index(value) if value in keys else -1
+
+    def _clear(self, base, slot):
+        KEY.pack_into(self._memory, base + KEYS_OFFSET + 8 * slot, 0)
+
+    def get(self, key):
+        # Returns the cached verdict, or None on a miss
+        if key is None or self.max_size <= 0:
+            return None
+        base, value, lock = self._locate(key)
+        if not lock.acquire(timeout=LOCK_TIMEOUT):
+            VERDICT_CACHE_MISSES.inc()
+            return None
+        try:
+            slot = self._find(base, value)
+            if slot != -1:
+                memory = self._memory
+                if DOUBLE.unpack_from(memory, base + EXPIRES_OFFSET + 8 * slot)[0] > time.monotonic():
+                    flags = memory[base + FLAGS_OFFSET + slot]
+                    memory[base + FLAGS_OFFSET + slot] = flags | REFERENCED
+                    VERDICT_CACHE_HITS.inc()
+                    return bool(flags & VERDICT)
+                self._clear(base, slot)
+                VERDICT_CACHE_EVICTIONS.labels(reason='expired').inc()
+        finally:
+            lock.release()
+        VERDICT_CACHE_MISSES.inc()
+        return None
+
+    def _victim(self, base):
+        # An empty or expired slot, else the CLOCK choice
+        memory = self._memory
+        keys = KEYS.unpack_from(memory, base + KEYS_OFFSET)
+        if 0 in keys:
+            return keys.index(0)
+        now = time.monotonic()
+        for slot in range(WAYS):
+            if DOUBLE.unpack_from(memory, base + EXPIRES_OFFSET + 8 * slot)[0] <= now:
+                VERDICT_CACHE_EVICTIONS.labels(reason='expired').inc()
+                return slot
+        hand = memory[base + HAND_OFFSET]
+        while memory[base + FLAGS_OFFSET + hand] & REFERENCED:
+            memory[base + FLAGS_OFFSET + hand] &= ~REFERENCED
+            hand = (hand + 1) % WAYS
+        memory[base + HAND_OFFSET] = (hand + 1) % WAYS
+        VERDICT_CACHE_EVICTIONS.labels(reason='capacity').inc()
+        return hand
+
+    def put(self, key, malicious):
+        if key is None or self.max_size <= 0:
+            return
+        expires = time.monotonic() + (self.malicious_ttl if malicious else self.benign_ttl)
+        base, value, lock = self._locate(key)
+        if not lock.acquire(timeout=LOCK_TIMEOUT):
+            return
+        try:
+            slot = self._find(base, value)
+            if slot == -1:
+                slot = self._victim(base)
+                KEY.pack_into(self._memory, base + KEYS_OFFSET + 8 * slot, value)
+            DOUBLE.pack_into(self._memory, base + EXPIRES_OFFSET + 8 * slot, expires)
+            self._memory[base + FLAGS_OFFSET + slot] = VERDICT if malicious else 0
+        finally:
+            lock.release()
+
+    def invalidate(self, key=None):
+        # Drops one key, or every entry when no key is given; returns how many were removed
+        if key is not None:
+            base, value, lock = self._locate(key)
+            with lock:
+                slot = self._find(base, value)
+                if slot != -1:
+                    self._clear(base, slot)
+            removed = int(slot != -1)
+        else:
+            for lock in self._locks:
+                lock.acquire()
+            try:
+                removed = int((self._table['keys'] != 0).sum())
+                self._memory[:] = bytes(self.nbytes)
+            finally:
+                for lock in self._locks:
+                    lock.release()
+        if removed:
+            VERDICT_CACHE_EVICTIONS.labels(reason='invalidated').inc(removed)
+        return removed
@@ -0,0 +1,181 @@
+import argparse
+import json
+
+import numpy as np
+
+# Tree-ensemble predictor that runs on NumPy alone.
+# export_model() flattens the trees of a trained XGBClassifier into a few arrays and saves them
+# as an .npz file. Every tree is stored as a complete binary tree of the ensemble's depth, in
+# heap order: the children of node i are 2i+1 and 2i+2, so only the split feature, threshold
+# and missing-value direction of each inner node and the value of each leaf are kept. A leaf
+# higher up is copied into every slot below it. TreeEnsemble walks all trees for all rows at
+# once, one level per step, without xgboost installed and without building a DMatrix per call.
+
+EXPORT_SUFFIX = '.npz'
+# Each tree takes 2**depth slots, so very deep trees are not worth flattening this way
+MAX_DEPTH = 16
+# Rows are scored in blocks of about this many (row, tree) pairs so the temporaries stay in cache
+BLOCK_SIZE = 32768
+
+
+def _tree_depth(lefts, rights):
+    depth = 0
+    level = [0]
+    while level:
+        level = [child for node in level for child in (lefts[node], rights[node]) if child != -1]
+        depth += bool(level)
+    return depth
+
+
+def _complete_trees(trees, depth):
+    inner = 2 ** depth - 1
+    feature = np.zeros((len(trees), inner), dtype=np.int32)
+    threshold = np.full((len(trees), inner), np.inf, dtype=np.float32)
+    default_left = np.ones((len(trees), inner), dtype=bool)
+    leaf_value = np.zeros((len(trees), inner + 1), dtype=np.float32)
+    for t, tree in enumerate(trees):
+        lefts, rights = tree['left_children'], tree['right_children']
+        # (node in the xgboost tree, slot in the complete tree)
+        stack = [(0, 0)]
+        while stack:
+            node, slot = stack.pop()
+            if slot >= inner:
+                leaf_value[t, slot - inner] = tree['split_conditions'][node]  # Leaf values are stored as split conditions
+            elif lefts[node] == -1:
+                stack += [(node, 2 * slot + 1), (node, 2 * slot + 2)]
+            else:
+                feature[t, slot] = tree['split_indices'][node]
+                threshold[t, slot] = tree['split_conditions'][node]
+                default_left[t, slot] = tree['default_left'][node]
+                stack += [(lefts[node], 2 * slot + 1), (rights[node], 2 * slot + 2)]
+    return feature, threshold, default_left, leaf_value
+
+
+def export_model(model, path=None):
+    # Arrays for a trained XGBClassifier (or its Booster); saved to `path` when given
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    learner = json.loads(booster.save_raw('json'))['learner']
+    objective = learner['objective']['name']
+    if objective not in ('binary:logistic', 'multi:softprob', 'multi:softmax'):
+        raise ValueError(f"Cannot export a model with objective {objective}")
+    num_feature = int(learner['learner_model_param']['num_feature'])
+    num_class = max(int(learner['learner_model_param']['num_class']), 1)
+    trees = learner['gradient_booster']['model']['trees']
+    tree_class = np.array(learner['gradient_booster']['model']['tree_info'], dtype=np.int32)
+
+    # model.predict stops at best_iteration when the model was trained with early stopping
+    best_iteration = getattr(model, 'best_iteration', None) if hasattr(model, 'get_booster') else None
+    if best_iteration is not None:
+        end = int(learner['gradient_booster']['model']['iteration_indptr'][best_iteration + 1])
+        trees, tree_class = trees[:end], tree_class[:end]
+
+    depth = max(_tree_depth(tree['left_children'], tree['right_children']) for tree in trees)
+    if depth > MAX_DEPTH:
+        raise ValueError(f"Trees of depth {depth} are too deep to export (at most {MAX_DEPTH})")
+    feature, threshold, default_left, leaf_value = _complete_trees(trees, depth)
+    arrays = {
+        'feature': feature.ravel(),
+        'threshold': threshold.ravel(),
+        'default_left': default_left.ravel(),
+        'leaf_value': leaf_value.ravel(),
+        'tree_class': tree_class,
+        'depth': np.array(depth),
+        'num_feature': np.array(num_feature),
+        'objective': np.array(objective),
+        'base_margin': np.zeros(num_class),
+    }
+
+    # The intercept is taken from xgboost itself (its stored form differs between versions):
+    # the margin it gives an all-zero row, minus what the trees alone add up to for that row
+    import xgboost
+    zeros = np.zeros((1, num_feature), dtype=np.float32)
+    iteration_range = (0, best_iteration + 1) if best_iteration is not None else (0, 0)
+    margin = booster.predict(xgboost.DMatrix(zeros), output_margin=True, iteration_range=iteration_range)
+    arrays['base_margin'] = np.reshape(margin, -1).astype(np.float64) - TreeEnsemble(arrays).predict_margin(zeros)[0]
+
+    if path:
+        np.savez(path, **arrays)
+    return arrays
+
+
+class TreeEnsemble:
+    def __init__(self, arrays):
+        self.depth = int(arrays['depth'])
+        self.num_feature = int(arrays['num_feature'])
+        self.objective = str(arrays['objective'])
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.default_left = arrays['default_left']
+        self.leaf_value = arrays['leaf_value']
+        self.base_margin = np.asarray(arrays['base_margin'], dtype=np.float64)
+        tree_class = np.asarray(arrays['tree_class'])
+        self.num_trees = len(tree_class)
+        # Offsets of each tree's inner nodes and leaves in the flat arrays
+        self._inner_offset = np.arange(self.num_trees, dtype=np.int32) * (2 ** self.depth - 1)
+        self._leaf_offset = np.arange(self.num_trees, dtype=np.int32) * 2 ** self.depth - (2 ** self.depth - 1)
+        # Sums the leaves of each class's trees with one matrix product
+        self.class_matrix = np.zeros((self.num_trees, len(self.base_margin)))
+        self.class_matrix[np.arange(self.num_trees), tree_class] = 1
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls({name: data[name] for name in data.files})
+
+    def __len__(self):
+        return self.num_trees
+
+    def predict_margin(self, X):
+        # Raw scores, one column per class. Rows are compared in float32, like xgboost does.
+        X = np.ascontiguousarray(X, dtype=np.float32).reshape(-1, self.num_feature)
+        block_rows = max(1, BLOCK_SIZE // max(self.num_trees, 1))
+        if len(X) <= block_rows:
+            return self._score_block(X)
+        return np.concatenate([self._score_block(X[i:i + block_rows]) for i in range(0, len(X), block_rows)])
+
+    def _score_block(self, X):
+        flat = X.ravel()
+        row_offset = (np.arange(len(X), dtype=np.int32) * self.num_feature)[:, np.newaxis]
+        missing = np.isnan(flat).any()
+        slots = np.zeros((len(X), self.num_trees), dtype=np.int32)
+        for _ in range(self.depth):
+            nodes = slots + self._inner_offset
+            values = flat[row_offset + self.feature[nodes]]
+            go_right = values >= self.threshold[nodes]
+            if missing:
+                go_right = np.where(np.isnan(values), ~self.default_left[nodes], go_right)
+            slots = 2 * slots + 1 + go_right
+        leaves = self.leaf_value[slots + self._leaf_offset]
+        return leaves.astype(np.float64) @ self.class_matrix + self.base_margin
+
+    def predict(self, X):
+        # Class labels, as XGBClassifier.predict returns them
+        margins = self.predict_margin(X)
+        if self.objective == 'binary:logistic':
+            return (margins[:, 0] > 0).astype(np.int64)
+        return margins.argmax(axis=1)
+
+    def predict_proba(self, X):
+        # Class probabilities, one column per class, as XGBClassifier.predict_proba returns them
+        margins = self.predict_margin(X)
+        if self.objective == 'binary:logistic':
+            positive = 1 / (1 + np.exp(-margins[:, 0]))
+            return np.column_stack([1 - positive, positive])
+        exp = np.exp(margins - margins.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('model', nargs='?', default='best_xgboost_model.joblib')
+    parser.add_argument('output', nargs='?')
+    args = parser.parse_args()
+
+    import joblib
+    output = args.output or args.model.rsplit('.', 1)[0] + EXPORT_SUFFIX
+    arrays = export_model(joblib.load(args.model), output)
+    print(f"Exported {len(arrays['tree_class'])} trees of depth {arrays['depth']} to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+from prometheus_client import Counter
+
+# Prometheus metrics for the verdict cache
+VERDICT_CACHE_HITS = Counter('verdict_cache_hits_total', 'Verdicts served from the cache')
+VERDICT_CACHE_MISSES = Counter('verdict_cache_misses_total', 'Lookups that had to run the model')
+VERDICT_CACHE_EVICTIONS = Counter('verdict_cache_evictions_total', 'Entries removed from the cache', ['reason'])
+
+
+def normalize_hostname(url):
+    # Lower-cased hostname without port, credentials or trailing dot; accepts bare names too
+    try:
+        hostname = urlparse(url if '//' in url else '//' + url).hostname
+    except (AttributeError, TypeError, ValueError):
+        return None
+    # Whitespace or control characters are no part of any hostname; such a "host" could carry
+    # several names into a hosts-file line
+    if not hostname or not hostname.isprintable() or ' ' in hostname:
+        return None
+    return hostname.rstrip('.') or None
+
+
+class VerdictCache:
+    # Bounded LRU map of cache key -> malicious flag, with separate TTLs for benign and
+    # malicious verdicts. Thread-safe, since Flask serves requests from several threads.
+
+    def __init__(self, max_size=100000, benign_ttl=3600, malicious_ttl=86400):
+        self.max_size = max_size
+        self.benign_ttl = benign_ttl
+        self.malicious_ttl = malicious_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        # Returns the cached verdict, or None on a miss
+        if key is None or self.max_size <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                malicious, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    VERDICT_CACHE_HITS.inc()
+                    return malicious
+                del self._entries[key]
+                VERDICT_CACHE_EVICTIONS.labels(reason='expired').inc()
+        VERDICT_CACHE_MISSES.inc()
+        return None
+
+    def put(self, key, malicious):
+        if key is None or self.max_size <= 0:
+            return
+        ttl = self.malicious_ttl if malicious else self.benign_ttl
+        with self._lock:
+            self._entries[key] = (malicious, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                VERDICT_CACHE_EVICTIONS.labels(reason='capacity').inc()
+
+    def invalidate(self, key=None):
+        # Drops one key, or every entry when no key is given; returns how many were removed
+        with self._lock:
+            if key is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                removed = 1 if self._entries.pop(key, None) is not None else 0
+        if removed:
+            VERDICT_CACHE_EVICTIONS.labels(reason='invalidated').inc(removed)
+        return removed